@@ -0,0 +1,286 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core import Network, Blockchain, Node, Block, Transaction, UTXO, UTXOSet, Simulator, LinkModel
+from src.core.primitives import TxOut
+from src.wallet import Wallet
+from src.utils.crypto import expected_hashes
+from src.utils.metrics import Histogram, Metrics
+
+DEFAULT_SEED = 1
+REGRESSION_THRESHOLD = 0.25 # Relative slowdown before a result is flagged
+
+QUICK_SIZES = {
+    "block_validation": [10, 100],
+    "utxo_growth": [10000],
+    "reorg": [1, 10],
+    "propagation": [10, 100],
+    "throughput": [100]
+}
+FULL_SIZES = {
+    "block_validation": [10, 100, 1000],
+    "utxo_growth": [10000, 100000],
+    "reorg": [1, 10, 100],
+    "propagation": [10, 100, 1000, 10000],
+    "throughput": [100, 500]
+}
+
+def make_result(name, params, timings, operations=1, unit="s", throughput=None):
+    """latency summarises timings, throughput is operations per second unless given"""
+    summary = timings.summary()
+    if throughput is None and timings.total:
+        throughput = operations * timings.count / timings.total
+    return {
+        "name": name,
+        "params": params,
+        "unit": unit,
+        "iterations": timings.count,
+        "latency": {statistic: summary[statistic] for statistic in ("mean", "min", "p50", "p90", "p99", "max")},
+        "throughput": throughput
+    }
+
+def result_key(result):
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+def seeded_wallet(rng):
+    wallet = Wallet()
+    key_length = wallet.private_key.curve.baselen
+    wallet.load_private_key(rng.getrandbits(8 * key_length - 1).to_bytes(key_length, "big"))
+    return wallet
+
+def signed_transaction(sender, recipient_address, utxo):
+    amount = utxo.amount - Transaction.fee
+    tx = Transaction(sender.address, recipient_address, amount, [utxo], [TxOut(recipient_address, amount)])
+    tx.signature = sender.sign(tx._serialize_for_signing())
+    return tx
+
+def next_block(blockchain, transactions, recipient_address, prev_block=None, timestamp=0):
+    """Block with a virtual proof of work, so no time is spent mining, the blockchain must accept_virtual_proof"""
+    prev_block = prev_block or blockchain.get_best_block()
+    height = prev_block.height + 1
+    reward = blockchain.block_subsidy + Transaction.fee * len(transactions)
+    coinbase = Transaction.coinbase(recipient_address, reward, height)
+    block = Block([coinbase] + transactions, prev_block.hash, blockchain.difficulty, height, timestamp)
+    block.virtual_proof = True
+    return block
+
+def build_branch(blockchain, prev_block, length, recipient_address):
+    branch = []
+    for i in range(length):
+        prev_block = next_block(blockchain, [], recipient_address, prev_block, timestamp=i)
+        branch.append(prev_block)
+    return branch
+
+def bench_block_validation(rng, transaction_count, repeat):
+    """Validate and connect one block of transaction_count signed transactions, signatures uncached"""
+    node = Node(Blockchain())
+    blockchain = node.blockchain
+    blockchain.accept_virtual_proof = True
+    sender, recipient = seeded_wallet(rng), seeded_wallet(rng)
+    utxos = [UTXO("%064x" % rng.getrandbits(256), 0, 10, sender.address) for _ in range(transaction_count)]
+    blockchain.utxo_set.extend(utxos)
+    transactions = [signed_transaction(sender, recipient.address, utxo) for utxo in utxos]
+    for tx in transactions:
+        blockchain.add_transaction(tx)
+    block = next_block(blockchain, transactions, recipient.address)
+
+    timings = Histogram(None)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connected = node._is_block_valid(block) and blockchain.append_block(block)
+        timings.observe(time.perf_counter() - start)
+        if not connected:
+            raise RuntimeError("Benchmark block was rejected")
+        blockchain.disconnect_block()
+    return [make_result("block_validation", {"transactions": transaction_count}, timings, transaction_count)]
+
+def bench_utxo_growth(rng, utxo_count, repeat):
+    """Grow a utxo set, query every owner's balance and utxos, then spend everything"""
+    owners = [rng.getrandbits(384).to_bytes(48, "big") for _ in range(max(1, utxo_count // 100))]
+    utxos = [UTXO("%064x" % rng.getrandbits(256), 0, rng.randrange(1, 100), owners[i % len(owners)])
+             for i in range(utxo_count)]
+
+    phases = {"add": Histogram(None), "lookup": Histogram(None), "spend": Histogram(None)}
+    for _ in range(repeat):
+        utxo_set = UTXOSet()
+        start = time.perf_counter()
+        for utxo in utxos:
+            utxo_set.add(utxo)
+        phases["add"].observe(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for owner in owners:
+            utxo_set.balance(owner)
+            utxo_set.utxos_for(owner)
+        phases["lookup"].observe(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for utxo in utxos:
+            utxo_set.spend(UTXOSet.outpoint(utxo))
+        phases["spend"].observe(time.perf_counter() - start)
+
+    operations = {"add": utxo_count, "lookup": len(owners), "spend": utxo_count}
+    return [make_result(f"utxo_{phase}", {"utxos": utxo_count}, timings, operations[phase])
+            for phase, timings in phases.items()]
+
+def bench_reorg(rng, depth, repeat):
+    """Switch a node from a chain of depth blocks to a competing chain one block longer"""
+    timings = Histogram(None)
+    for _ in range(repeat):
+        node = Node(Blockchain())
+        blockchain = node.blockchain
+        blockchain.accept_virtual_proof = True
+        genesis = blockchain.get_best_block()
+        active = build_branch(blockchain, genesis, depth, seeded_wallet(rng).address)
+        competing = build_branch(blockchain, genesis, depth + 1, seeded_wallet(rng).address)
+
+        # The competing branch has equal work until its last block, which triggers the reorg
+        for block in active + competing[:-1]:
+            node.receive_block(block)
+        start = time.perf_counter()
+        switched = node.receive_block(competing[-1])
+        timings.observe(time.perf_counter() - start)
+        if not switched:
+            raise RuntimeError("Benchmark reorg did not happen")
+    return [make_result("reorg", {"depth": depth}, timings, depth)]
+
+def bench_propagation(rng, node_count, repeat, relay_mode="push"):
+    """Virtual seconds until a block reaches every node, throughput is simulated events per wall second"""
+    random.seed(rng.getrandbits(32)) # Network draws its topology from the global generator
+    simulator = Simulator(LinkModel(latency=0.05, jitter=0.02, bandwidth=1e6), seed=rng.getrandbits(32))
+    network = Network(node_count, 0, 0, min_node_peers=8, simulator=simulator, relay_mode=relay_mode)
+    network.enable_virtual_proof()
+    metrics = network.enable_metrics(Metrics(max_samples=None))
+    miner = seeded_wallet(rng)
+
+    wall_time = 0.0
+    events = 0
+    for _ in range(repeat):
+        origin = network.nodes[rng.randrange(node_count)]
+        block = next_block(origin.blockchain, [], miner.address, timestamp=simulator.now)
+        start = time.perf_counter()
+        origin.receive_block(block)
+        events += network.run()
+        wall_time += time.perf_counter() - start
+
+    delays = metrics.histograms["block_propagation_seconds"]
+    return [make_result("propagation", {"nodes": node_count, "relay": relay_mode}, delays,
+                        unit="virtual s", throughput=events / wall_time if wall_time else None)]
+
+def bench_throughput(rng, transaction_count, repeat, node_count=50, miners=5, block_interval=10.0):
+    """Virtual seconds from submission to inclusion in the best chain, throughput is confirmed tx per virtual second"""
+    random.seed(rng.getrandbits(32))
+    simulator = Simulator(LinkModel(latency=0.05, jitter=0.02, bandwidth=1e6), seed=rng.getrandbits(32))
+    network = Network(node_count, 0, miners, min_node_peers=8, min_miner_peers=2, simulator=simulator)
+    sender, recipient = seeded_wallet(rng), seeded_wallet(rng)
+    utxos = [UTXO("%064x" % rng.getrandbits(256), 0, 10, sender.address) for _ in range(transaction_count * repeat)]
+    network.add_genesis_utxos(utxos)
+
+    # Transactions arrive at a steady rate of ten per block interval
+    submitted = {}
+    interval = block_interval / 10
+    for i, utxo in enumerate(utxos):
+        tx = signed_transaction(sender, recipient.address, utxo)
+        submitted[tx.txid] = i * interval
+        node = network.nodes[rng.randrange(node_count)]
+        simulator.schedule_at(i * interval, node.receive_transaction, tx)
+
+    difficulty = network.nodes[0].blockchain.difficulty
+    network.start_virtual_mining(expected_hashes(difficulty) / block_interval / miners)
+    network.run(until=len(utxos) * interval + 20 * block_interval)
+    for miner in network.miners:
+        miner.stop_mining()
+
+    latencies = Histogram(None)
+    for block in network.get_best_chain():
+        for tx in block.transactions[1:]:
+            latencies.observe(block.timestamp - submitted[tx.txid])
+    duration = max(latencies.max or 0.0, 1e-9) + len(utxos) * interval
+    return [make_result("throughput", {"transactions": transaction_count, "nodes": node_count}, latencies,
+                        unit="virtual s", throughput=latencies.count / duration)]
+
+SCENARIOS = {
+    "block_validation": bench_block_validation,
+    "utxo_growth": bench_utxo_growth,
+    "reorg": bench_reorg,
+    "propagation": bench_propagation,
+    "throughput": bench_throughput
+}
+
+def run_benchmarks(scenarios=None, sizes=QUICK_SIZES, repeat=5, seed=DEFAULT_SEED):
+    results = []
+    for name in scenarios or SCENARIOS:
+        for size in sizes[name]:
+            # Every scenario and size gets its own generator, so subsets reproduce the same numbers
+            rng = random.Random(f"{seed}:{name}:{size}")
+            results.extend(SCENARIOS[name](rng, size, repeat))
+    return results
+
+def compare_to_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Results whose p50 latency grew or throughput fell by more than threshold"""
+    baseline = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get(result_key(result))
+        if base is None:
+            continue
+        reasons = []
+        p50, base_p50 = result["latency"]["p50"], base["latency"]["p50"]
+        if p50 is not None and base_p50 and p50 > base_p50 * (1 + threshold):
+            reasons.append(f"p50 {base_p50:.6g} -> {p50:.6g} {result['unit']}")
+        throughput, base_throughput = result["throughput"], base["throughput"]
+        if throughput is not None and base_throughput and throughput < base_throughput * (1 - threshold):
+            reasons.append(f"throughput {base_throughput:.6g} -> {throughput:.6g}/s")
+        if reasons:
+            regressions.append((result_key(result), reasons))
+    return regressions
+
+def print_results(results):
+    print(f"{'benchmark':<48} {'p50':>12} {'p90':>12} {'p99':>12} {'throughput/s':>14}")
+    for result in results:
+        latency = result["latency"]
+        cells = [f"{latency[p]:.6g}" if latency[p] is not None else "-" for p in ("p50", "p90", "p99")]
+        throughput = f"{result['throughput']:.6g}" if result["throughput"] is not None else "-"
+        label = result["name"] + " " + " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{label:<48} {cells[0]:>12} {cells[1]:>12} {cells[2]:>12} {throughput:>14}  ({result['unit']})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seeded performance benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run, all by default: {', '.join(SCENARIOS)}")
+    parser.add_argument("--full", action="store_true", help="Run the large sizes, up to 10k nodes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--save", help="Write results as a JSON baseline")
+    parser.add_argument("--baseline", help="Compare against a saved JSON baseline, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.scenarios, FULL_SIZES if args.full else QUICK_SIZES, args.repeat, args.seed)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"seed": args.seed, "repeat": args.repeat, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for key, reasons in regressions:
+            print(f"REGRESSION {key}: {', '.join(reasons)}")
+        if regressions:
+            return 1
+        print("No regressions against", args.baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,39 @@
 from .block import Block
 from .blockchain import Blockchain
+from .block_index import BlockIndex
+from .block_store import BlockStore
 from .transaction import Transaction
+from .primitives import OutPoint, TxOut, UTXO
+from .utxo_set import UTXOSet
+from .mempool import Mempool
+from .signature_cache import SignatureCache
+from .validation import BlockValidator
 from .node import Node
 from .network import Network
+from .simulation import Simulator, LinkModel
+from .relay import CompactBlock
+from .runtime import AsyncRuntime
+from .topology import Topology
+from .workload import Workload
 
 
 __all__ = ['Block', 
            'Blockchain', 
+           'BlockIndex',
+           'BlockStore',
            'Transaction', 
-           'Node'
-           'Network']
\ No newline at end of file
+           'OutPoint',
+           'TxOut',
+           'UTXO',
+           'UTXOSet',
+           'Mempool',
+           'SignatureCache',
+           'BlockValidator',
+           'Node',
+           'Network',
+           'Simulator',
+           'LinkModel',
+           'CompactBlock',
+           'AsyncRuntime',
+           'Topology',
+           'Workload']
\ No newline at end of file
@@ -1,23 +1,222 @@
 import time
+import struct
+import hashlib
+
+from src.core.transaction import Transaction
+from src.utils.crypto import compute_merkle_root, compute_merkle_proof
+
+# prev_hash, merkle_root, timestamp, height, difficulty, nonce
+HEADER_FORMAT = ">32s32sdQIQ"
+HEADER = struct.Struct(HEADER_FORMAT)
+HEADER_SIZE = HEADER.size
+
+class TransactionList(list):
+    """A block's transactions, changing them in place resets the block's cached merkle root, size and hash"""
+    __slots__ = ('_block',)
+
+    def __init__(self, transactions, block):
+        super().__init__(transactions)
+        self._block = block
+
+def _invalidating(name):
+    method = getattr(list, name)
+    def mutate(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._block._transactions_changed()
+        return result
+    mutate.__name__ = name
+    return mutate
+
+for _name in ("append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse",
+              "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(TransactionList, _name, _invalidating(_name))
+
 
 class Block():
 
-    def __init__(self, transactions, prev_hash, difficulty, height=0):
-        self.transactions = transactions
-        self.prev_hash = prev_hash
-        self.difficulty = difficulty
-        self.height = height
-        self.timestamp = time.time()
-        self.nonce = 0
+    def __init__(self, transactions, prev_hash, difficulty, height=0, timestamp=None):
+        self._header = None
+        self._hash = None
+        self._digest = None
+        self._merkle_root = None
+        self._size = None
+        self._load_transactions = None
+        self._transactions = None if transactions is None else TransactionList(transactions, self)
+        self._prev_hash = prev_hash
+        self._difficulty = difficulty
+        self._height = height
+        self._timestamp = time.time() if timestamp is None else timestamp
+        self._nonce = 0
+        self.virtual_proof = False # Work sampled by a virtual miner, see Miner.start_virtual_mining
+
+    def _invalidate_header(self):
+        self._header = None
+        self._hash = None
+        self._digest = None
+
+    @classmethod
+    def from_header(cls, header, load_transactions=None, block_hash=None, virtual_proof=False):
+        """Block whose transactions are only read through load_transactions when first needed"""
+        prev_hash, merkle_root, timestamp, height, difficulty, nonce = HEADER.unpack(header)
+        block = cls(None, prev_hash.hex(), difficulty, height, timestamp)
+        block._nonce = nonce
+        block._merkle_root = merkle_root.hex()
+        block._header = bytes(header)
+        block._hash = block_hash
+        block._load_transactions = load_transactions
+        block.virtual_proof = virtual_proof
+        return block
+
+    @property
+    def is_loaded(self):
+        return self._transactions is not None
+
+    @property
+    def transactions(self):
+        if self._transactions is None and self._load_transactions is not None:
+            self._transactions = TransactionList(self._load_transactions(self), self)
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, transactions):
+        self._transactions = TransactionList(transactions, self)
+        self._transactions_changed()
+
+    def _transactions_changed(self):
+        self._merkle_root = None
+        self._size = None
+        self._invalidate_header()
+
+    @property
+    def prev_hash(self):
+        return self._prev_hash
+
+    @prev_hash.setter
+    def prev_hash(self, prev_hash):
+        self._prev_hash = prev_hash
+        self._invalidate_header()
+
+    @property
+    def difficulty(self):
+        return self._difficulty
+
+    @difficulty.setter
+    def difficulty(self, difficulty):
+        self._difficulty = difficulty
+        self._invalidate_header()
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, height):
+        self._height = height
+        self._invalidate_header()
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamp):
+        self._timestamp = timestamp
+        self._invalidate_header()
+
+    @property
+    def nonce(self):
+        return self._nonce
+
+    @nonce.setter
+    def nonce(self, nonce):
+        # The header prefix stays valid, only the hash changes
+        self._nonce = nonce
+        self._hash = None
+        self._digest = None
+        if self._header is not None:
+            self._header = self._header[:-8] + struct.pack(">Q", nonce)
+
+    @property
+    def merkle_root(self):
+        if self._merkle_root is None:
+            self._merkle_root = compute_merkle_root([tx.txid for tx in self.transactions])
+        return self._merkle_root
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._header = struct.pack(
+                HEADER_FORMAT,
+                bytes.fromhex(self._prev_hash),
+                bytes.fromhex(self.merkle_root),
+                self._timestamp,
+                self._height,
+                self._difficulty,
+                self._nonce
+            )
+        return self._header
+
+    @property
+    def digest(self):
+        """Raw sha256 of the header, what proof of work is checked against"""
+        if self._digest is None:
+            if self._hash is not None:
+                self._digest = bytes.fromhex(self._hash)
+            else:
+                self._digest = hashlib.sha256(self.header).digest()
+        return self._digest
 
     @property
     def hash(self):
-        hash = self.compute_hash()
-        return hash
+        if self._hash is None:
+            self._hash = self.digest.hex()
+        return self._hash
 
     def compute_hash(self):
-        # Add timestamp and height, maybe merkle root later
-        data = self.prev_hash + str(self.transactions) + str(self.nonce) + str(self.difficulty)
-        import hashlib
-        hash = hashlib.sha256(data.encode()).hexdigest()
-        return hash
\ No newline at end of file
+        self._hash = None
+        self._digest = None
+        return self.hash
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = HEADER_SIZE + sum(tx.size for tx in self.transactions)
+        return self._size
+
+    def has_valid_merkle_root(self):
+        """Check that the header commits to the current transactions"""
+        return self.merkle_root == compute_merkle_root([tx.txid for tx in self.transactions])
+
+    def get_merkle_proof(self, txid):
+        txids = [tx.txid for tx in self.transactions]
+        if txid not in txids:
+            return None
+        return compute_merkle_proof(txids, txids.index(txid))
+
+    def to_bytes(self):
+        """Header, proof flag and length-prefixed transactions"""
+        parts = [self.header, struct.pack(">?I", self.virtual_proof, len(self.transactions))]
+        for tx in self.transactions:
+            tx_bytes = tx.to_bytes()
+            parts.append(struct.pack(">I", len(tx_bytes)))
+            parts.append(tx_bytes)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        block = cls.from_header(data[:HEADER_SIZE])
+        block.virtual_proof, = struct.unpack_from(">?", data, HEADER_SIZE)
+        block._transactions = cls.transactions_from_bytes(data)
+        return block
+
+    @staticmethod
+    def transactions_from_bytes(data):
+        _, tx_count = struct.unpack_from(">?I", data, HEADER_SIZE)
+        offset = HEADER_SIZE + 5
+        transactions = []
+        for _ in range(tx_count):
+            length, = struct.unpack_from(">I", data, offset)
+            offset += 4
+            transactions.append(Transaction.from_bytes(data[offset:offset + length]))
+            offset += length
+        return transactions
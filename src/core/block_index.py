@@ -0,0 +1,110 @@
+from src.utils.crypto import get_block_work
+
+class BlockEntry():
+    __slots__ = ('block', 'hash', 'parent', 'height', 'chain_work')
+
+    def __init__(self, block, parent):
+        self.block = block
+        self.hash = block.hash
+        self.parent = parent
+        self.height = parent.height + 1 if parent else 0
+        parent_work = parent.chain_work if parent else 0
+        self.chain_work = parent_work + get_block_work(block.difficulty)
+
+
+class BlockIndex():
+    """A node's view of the block tree with parent pointers and cumulative work.
+
+    Entries themselves live in the shared BlockStore, the index only records
+    which of them this node knows about and which it found invalid.
+    """
+
+    def __init__(self, genesis, block_store):
+        self.block_store = block_store
+        genesis_entry = block_store.get_entry(genesis, None)
+        self.genesis = genesis_entry
+        self.entries = {genesis_entry.hash: genesis_entry}
+        self.tips = {genesis_entry.hash}
+        self.invalid = set()
+
+    def get(self, block_hash):
+        return self.entries.get(block_hash)
+
+    def __contains__(self, block_hash):
+        return block_hash in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, block):
+        """Index a block whose parent is known, returns its entry or None"""
+        entry = self.entries.get(block.hash)
+        if entry:
+            return entry
+
+        parent = self.entries.get(block.prev_hash)
+        if not parent:
+            return None
+
+        entry = self.block_store.get_entry(block, parent)
+        self.entries[entry.hash] = entry
+        self.tips.discard(parent.hash)
+        self.tips.add(entry.hash)
+        return entry
+
+    def extend(self, blocks):
+        """Index many blocks, parents first, same as add for each but without the per call overhead"""
+        entries = self.entries
+        store_entries = self.block_store.entries
+        add_block = self.block_store.add_block
+        tips = self.tips
+        for block in blocks:
+            block_hash = block.hash
+            if block_hash in entries:
+                continue
+            parent = entries.get(block.prev_hash)
+            if parent is None:
+                continue
+            entry = store_entries.get(block_hash)
+            if entry is None:
+                entry = store_entries[block_hash] = BlockEntry(add_block(block), parent)
+            entries[block_hash] = entry
+            tips.discard(parent.hash)
+            tips.add(block_hash)
+
+    def invalidate(self, entry):
+        self.invalid.add(entry.hash)
+
+    def best_tip(self):
+        candidates = (self.entries[tip] for tip in self.tips)
+        return max((entry for entry in candidates if not self.has_invalid_ancestor(entry, self.genesis)),
+                   key=lambda entry: entry.chain_work, default=self.genesis)
+
+    def has_invalid_ancestor(self, entry, ancestor):
+        """Check the branch from entry back to (not including) ancestor"""
+        while entry is not ancestor:
+            if entry.hash in self.invalid:
+                return True
+            entry = entry.parent
+        return False
+
+    def find_fork(self, entry_a, entry_b):
+        """Last common ancestor of two entries, walks back only to the fork point"""
+        while entry_a.height > entry_b.height:
+            entry_a = entry_a.parent
+        while entry_b.height > entry_a.height:
+            entry_b = entry_b.parent
+        while entry_a is not entry_b:
+            entry_a = entry_a.parent
+            entry_b = entry_b.parent
+        return entry_a
+
+    def get_branch(self, ancestor, tip):
+        """Blocks after ancestor up to and including tip, oldest first"""
+        branch = []
+        entry = tip
+        while entry is not ancestor:
+            branch.append(entry.block)
+            entry = entry.parent
+        branch.reverse()
+        return branch
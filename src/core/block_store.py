@@ -0,0 +1,72 @@
+from src.core.block_index import BlockEntry
+from src.core.primitives import UTXO
+
+class BlockDelta():
+    """UTXOs a block spends and creates, identical for every node connecting it"""
+    __slots__ = ('spent_utxos', 'created_utxos')
+
+    def __init__(self, block):
+        self.spent_utxos = [input for tx in block.transactions[1:] for input in tx.inputs]
+        self.created_utxos = []
+        for tx in block.transactions:
+            for index, output in enumerate(tx.outputs):
+                self.created_utxos.append(UTXO(tx.txid, index, output.amount, output.owner_address))
+
+
+class BlockStore():
+    """Content-addressed blocks, transactions, block entries and UTXO deltas.
+
+    A Network hands one store to every node so immutable data is held once,
+    while each node only keeps references to it.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+        self.transactions = {}
+        self.entries = {}
+        self.deltas = {}
+
+    def add_transaction(self, transaction):
+        return self.transactions.setdefault(transaction.txid, transaction)
+
+    def get_transaction(self, txid):
+        return self.transactions.get(txid)
+
+    def add_block(self, block):
+        """Returns the stored copy of the block, storing it if it is new"""
+        stored = self.blocks.get(block.hash)
+        if stored is not None:
+            return stored
+
+        # Lazily loaded blocks keep their transactions on disk until needed
+        if block.is_loaded:
+            transactions = [self.add_transaction(tx) for tx in block.transactions]
+            if any(shared is not tx for shared, tx in zip(transactions, block.transactions)):
+                block.transactions = transactions
+        self.blocks[block.hash] = block
+        return block
+
+    def get_block(self, block_hash):
+        return self.blocks.get(block_hash)
+
+    def get_entry(self, block, parent):
+        entry = self.entries.get(block.hash)
+        if entry is None:
+            entry = BlockEntry(self.add_block(block), parent)
+            self.entries[entry.hash] = entry
+        return entry
+
+    def get_delta(self, block):
+        delta = self.deltas.get(block.hash)
+        if delta is None:
+            delta = BlockDelta(block)
+            self.deltas[block.hash] = delta
+        return delta
+
+    def get_stats(self):
+        return {
+            "blocks": len(self.blocks),
+            "transactions": len(self.transactions),
+            "entries": len(self.entries),
+            "deltas": len(self.deltas)
+        }
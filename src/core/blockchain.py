@@ -1,20 +1,91 @@
+import time
+
 from src.core.transaction import Transaction
 from src.core.block import Block
+from src.core.utxo_set import UTXOSet
+from src.core.block_index import BlockIndex
+from src.core.mempool import Mempool
+from src.core.block_store import BlockStore
+from src.core.storage import BlockFileStore
+from src.core.validation import BlockValidator, has_valid_amounts
+
+SNAPSHOT_INTERVAL = 1000 # Blocks between utxo snapshots when persisting
+UNDO_DEPTH = 100 # Blocks below the tip that keep their undo record
+
+class BlockUndo():
+    """What connecting a block changed, so it can be disconnected again"""
+
+    def __init__(self, delta):
+        self.delta = delta # Shared spent and created utxos
+        self.removed_mempool = []
+
 
 class Blockchain():
 
-    def __init__(self):
+    def __init__(self, block_store=None, signature_cache=None, storage=None, snapshot_interval=SNAPSHOT_INTERVAL, validator=None):
         self.chain = []
-        self.utxo_set = []
-        self.mempool = []
+        self.utxo_set = UTXOSet()
+        self.mempool = Mempool()
+        self.undo_records = {} # Deeper blocks are disconnected from their shared delta alone
+        self.undo_depth = UNDO_DEPTH
+        self.block_store = block_store or BlockStore()
+        self.signature_cache = signature_cache
+        self.validator = validator or BlockValidator()
+        self.storage = storage
+        self.snapshot_interval = snapshot_interval
+        self.metrics = None # Metrics while collection is enabled, see Network.enable_metrics
+        self.listeners = [] # Told of every block_connected and block_disconnected, e.g. wallet coin sets
+        self.accept_virtual_proof = False # Only simulations with virtual miners, see Network.start_virtual_mining
         self.difficulty = 5
         self.block_subsidy = 2
         self._create_genesis_block()
 
     def _create_genesis_block(self):
-        genesis = Block(transactions=[], prev_hash="0" * 64, difficulty=self.difficulty, height=0)
+        # Fixed timestamp so every node derives the same genesis hash
+        genesis = Block(transactions=[], prev_hash="0" * 64, difficulty=self.difficulty, height=0, timestamp=0)
         genesis.compute_hash()
-        self.chain.append(genesis)
+        self.block_index = BlockIndex(genesis, self.block_store)
+        self.chain.append(self.block_index.genesis.block)
+
+    @classmethod
+    def open(cls, path, block_store=None, signature_cache=None, snapshot_interval=SNAPSHOT_INTERVAL, validator=None):
+        """Reopen a chain persisted at path, or start a new one there"""
+        storage = BlockFileStore(path)
+        blockchain = cls(block_store, signature_cache, storage, snapshot_interval, validator)
+        blockchain.restore(storage.load_headers(), storage.load_utxo_snapshot())
+        return blockchain
+
+    def restore(self, blocks, snapshot=None, tip_hash=None):
+        """Rebuild chain and utxo set from stored blocks (parents first) and a utxo snapshot"""
+        self.block_index.extend(blocks)
+
+        genesis = self.block_index.genesis
+        tip = self.block_index.get(tip_hash) if tip_hash else None
+        tip = tip or self.block_index.best_tip()
+        self.chain = [genesis.block] + self.block_index.get_branch(genesis, tip)
+        self.undo_records = {}
+
+        if snapshot:
+            snapshot_hash, snapshot_utxo_set = snapshot
+            snapshot_entry = self.block_index.get(snapshot_hash)
+            if snapshot_entry:
+                self.rebase_utxo_set(snapshot_utxo_set, snapshot_entry)
+                return
+
+        self.utxo_set = UTXOSet()
+        for block in self.chain[1:]:
+            self._apply_delta(self.block_store.get_delta(block))
+
+    def checkpoint(self):
+        """Write a utxo snapshot of the current tip"""
+        if self.storage is not None:
+            self.storage.write_utxo_snapshot(self.utxo_set, self.last_block_hash)
+
+    def close(self):
+        if self.storage is not None:
+            self.checkpoint()
+            self.storage.close()
+            self.storage = None
 
     def get_best_block(self):
         if not self.chain:
@@ -23,7 +94,36 @@ class Blockchain():
         return best
 
     def add_transaction(self, transaction: Transaction):
-        self.mempool.append(transaction)
+        if not has_valid_amounts(transaction):
+            # Creates value or pays less than the fee
+            return False
+        for input in transaction.inputs:
+            if input not in self.utxo_set and not self.mempool.creates(input):
+                # Spends an output that is neither unspent nor created by a mempool transaction
+                return False
+        return self.mempool.add(transaction)
+
+    def add_block_transactions(self, block):
+        """Admit a block's transactions to the mempool right before connecting it on the tip.
+
+        Blocks may only include mempool transactions, but those of a block
+        whose parent was not connected yet could not be admitted when they
+        were relayed. Mempool transactions they conflict with are displaced.
+        """
+        for transaction in block.transactions[1:]:
+            if transaction in self.mempool:
+                continue
+            for conflict in self.mempool.get_conflicts(transaction):
+                self.mempool.discard_with_descendants(conflict.txid)
+            self.add_transaction(transaction)
+
+    @property
+    def tip_entry(self):
+        return self.block_index.get(self.last_block_hash)
+
+    @property
+    def chain_work(self):
+        return self.tip_entry.chain_work
 
     @property
     def last_block_hash(self):
@@ -32,37 +132,96 @@ class Blockchain():
         return self.chain[-1].hash
     
     def append_block(self, block):
-        regular_tx_list = block.transactions[1:]
-        for tx in regular_tx_list:
-            if tx not in self.mempool:
-                # Invalid transaction
-                return False
+        if self.metrics is None:
+            return self._append_block(block)
+        start = time.perf_counter()
+        appended = self._append_block(block)
+        self.metrics.observe("append_block_seconds", time.perf_counter() - start)
+        self.metrics.increment("blocks_connected" if appended else "blocks_rejected")
+        return appended
 
-            if not tx.verify():
-                # Invalid signature
-                return False
+    def _append_block(self, block):
+        regular_tx_list = block.transactions[1:]
+        if not self.validator.check_transactions(regular_tx_list, self.utxo_set, self.mempool, self.signature_cache):
+            # Invalid transaction, signature or utxo, or a double spend within the block
+            return False
 
-            for input in tx.inputs:
-                if input not in self.utxo_set or input['owner_address'] != tx.sender_address:
-                    # Invalid utxo
-                    return False
+        self.connect_block(block)
+        return True
 
+    def connect_block(self, block):
+        """Apply an already validated block on top of the tip"""
+        entry = self.block_index.add(block)
+        if entry:
+            block = entry.block
         self.chain.append(block)
 
-        for tx in list(block.transactions):
-            if tx != block.transactions[0]:
-                for input in tx.inputs:
-                    self.utxo_set.remove(input)
-            
-            for index, output in enumerate(tx.outputs):
-                new_utxo = {
-                    "txid": tx.txid,
-                    "index": index,
-                    "amount": output['amount'],
-                    "owner_address": output['owner_address']
-                }
-                self.utxo_set.append(new_utxo)
-            
-            if tx in self.mempool:
-                self.mempool.remove(tx)
-        return True
\ No newline at end of file
+        undo = BlockUndo(self.block_store.get_delta(block))
+        self._apply_delta(undo.delta)
+        for tx in block.transactions:
+            undo.removed_mempool.extend(self.mempool.remove_for_block(tx))
+        # Anything else the block left unspendable could never be mined
+        undo.removed_mempool.extend(self.mempool.remove_unspendable(self.utxo_set))
+
+        self.undo_records[block.hash] = undo
+        if len(self.chain) > self.undo_depth + 1:
+            self.undo_records.pop(self.chain[-self.undo_depth - 2].hash, None)
+        for listener in self.listeners:
+            listener.block_connected(block)
+
+        if self.storage is not None:
+            self.storage.append(block)
+            if len(self.chain) % self.snapshot_interval == 0:
+                self.checkpoint()
+
+    def disconnect_block(self):
+        """Undo the tip block, returning its transactions to the mempool"""
+        block = self.chain.pop()
+        undo = self.undo_records.pop(block.hash, None)
+        if undo is None:
+            # Restored from storage or deeper than undo_depth, its mempool changes are not restored
+            undo = BlockUndo(self.block_store.get_delta(block))
+        self._revert_delta(undo.delta)
+
+        for tx in block.transactions[1:]:
+            self.mempool.add(tx)
+        for tx in undo.removed_mempool:
+            self.mempool.add(tx)
+        for listener in self.listeners:
+            listener.block_disconnected(block)
+        return block
+
+    def _apply_delta(self, delta, utxo_set=None):
+        if utxo_set is None:
+            utxo_set = self.utxo_set
+        for utxo in delta.spent_utxos:
+            utxo_set.spend(UTXOSet.outpoint(utxo))
+        for utxo in delta.created_utxos:
+            utxo_set.add(utxo)
+
+    def _revert_delta(self, delta, utxo_set=None):
+        if utxo_set is None:
+            utxo_set = self.utxo_set
+        for utxo in reversed(delta.created_utxos):
+            utxo_set.spend(UTXOSet.outpoint(utxo))
+        for utxo in reversed(delta.spent_utxos):
+            utxo_set.add(utxo)
+
+    def rebase_utxo_set(self, snapshot, snapshot_entry):
+        """Rebuild the utxo set as changes on top of a shared snapshot.
+
+        The snapshot must be a flattened UTXOSet taken at snapshot_entry, which
+        may be on another branch; only the blocks between it and this chain's
+        tip are replayed.
+        """
+        utxo_set = UTXOSet(base=snapshot)
+        fork_point = self.block_index.find_fork(self.tip_entry, snapshot_entry)
+
+        entry = snapshot_entry
+        while entry is not fork_point:
+            self._revert_delta(self.block_store.get_delta(entry.block), utxo_set)
+            entry = entry.parent
+        for block in self.chain[fork_point.height + 1:]:
+            self._apply_delta(self.block_store.get_delta(block), utxo_set)
+
+        self.utxo_set = utxo_set
@@ -0,0 +1,154 @@
+import heapq
+import itertools
+
+MEMPOOL_MAX_SIZE = 5000 # Transactions
+
+class Mempool():
+    """Unconfirmed transactions indexed by txid and by the outpoints they spend.
+
+    Keeps the list interface (append, remove, copy, membership) used by
+    Blockchain and Miner.
+    """
+
+    def __init__(self, max_size=MEMPOOL_MAX_SIZE):
+        self.max_size = max_size
+        self._transactions = {}
+        self._spent_outpoints = {}
+        self._feerates = {}
+        self._eviction_heap = []
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def _outpoints(transaction):
+        return [(input.txid, input.index) for input in transaction.inputs]
+
+    def get(self, txid):
+        return self._transactions.get(txid)
+
+    def creates(self, utxo):
+        """Whether utxo is an output of a transaction in the mempool"""
+        parent = self._transactions.get(utxo.txid)
+        if parent is None or utxo.index >= len(parent.outputs):
+            return False
+        output = parent.outputs[utxo.index]
+        return output.owner_address == utxo.owner_address and output.amount == utxo.amount
+
+    def get_conflicts(self, transaction):
+        """Mempool transactions spending any of the same outpoints"""
+        conflicts = {}
+        for outpoint in self._outpoints(transaction):
+            txid = self._spent_outpoints.get(outpoint)
+            if txid is not None and txid != transaction.txid:
+                conflicts[txid] = self._transactions[txid]
+        return list(conflicts.values())
+
+    def add(self, transaction):
+        if transaction.txid in self._transactions:
+            return False
+
+        if self.get_conflicts(transaction):
+            # Double spend of an outpoint already in the mempool
+            return False
+
+        feerate = transaction.feerate
+        if len(self._transactions) >= self.max_size:
+            lowest = self._lowest_feerate_txid()
+            if lowest is None or self._feerates[lowest] >= feerate:
+                return False
+            self.discard(lowest)
+
+        self._transactions[transaction.txid] = transaction
+        self._feerates[transaction.txid] = feerate
+        for outpoint in self._outpoints(transaction):
+            self._spent_outpoints[outpoint] = transaction.txid
+        heapq.heappush(self._eviction_heap, (feerate, next(self._sequence), transaction.txid))
+        return True
+
+    def discard(self, txid):
+        transaction = self._transactions.pop(txid, None)
+        if transaction is None:
+            return None
+
+        del self._feerates[txid]
+        for outpoint in self._outpoints(transaction):
+            if self._spent_outpoints.get(outpoint) == txid:
+                del self._spent_outpoints[outpoint]
+
+        if len(self._eviction_heap) > 2 * len(self._transactions) + 64:
+            self._rebuild_eviction_heap()
+        return transaction
+
+    def discard_with_descendants(self, txid):
+        """Drop a transaction and every mempool transaction spending its outputs"""
+        removed = []
+        pending = [txid]
+        while pending:
+            transaction = self.discard(pending.pop())
+            if transaction is None:
+                continue
+            removed.append(transaction)
+            for index in range(len(transaction.outputs)):
+                child_txid = self._spent_outpoints.get((transaction.txid, index))
+                if child_txid is not None:
+                    pending.append(child_txid)
+        return removed
+
+    def remove_for_block(self, transaction):
+        """Drop a confirmed transaction and anything conflicting with it, with their descendants"""
+        removed = []
+        if self.discard(transaction.txid):
+            removed.append(transaction)
+        for conflict in self.get_conflicts(transaction):
+            removed.extend(self.discard_with_descendants(conflict.txid))
+        return removed
+
+    def remove_unspendable(self, utxo_set):
+        """Drop transactions spending outputs that are neither unspent nor created in the mempool, with their descendants"""
+        removed = []
+        for transaction in list(self._transactions.values()):
+            if transaction.txid not in self._transactions:
+                # Already dropped as a descendant
+                continue
+            for input in transaction.inputs:
+                if input not in utxo_set and input.txid not in self._transactions:
+                    removed.extend(self.discard_with_descendants(transaction.txid))
+                    break
+        return removed
+
+    def _lowest_feerate_txid(self):
+        # Heap entries of removed transactions are skipped lazily
+        while self._eviction_heap:
+            feerate, _, txid = self._eviction_heap[0]
+            if self._feerates.get(txid) == feerate:
+                return txid
+            heapq.heappop(self._eviction_heap)
+        return None
+
+    def _rebuild_eviction_heap(self):
+        self._eviction_heap = [(feerate, next(self._sequence), txid) for txid, feerate in self._feerates.items()]
+        heapq.heapify(self._eviction_heap)
+
+    def get_sorted(self, limit=None):
+        """Transactions ordered by feerate, highest first"""
+        transactions = sorted(self._transactions.values(), key=lambda tx: self._feerates[tx.txid], reverse=True)
+        return transactions if limit is None else transactions[:limit]
+
+    # List compatibility
+    def append(self, transaction):
+        self.add(transaction)
+
+    def remove(self, transaction):
+        if self.discard(transaction.txid) is None:
+            raise ValueError("Transaction not in mempool")
+
+    def copy(self):
+        return self.get_sorted()
+
+    def __contains__(self, transaction):
+        return transaction.txid in self._transactions
+
+    def __iter__(self):
+        return iter(list(self._transactions.values()))
+
+    def __len__(self):
+        return len(self._transactions)
@@ -1,12 +1,37 @@
 from src.core.node import Node
+from src.core.blockchain import Blockchain
+from src.core.block_store import BlockStore
+from src.core.signature_cache import SignatureCache
+from src.core.validation import BlockValidator
+from src.core.primitives import UTXO
+from src.core.utxo_set import UTXOSet
+from src.core.relay import RELAY_PUSH
+from src.core.storage import BlockFileStore
+from src.core.runtime import AsyncRuntime
+from src.core.topology import TOPOLOGIES
 from src.wallet.wallet import Wallet
 from src.wallet.miner import Miner
+from src.utils.metrics import Metrics
 
+import os
+import json
 import random
+import asyncio
+
+NETWORK_STATE_FILE = "network.json"
+UTXO_CHECKPOINT_INTERVAL = 100 # Best chain blocks between shared utxo snapshots
 
 class Network():
     def __init__(self, node_amount=10, wallet_amount=2, miner_amount=5,
-                 min_node_peers=8, min_wallet_peers=4, min_miner_peers=4):
+                 min_node_peers=8, min_wallet_peers=4, min_miner_peers=4, simulator=None, relay_mode=RELAY_PUSH, topology="random",
+                 seen_filter=None):
+        self.relay_mode = relay_mode
+        self.seen_filter = seen_filter # Dedupe filter of every node, see Node
+        self.topology = None
+        self.topology_generator = TOPOLOGIES.get(topology, topology) # Name or generator function
+        self.block_store = BlockStore()
+        self.signature_cache = SignatureCache()
+        self.validator = BlockValidator() # Set workers to verify signatures of large blocks in parallel
         self.nodes = self._create_nodes(node_amount, "Node")
         self.wallets = self._create_nodes(wallet_amount, "Wallet")  
         self.miners = self._create_nodes(miner_amount, "Miner")
@@ -17,25 +42,152 @@ class Network():
         
         self._connect_all_nodes()
 
+        self.storage = None
+        self.genesis_utxos = [] # Also given to nodes added later
+        self.genesis_utxo_set = None # Shared base of every node's utxo set
+        self.utxo_checkpoint_interval = UTXO_CHECKPOINT_INTERVAL # None to only checkpoint by hand
+        self.utxo_checkpoints = 0
+        self._last_utxo_checkpoint_height = 0
+        self._utxo_checkpoint_event = None
+        self.accept_virtual_proof = False
+        self.metrics = None
+        self.simulator = None
+        if simulator:
+            self.attach_simulator(simulator)
+
+    @property
+    def participants(self):
+        return self.nodes + self.wallets + self.miners
+
+    def attach_simulator(self, simulator):
+        """Route all peer messages through the simulator's virtual clock"""
+        self.simulator = simulator
+        for participant in self.participants:
+            participant.simulator = simulator
+
+    @property
+    def hashrate(self):
+        return sum(miner.hashrate for miner in self.miners)
+
+    def enable_virtual_proof(self):
+        """Let every node accept blocks whose work was sampled by a virtual miner"""
+        self.accept_virtual_proof = True
+        for node in self.nodes:
+            node.blockchain.accept_virtual_proof = True
+
+    def start_virtual_mining(self, hashrates):
+        """Start every miner in virtual mode, hashrates is one value or one per miner"""
+        self.enable_virtual_proof()
+        if isinstance(hashrates, (int, float)):
+            hashrates = [hashrates] * len(self.miners)
+        for miner, hashrate in zip(self.miners, hashrates):
+            miner.start_virtual_mining(hashrate)
+
+    def get_best_chain(self):
+        best_node = max(self.nodes, key=lambda node: node.blockchain.chain_work)
+        return best_node.blockchain.chain
+
+    def get_stale_block_stats(self):
+        main_chain = {block.hash for block in self.get_best_chain()}
+        found = sum(len(miner.found_blocks) for miner in self.miners)
+        stale = sum(1 for miner in self.miners for hash in miner.found_blocks if hash not in main_chain)
+        return {
+            "blocks_found": found,
+            "stale_blocks": stale,
+            "stale_rate": stale / found if found else 0.0
+        }
+
+    def get_relay_stats(self):
+        """Bytes sent per message type and duplicate deliveries, summed over all nodes"""
+        bytes_sent = {}
+        duplicates = 0
+        for node in self.nodes:
+            for command, size in node.bytes_sent.items():
+                bytes_sent[command] = bytes_sent.get(command, 0) + size
+            duplicates += node.duplicates
+        return {
+            "bytes_sent": bytes_sent,
+            "total_bytes": sum(bytes_sent.values()),
+            "duplicates": duplicates
+        }
+
+    def get_memory_stats(self):
+        """Per node memory stats summed over the network, plus the largest node's"""
+        total = {}
+        largest = {}
+        for node in self.nodes:
+            for name, value in node.get_memory_stats().items():
+                total[name] = total.get(name, 0) + value
+                largest[name] = max(largest.get(name, 0), value)
+        return {"total": total, "max_per_node": largest}
+
+    def enable_metrics(self, metrics=None):
+        """Record into one registry shared by every node, blockchain and miner"""
+        self.metrics = metrics or Metrics()
+        self._set_metrics(self.metrics)
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+        self._set_metrics(None)
+
+    def _set_metrics(self, metrics):
+        for node in self.nodes:
+            node.metrics = metrics
+            node.blockchain.metrics = metrics
+        for miner in self.miners:
+            miner.metrics = metrics
+
+    def get_metrics(self):
+        """Snapshot of the shared registry with network wide gauges filled in"""
+        metrics = self.metrics
+        heights = [node.blockchain.get_best_block().height for node in self.nodes]
+        metrics.set("best_height", max(heights, default=0))
+        metrics.set("min_height", min(heights, default=0))
+        metrics.set("tips", len({node.blockchain.last_block_hash for node in self.nodes}))
+        metrics.set("mempool_transactions", sum(len(node.blockchain.mempool) for node in self.nodes))
+        metrics.set("orphan_pool_blocks", sum(len(node.orphan_blocks) for node in self.nodes))
+        metrics.set("seen_filter_bytes", sum(node.seen_blocks.memory_usage() + node.seen_transactions.memory_usage()
+                                            for node in self.nodes))
+        metrics.set("network_hashrate", self.hashrate)
+        metrics.set("stale_rate", self.get_stale_block_stats()["stale_rate"])
+        return metrics.snapshot()
+
+    def run(self, until=None, max_events=None):
+        return self.simulator.run(until=until, max_events=max_events)
+
+    async def run_async(self, duration):
+        """Run nodes as actors and miners as cooperative tasks on the current event loop"""
+        if not isinstance(self.simulator, AsyncRuntime):
+            self.attach_simulator(AsyncRuntime())
+        mining = [asyncio.ensure_future(miner.mine_async()) for miner in self.miners]
+        await asyncio.sleep(duration)
+        for miner in self.miners:
+            miner.is_mining = False
+        await asyncio.gather(*mining)
+        try:
+            await self.simulator.drain()
+        finally:
+            await self.simulator.stop()
+
     def _connect_all_nodes(self):
-        self._connect_node_group(self.nodes, self.min_node_peers)
+        self._generate_network()
         self._connect_node_group(self.miners, self.min_miner_peers)
         self._connect_node_group(self.wallets, self.min_wallet_peers)
 
     def _connect_node_group(self, nodes, connections):
-        if nodes == self.nodes:
-            self._generate_network()
-            return
         for node in nodes:
             self._connect_to_network(node, connections)
 
     def _connect_to_network(self, node, connections):
         node_amount = len(self.nodes)
-        start_idx = random.randrange(node_amount)
+        connections = min(connections, node_amount)
+        peer_indexes = set()
+        while len(peer_indexes) < connections:
+            peer_indexes.add(random.randrange(node_amount))
 
-        for i in range(connections):
-            peer_idx = (start_idx + i) % node_amount
-            node.peers.add(self.nodes[peer_idx])
+        for peer_idx in peer_indexes:
+            node.connect(self.nodes[peer_idx])
 
     def _create_nodes(self, node_amount, node_type="Node"):
         nodes = []
@@ -45,21 +197,106 @@ class Network():
             elif node_type == "Wallet":
                 node = Wallet()
             else:
-                node = Node()
+                node = Node(Blockchain(self.block_store, self.signature_cache, validator=self.validator), self.relay_mode, self.seen_filter)
+                node.blockchain.listeners.append(self)
             nodes.append(node)
         return nodes
     
     def _generate_network(self):
-        for node in self.nodes:
-            possible_peers = [n for n in self.nodes if n != node]
-            new_peers = random.sample(
-                possible_peers, 
-                k=min(self.min_node_peers, len(possible_peers))
-            )
-            for peer in new_peers:
-                node.peers.add(peer)
-                peer.peers.add(node)
+        self.topology = self.topology_generator(len(self.nodes), self.min_node_peers, rng=random)
+        for node_idx, node in enumerate(self.nodes):
+            self._join_topology(node, node_idx)
+
+    def _join_topology(self, node, node_idx):
+        # Relay walks the node's row of the shared graph, nodes hold no peer sets of their own
+        node.topology = self.topology
+        node.node_id = node_idx
+        node.network_nodes = self.nodes
+
+    def add_node(self, connections=None, sync=True):
+        """Join a new node to the running network, header-first syncing the chain from its peers"""
+        node = self._create_nodes(1, "Node")[0]
+        node.simulator = self.simulator
+        node.metrics = node.blockchain.metrics = self.metrics
+        node.blockchain.accept_virtual_proof = self.accept_virtual_proof
+        if self.genesis_utxo_set is not None:
+            node.blockchain.utxo_set = UTXOSet(base=self.genesis_utxo_set)
+        connections = min(connections or self.min_node_peers, len(self.nodes))
+        node_idx = self.topology.add_node(random.sample(range(len(self.nodes)), connections))
+        self.nodes.append(node)
+        self._join_topology(node, node_idx)
+        if sync:
+            node.start_sync()
+        return node
+
+    def get_topology_stats(self, samples=16):
+        return self.topology.get_stats(samples)
 
     def add_genesis_utxos(self, initial_utxos):
+        initial_utxos = [UTXO.from_dict(utxo) if isinstance(utxo, dict) else utxo for utxo in initial_utxos]
+        self.genesis_utxos.extend(initial_utxos)
+        # Held once for the whole network, each node only keeps its changes on top
+        self.genesis_utxo_set = UTXOSet(self.genesis_utxos)
+        for node in self.nodes:
+            blockchain = node.blockchain
+            blockchain.rebase_utxo_set(self.genesis_utxo_set, blockchain.block_index.genesis)
+        for wallet in self.wallets + self.miners:
+            wallet.coins.add_utxos(initial_utxos)
+
+    def checkpoint_utxo_sets(self):
+        """Share one utxo snapshot of the best chain, nodes keep only their changes on top"""
+        self._utxo_checkpoint_event = None
+        best_node = max(self.nodes, key=lambda node: node.blockchain.chain_work)
+        snapshot = best_node.blockchain.utxo_set.flatten()
+        snapshot_entry = best_node.blockchain.tip_entry
         for node in self.nodes:
-            node.blockchain.utxo_set.extend(initial_utxos)
\ No newline at end of file
+            node.blockchain.rebase_utxo_set(snapshot, snapshot_entry)
+        self.utxo_checkpoints += 1
+
+    # Every node's blockchain listener, see Blockchain.listeners
+    def block_connected(self, block):
+        interval = self.utxo_checkpoint_interval
+        if interval is None or block.height < self._last_utxo_checkpoint_height + interval:
+            return
+        self._last_utxo_checkpoint_height = block.height
+        if self.simulator is None:
+            self.checkpoint_utxo_sets()
+        elif self._utxo_checkpoint_event is None:
+            # Once the block has finished connecting and relaying, not in the middle of a reorg
+            self._utxo_checkpoint_event = self.simulator.schedule(0, self.checkpoint_utxo_sets)
+
+    def block_disconnected(self, block):
+        pass
+
+    def checkpoint(self, path):
+        """Persist every known block, a utxo snapshot of the best chain, node tips and wallet keys"""
+        storage = BlockFileStore(path)
+        entries = sorted(self.block_store.entries.values(), key=lambda entry: entry.height)
+        for entry in entries[1:]:
+            storage.append(entry.block)
+
+        best_node = max(self.nodes, key=lambda node: node.blockchain.chain_work)
+        storage.write_utxo_snapshot(best_node.blockchain.utxo_set, best_node.blockchain.last_block_hash)
+
+        state = {
+            "tips": [node.blockchain.last_block_hash for node in self.nodes],
+            "keys": [wallet.private_key.to_string().hex() for wallet in self.wallets + self.miners]
+        }
+        with open(os.path.join(path, NETWORK_STATE_FILE), "w") as f:
+            json.dump(state, f)
+        storage.close()
+
+    def resume(self, path):
+        """Restore a checkpoint into a network with the same number of nodes, wallets and miners"""
+        if self.storage is not None:
+            self.storage.close()
+        self.storage = BlockFileStore(path) # Kept open, block bodies are read on demand
+        blocks = self.storage.load_headers()
+        snapshot = self.storage.load_utxo_snapshot()
+        with open(os.path.join(path, NETWORK_STATE_FILE)) as f:
+            state = json.load(f)
+
+        for node, tip_hash in zip(self.nodes, state["tips"]):
+            node.blockchain.restore(blocks, snapshot, tip_hash)
+        for wallet, key in zip(self.wallets + self.miners, state["keys"]):
+            wallet.load_private_key(bytes.fromhex(key))
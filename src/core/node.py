@@ -1,92 +1,443 @@
+import time
+import threading
+from collections import deque
+
 from src.core.transaction import Transaction
 from src.core.blockchain import Blockchain
+from src.core.relay import RELAY_PUSH, RELAY_INV, RELAY_COMPACT, REQUEST_TIMEOUT, CompactBlock, get_message_size
+from src.core.sync import HeaderSync, MAX_HEADERS, ORPHAN_SYNC_INTERVAL
+from src.core.orphan_pool import OrphanPool
 from src.utils.crypto import is_valid_proof
+from src.utils.ordered_set import OrderedSet
+from src.utils.filters import SEEN_FILTERS, SEEN_BLOCK_RATE, SEEN_TRANSACTION_RATE, ExactFilter, seen_filter_capacity
+
+_delivery = threading.local()
 
 class Node():
     
-    def __init__(self, blockchain=None):
+    def __init__(self, blockchain=None, relay_mode=RELAY_PUSH, seen_filter=None):
         self.blockchain = blockchain or Blockchain()
-        self.peers = set()
-        self.seen_blocks = set()
-        self.seen_transactions = set()
-        self.orphan_blocks = {}
+        self.topology = None # Peer graph shared by a Network, see Network._generate_network
+        self.node_id = None # Row of this node in the topology
+        self.network_nodes = None # Nodes by topology index
+        self._peers = OrderedSet() # Peers of a node outside a topology
+        # Name in SEEN_FILTERS or a factory taking the capacity, bounded filters keep memory flat on long runs.
+        # Blocks arrive far less often than transactions, so each filter is sized from its own rate
+        make_filter = SEEN_FILTERS.get(seen_filter, seen_filter) if seen_filter else ExactFilter
+        self.seen_blocks = make_filter(seen_filter_capacity(SEEN_BLOCK_RATE))
+        self.seen_transactions = make_filter(seen_filter_capacity(SEEN_TRANSACTION_RATE))
+        self.orphan_blocks = OrphanPool()
+        self.simulator = None
+        self.relay_mode = relay_mode
+        self.requested = {} # hash -> (kind, peer, requested at) of getdata not answered yet
+        self.partial_blocks = {} # hash -> (compact block, transactions, peer, requested at) waiting for missing transactions
+        self.announcers = {} # hash -> other peers that announced a pending item, asked in turn on timeout
+        self._request_timeout_event = None
+        self.bytes_sent = {}
+        self.bytes_received = {}
+        self.duplicates = 0
+        self.sync = None # HeaderSync of the latest catch up, see start_sync
+        self._orphan_sync_at = None
+        self.metrics = None # Metrics while collection is enabled, see Network.enable_metrics
+
+    @property
+    def now(self):
+        return time.time() if self.simulator is None else self.simulator.now
+
+    @property
+    def peers(self):
+        if self.topology is None:
+            return self._peers
+        nodes = self.network_nodes
+        return [nodes[peer] for peer in self.topology.neighbors(self.node_id)]
 
     def is_new_transaction(self, txid):
         return not txid in self.seen_transactions
 
     def receive_transaction(self, transaction):
+        metrics = self.metrics
         if transaction.txid in self.seen_transactions:
+            if metrics is not None:
+                metrics.increment("transactions_duplicate")
             return False
         self.seen_transactions.add(transaction.txid)
+        if metrics is not None:
+            metrics.increment("transactions_received")
 
-        if not transaction.verify():
+        if not transaction.verify(self.blockchain.signature_cache):
             return False
         
-        self.blockchain.mempool.append(transaction)
+        if not self.blockchain.add_transaction(transaction):
+            # Duplicate, double spend or evicted by a full mempool
+            if metrics is not None:
+                metrics.increment("transactions_rejected")
+            return False
         self._propegate_transaction(transaction)
         return True
 
     def _propegate_transaction(self, transaction):
+        if self.relay_mode != RELAY_PUSH:
+            self._announce("tx", transaction.txid)
+            return
         for peer in self.peers:
             if peer.is_new_transaction(transaction.txid):
-                peer.receive_transaction(transaction)
+                self._send_message(peer, "tx", transaction)
+
+    def _announce(self, kind, item_hash):
+        for peer in self.peers:
+            self._send_message(peer, "inv", (kind, [item_hash]))
+
+    def _send_message(self, peer, command, payload):
+        size = get_message_size(command, payload)
+        self.bytes_sent[command] = self.bytes_sent.get(command, 0) + size
+        self._send(peer, peer.receive_message, (self, command, payload), size)
+
+    def _send(self, peer, handler, item, size=None):
+        if self.simulator is None:
+            self._deliver(handler, item)
+            return
+        self.simulator.send(self, peer, handler, item, item.size if size is None else size)
+
+    @staticmethod
+    def _deliver(handler, item):
+        # Without a simulator messages are handled breadth first from a queue,
+        # so propagation through large networks does not recurse once per hop
+        queue = getattr(_delivery, "queue", None)
+        if queue is not None:
+            queue.append((handler, item))
+            return
+        queue = _delivery.queue = deque([(handler, item)])
+        try:
+            while queue:
+                handler, item = queue.popleft()
+                handler(item)
+        finally:
+            _delivery.queue = None
+
+    def receive_message(self, message):
+        sender, command, payload = message
+        size = get_message_size(command, payload)
+        self.bytes_received[command] = self.bytes_received.get(command, 0) + size
+        getattr(self, "_on_" + command)(sender, payload)
+
+    def _on_inv(self, sender, payload):
+        kind, hashes = payload
+        seen = self.seen_transactions if kind == "tx" else self.seen_blocks
+        wanted = []
+        for item_hash in hashes:
+            if item_hash in seen:
+                continue
+            if item_hash in self.requested or item_hash in self.partial_blocks:
+                self.announcers.setdefault(item_hash, []).append(sender)
+            else:
+                wanted.append(item_hash)
+        if wanted:
+            self.request_data(sender, kind, wanted)
+
+    def request_data(self, peer, kind, hashes):
+        """Send getdata and remember the request so it can be retried elsewhere on timeout"""
+        requested_at = self.now
+        for item_hash in hashes:
+            self.requested[item_hash] = (kind, peer, requested_at)
+        self._send_message(peer, "getdata", (kind, hashes))
+        self._schedule_request_timeout()
+
+    def _schedule_request_timeout(self):
+        if self._request_timeout_event is None and self.simulator is not None:
+            self._request_timeout_event = self.simulator.schedule(REQUEST_TIMEOUT, self._check_request_timeouts)
+
+    def _request_answered(self, item_hash):
+        self.requested.pop(item_hash, None)
+        self.announcers.pop(item_hash, None)
+
+    def _retry_request(self, kind, item_hash):
+        # Ask the next peer that announced the item, if any is left
+        peers = self.announcers.pop(item_hash, None)
+        seen = self.seen_transactions if kind == "tx" else self.seen_blocks
+        if not peers or item_hash in seen:
+            return
+        if len(peers) > 1:
+            self.announcers[item_hash] = peers[1:]
+        self.request_data(peers[0], kind, [item_hash])
+
+    def _check_request_timeouts(self):
+        self._request_timeout_event = None
+        now = self.now
+        # Blocks requested by a running sync are retried by the sync itself
+        in_sync = self.sync.in_flight if self.sync is not None else {}
+        stalled = [(item_hash, kind) for item_hash, (kind, _, requested_at) in self.requested.items()
+                   if now - requested_at >= REQUEST_TIMEOUT and item_hash not in in_sync]
+        stalled_blocks = [block_hash for block_hash, (_, _, _, requested_at) in self.partial_blocks.items()
+                          if now - requested_at >= REQUEST_TIMEOUT]
+        for item_hash, kind in stalled:
+            del self.requested[item_hash]
+            self._retry_request(kind, item_hash)
+        for block_hash in stalled_blocks:
+            # Fall back to the full block from a peer that also sent the compact block
+            del self.partial_blocks[block_hash]
+            self._retry_request("block", block_hash)
+        if self.metrics is not None and (stalled or stalled_blocks):
+            self.metrics.increment("requests_timed_out", len(stalled) + len(stalled_blocks))
+        if self.requested or self.partial_blocks:
+            self._schedule_request_timeout()
+
+    def _on_getdata(self, sender, payload):
+        kind, hashes = payload
+        for item_hash in hashes:
+            if kind == "tx":
+                transaction = self.blockchain.mempool.get(item_hash)
+                if transaction is not None:
+                    self._send_message(sender, "tx", transaction)
+                    continue
+            else:
+                block = self._find_block_by_hash(item_hash)
+                if block is not None:
+                    self._send_message(sender, "block", block)
+                    continue
+            # Mined or evicted since it was announced
+            self._send_message(sender, "notfound", (kind, [item_hash]))
 
-    def receive_block(self, block):
+    def _on_notfound(self, sender, payload):
+        kind, hashes = payload
+        syncing = kind == "block" and self.sync is not None
+        for item_hash in hashes:
+            if item_hash in self.requested and not (syncing and item_hash in self.sync.in_flight):
+                del self.requested[item_hash]
+                self._retry_request(kind, item_hash)
+        if syncing:
+            self.sync.on_notfound(sender, hashes)
+
+    def _on_tx(self, sender, transaction):
+        self._request_answered(transaction.txid)
+        if transaction.txid in self.seen_transactions:
+            self._count_duplicate("transactions_duplicate")
+            return
+        self.receive_transaction(transaction)
+
+    def _on_block(self, sender, block):
+        self._request_answered(block.hash)
+        if self.sync is not None and block.hash in self.sync.in_flight:
+            self.sync.on_block(sender, block)
+            return
         if block.hash in self.seen_blocks:
+            self._count_duplicate("blocks_duplicate")
+            return
+        self._receive_block_transactions(block.transactions[1:])
+        self.receive_block(block, sender)
+
+    def _receive_block_transactions(self, transactions):
+        # Blocks may only include mempool transactions, so accept any that are still in flight
+        for transaction in transactions:
+            if transaction.txid not in self.seen_transactions:
+                self._request_answered(transaction.txid)
+                self.receive_transaction(transaction)
+
+    def _on_cmpctblock(self, sender, compact_block):
+        if compact_block.hash in self.seen_blocks:
+            self._count_duplicate("blocks_duplicate")
+            return
+        if compact_block.hash in self.partial_blocks or compact_block.hash in self.requested:
+            # Already being fetched, asked from this peer as well if that times out
+            self.announcers.setdefault(compact_block.hash, []).append(sender)
+            self._count_duplicate("blocks_duplicate")
+            return
+
+        transactions, missing = compact_block.reconstruct(self.blockchain.mempool)
+        if missing:
+            self.partial_blocks[compact_block.hash] = (compact_block, transactions, sender, self.now)
+            self._send_message(sender, "getblocktxn", (compact_block.hash, missing))
+            self._schedule_request_timeout()
+            return
+        self._receive_compact_block(sender, compact_block, transactions)
+
+    def _on_getblocktxn(self, sender, payload):
+        block_hash, indexes = payload
+        block = self._find_block_by_hash(block_hash)
+        if block is not None:
+            transactions = [block.transactions[index] for index in indexes]
+            self._send_message(sender, "blocktxn", (block_hash, transactions))
+
+    def _on_blocktxn(self, sender, payload):
+        block_hash, missing_transactions = payload
+        if block_hash not in self.partial_blocks:
+            return
+        compact_block, transactions, _, _ = self.partial_blocks.pop(block_hash)
+        self.announcers.pop(block_hash, None)
+        missing = [index for index, transaction in enumerate(transactions) if transaction is None]
+        if len(missing) != len(missing_transactions):
+            return
+        for index, transaction in zip(missing, missing_transactions):
+            transactions[index] = transaction
+        self._receive_block_transactions(missing_transactions)
+        self._receive_compact_block(sender, compact_block, transactions)
+
+    def _receive_compact_block(self, sender, compact_block, transactions):
+        block = compact_block.to_block(transactions)
+        if block is None:
+            # Short id collision, fall back to the full block
+            self.request_data(sender, "block", [compact_block.hash])
+            return
+        self.receive_block(block, sender)
+
+    def _count_duplicate(self, name):
+        self.duplicates += 1
+        if self.metrics is not None:
+            self.metrics.increment(name)
+
+    def get_memory_stats(self):
+        """Approximate bytes held by this node's dedupe filters and item counts of its pools"""
+        return {
+            "seen_blocks_bytes": self.seen_blocks.memory_usage(),
+            "seen_transactions_bytes": self.seen_transactions.memory_usage(),
+            "seen_blocks": len(self.seen_blocks),
+            "seen_transactions": len(self.seen_transactions),
+            "mempool_transactions": len(self.blockchain.mempool),
+            "utxo_delta": self.blockchain.utxo_set.delta_size,
+            "orphan_blocks": len(self.orphan_blocks),
+            "requested": len(self.requested),
+            "partial_blocks": len(self.partial_blocks)
+        }
+
+    def get_relay_stats(self):
+        return {
+            "bytes_sent": dict(self.bytes_sent),
+            "bytes_received": dict(self.bytes_received),
+            "duplicates": self.duplicates
+        }
+
+    def start_sync(self, peers=None):
+        """Catch up with peers header first, unless a sync is already running"""
+        if self.sync is not None and not self.sync.finished:
+            return self.sync
+        self.sync = HeaderSync(self)
+        self.sync.start(list(peers or self.peers))
+        return self.sync
+
+    def _sync_for_orphan(self, peer):
+        # Blocks were missed, catch up from the peer that sent the orphan. Orphans
+        # whose parent no peer has would otherwise restart a sync on every arrival
+        if self.sync is not None and not self.sync.finished:
+            return
+        if self._orphan_sync_at is not None and self.now - self._orphan_sync_at < ORPHAN_SYNC_INTERVAL:
+            return
+        self._orphan_sync_at = self.now
+        self.start_sync([peer] if peer is not None else None)
+
+    def _on_getheaders(self, sender, locator):
+        # Headers following the first locator hash on our chain, from genesis if none is
+        chain = self.blockchain.chain
+        block_index = self.blockchain.block_index
+        start = 1
+        for block_hash in locator:
+            entry = block_index.get(block_hash)
+            if entry is not None and entry.height < len(chain) and chain[entry.height].hash == block_hash:
+                start = entry.height + 1
+                break
+        headers = [(block.header, block.virtual_proof) for block in chain[start:start + MAX_HEADERS]]
+        self._send_message(sender, "headers", headers)
+
+    def _on_headers(self, sender, headers):
+        if self.sync is not None:
+            self.sync.on_headers(sender, headers)
+
+    def _connect_synced_block(self, block):
+        """Validate and connect a block downloaded by sync, without relaying it"""
+        self.seen_blocks.add(block.hash)
+        self.orphan_blocks.remove(block.hash)
+        if not self._is_block_valid(block):
+            return False
+        for transaction in block.transactions[1:]:
+            self.seen_transactions.add(transaction.txid)
+        self._try_add_block(block)
+        block_index = self.blockchain.block_index
+        if block.hash not in block_index or block.hash in block_index.invalid:
+            return False
+        self._connect_orphans(block.hash)
+        return True
+
+    def _sync_finished(self, sync):
+        if self.metrics is not None:
+            self.metrics.increment("syncs")
+            self.metrics.observe("sync_seconds", sync.finished_at - sync.started_at)
+
+    def receive_block(self, block, peer=None):
+        if block.hash in self.seen_blocks:
+            if self.metrics is not None:
+                self.metrics.increment("blocks_duplicate")
             return False
         self.seen_blocks.add(block.hash)
+        if self.metrics is not None:
+            self.metrics.increment("blocks_received")
         
         if not self._is_block_valid(block):
             return False
         
-        sucess = self._try_add_block(block)
+        sucess = self._try_add_block(block, peer)
 
         if sucess:
+            if self.metrics is not None:
+                self.metrics.observe("block_propagation_seconds", self.now - block.timestamp)
             self._propegate_block(block)
+        if block.hash in self.blockchain.block_index:
+            self._connect_orphans(block.hash)
         
         return sucess
     
-    def _try_add_block(self, block):
+    def _try_add_block(self, block, peer=None):
+        block_index = self.blockchain.block_index
+        if block.prev_hash not in block_index:
+            self.orphan_blocks.add(block, peer, self.now)
+            if self.metrics is not None:
+                self.metrics.increment("orphan_blocks")
+            self._sync_for_orphan(peer)
+            return False
+
         if block.prev_hash == self.blockchain.last_block_hash:
+            self.blockchain.add_block_transactions(block)
             return self.blockchain.append_block(block)
-        
-        previous_block = self._find_block_by_hash(block.prev_hash)
-        if previous_block:
-            return self._handle_fork(block)
-        
-        self.orphan_blocks[block.hash] = block
-        return False
 
-    def _handle_fork(self, block):
-        alternative_chain = self._build_alternative_chain(block)
-        if not alternative_chain:
+        entry = block_index.add(block)
+        return self._handle_fork(entry)
+
+    def _handle_fork(self, entry):
+        # Fork choice by most cumulative work, not chain length
+        if entry.chain_work <= self.blockchain.chain_work:
             return False
-        
-        current_chain_length = len(self.blockchain.chain)
-        alternative_chain_length = len(alternative_chain)
-                
-        if alternative_chain_length > current_chain_length:
-            return self._switch_to_chain(alternative_chain)
-        
-        return False
+
+        block_index = self.blockchain.block_index
+        fork_point = block_index.find_fork(self.blockchain.tip_entry, entry)
+        if block_index.has_invalid_ancestor(entry, fork_point):
+            return False
+
+        new_branch = block_index.get_branch(fork_point, entry)
+
+        if not self._switch_to_chain(fork_point, new_branch):
+            block_index.invalidate(entry)
+            return False
+        return True
     
-    def _switch_to_chain(self, new_chain):
-        if not self._validate_chain(new_chain):
+    def _switch_to_chain(self, fork_point, new_branch):
+        if not self._validate_chain([fork_point.block] + new_branch):
             return False
-        
-        old_chain = self.blockchain.chain.copy()
-        old_utxo_set = self.blockchain.utxo_set.copy()
 
-        self.blockchain.chain = []
-        self.blockchain.utxo_set = []
-        
-        for block in new_chain:
+        # Only the blocks after the fork point are disconnected and connected
+        disconnected = []
+        while self.blockchain.last_block_hash != fork_point.hash:
+            disconnected.append(self.blockchain.disconnect_block())
+        if self.metrics is not None:
+            self.metrics.increment("reorgs")
+            self.metrics.observe("reorg_depth", len(disconnected))
+
+        for connected, block in enumerate(new_branch):
+            self.blockchain.add_block_transactions(block)
             if not self.blockchain.append_block(block):
-                # Use old chain if appending fails
-                self.blockchain.chain = old_chain
-                self.blockchain.utxo_set = old_utxo_set
+                # Roll back to the old chain
+                for _ in range(connected):
+                    self.blockchain.disconnect_block()
+                for old_block in reversed(disconnected):
+                    self.blockchain.connect_block(old_block)
                 return False
-        
+
         self._remove_used_orphans()
         return True
 
@@ -99,50 +450,81 @@ class Node():
             if not self._is_block_valid(chain[i]):
                 # Invalid block
                 return False
-            
+
+        # Check the whole branch's signatures in one batch before anything is
+        # disconnected, append_block then finds them in the signature cache
+        signature_cache = self.blockchain.signature_cache
+        if signature_cache is not None:
+            transactions = [tx for block in chain[1:] for tx in block.transactions[1:]]
+            if not self.blockchain.validator.verify_signatures(transactions, signature_cache):
+                return False
         return True
 
     def _remove_used_orphans(self):
-        chain_hashes = {block.hash for block in self.blockchain.chain}
-        orphan_blocks = {}
-        for hash, block in self.orphan_blocks.items():
-            if hash not in chain_hashes:
-                orphan_blocks[hash] = block
-        self.orphan_blocks = orphan_blocks
-
-    def _build_alternative_chain(self, tip_block):
-        chain = [tip_block]
-        current_block = tip_block
-        
-        # Walk backwards from tip to genesis
-        while current_block.prev_hash != self.blockchain.chain[0].hash:
-            parent = self._find_block_by_hash(current_block.prev_hash)
-            if not parent:
-                return None
-            chain.insert(0, parent)
-            current_block = parent
-        
-        chain.insert(0, self.blockchain.chain[0])
-        return chain
+        block_index = self.blockchain.block_index
+        for block_hash in self.orphan_blocks.hashes():
+            if block_hash in block_index:
+                self.orphan_blocks.remove(block_hash)
+
+    def _connect_orphans(self, parent_hash):
+        """Connect the orphans waiting for parent_hash, then their own descendants in turn"""
+        parents = [parent_hash]
+        while parents:
+            for orphan in self.orphan_blocks.pop_children(parents.pop()):
+                if self.metrics is not None:
+                    self.metrics.increment("orphans_connected")
+                if self._try_add_block(orphan):
+                    self._propegate_block(orphan)
+                if orphan.hash in self.blockchain.block_index:
+                    parents.append(orphan.hash)
 
     def _find_block_by_hash(self, block_hash):
-        for block in self.blockchain.chain:
-            if block.hash == block_hash:
-                return block
+        entry = self.blockchain.block_index.get(block_hash)
+        if entry:
+            return entry.block
         
         return self.orphan_blocks.get(block_hash)
 
     def _propegate_block(self, block):
+        if self.relay_mode == RELAY_INV:
+            self._announce("block", block.hash)
+            return
+        if self.relay_mode == RELAY_COMPACT:
+            compact_block = CompactBlock(block)
+            for peer in self.peers:
+                self._send_message(peer, "cmpctblock", compact_block)
+            return
         for peer in self.peers:
-            peer.receive_block(block)
+            self._send_message(peer, "block", block)
         return
     
     def _is_block_valid(self, block):
+        if self.metrics is None:
+            return self._check_block(block)
+        start = time.perf_counter()
+        is_valid = self._check_block(block)
+        self.metrics.observe("block_validation_seconds", time.perf_counter() - start)
+        if not is_valid:
+            self.metrics.increment("blocks_invalid")
+        return is_valid
+
+    def _check_block(self, block):
+        if not block.transactions:
+            # No reward transaction
+            return False
+
         block.compute_hash()
-        is_valid_hash = is_valid_proof(block.hash, block.difficulty)
+        if block.virtual_proof:
+            is_valid_hash = self.blockchain.accept_virtual_proof
+        else:
+            is_valid_hash = is_valid_proof(block.digest, block.difficulty)
         if not is_valid_hash:
             # Invalid proof of work
             return False
+
+        if not block.has_valid_merkle_root():
+            # Header does not commit to the transactions
+            return False
         
         reward_tx = block.transactions[0]
         reward_amount = self.blockchain.block_subsidy + Transaction.fee * (len(block.transactions) - 1)
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+ORPHAN_POOL_SIZE = 100 # Blocks
+ORPHAN_MAX_AGE = 1200.0 # Seconds an orphan waits for its parent
+ORPHAN_PEER_LIMIT = 20 # Blocks held per sending peer
+
+class OrphanPool():
+    """Blocks waiting for an unknown parent, indexed by the parent's hash.
+
+    Bounded in total size, per sending peer and by age; the oldest orphans
+    are evicted first, and a peer over its limit only displaces its own.
+    """
+
+    def __init__(self, max_size=ORPHAN_POOL_SIZE, max_age=ORPHAN_MAX_AGE, max_per_peer=ORPHAN_PEER_LIMIT):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_per_peer = max_per_peer
+        self.evicted = 0
+        self.expired = 0
+        self._orphans = OrderedDict() # hash -> (block, peer, added at), oldest first
+        self._by_parent = {}
+        self._per_peer = {}
+
+    def __contains__(self, block_hash):
+        return block_hash in self._orphans
+
+    def __len__(self):
+        return len(self._orphans)
+
+    def get(self, block_hash):
+        orphan = self._orphans.get(block_hash)
+        return orphan[0] if orphan else None
+
+    def hashes(self):
+        return list(self._orphans)
+
+    def add(self, block, peer=None, now=0.0):
+        if block.hash in self._orphans:
+            return False
+        self.expire(now)
+        if peer is not None and self._per_peer.get(peer, 0) >= self.max_per_peer:
+            self._evict(next(block_hash for block_hash, (_, sender, _) in self._orphans.items() if sender is peer))
+        elif len(self._orphans) >= self.max_size:
+            self._evict(next(iter(self._orphans)))
+
+        self._orphans[block.hash] = (block, peer, now)
+        self._by_parent.setdefault(block.prev_hash, set()).add(block.hash)
+        if peer is not None:
+            self._per_peer[peer] = self._per_peer.get(peer, 0) + 1
+        return True
+
+    def remove(self, block_hash):
+        orphan = self._orphans.pop(block_hash, None)
+        if orphan is None:
+            return None
+        block, peer, _ = orphan
+        children = self._by_parent[block.prev_hash]
+        children.discard(block_hash)
+        if not children:
+            del self._by_parent[block.prev_hash]
+        if peer is not None:
+            self._per_peer[peer] -= 1
+            if not self._per_peer[peer]:
+                del self._per_peer[peer]
+        return block
+
+    def _evict(self, block_hash):
+        self.remove(block_hash)
+        self.evicted += 1
+
+    def pop_children(self, parent_hash):
+        """Remove and return the orphans whose parent is parent_hash"""
+        return [self.remove(block_hash) for block_hash in list(self._by_parent.get(parent_hash, ()))]
+
+    def expire(self, now):
+        while self._orphans:
+            block_hash, (_, _, added_at) = next(iter(self._orphans.items()))
+            if now - added_at < self.max_age:
+                break
+            self.remove(block_hash)
+            self.expired += 1
+
+    def get_stats(self):
+        return {
+            "size": len(self._orphans),
+            "peers": len(self._per_peer),
+            "evicted": self.evicted,
+            "expired": self.expired
+        }
@@ -0,0 +1,44 @@
+from typing import NamedTuple
+from functools import lru_cache
+
+ADDRESS_SIZE = 48 # Raw NIST192p public key
+
+_addresses = {}
+
+def to_address(key):
+    """Intern a VerifyingKey or raw key bytes as a shared fixed-size bytes address"""
+    if key is None:
+        return None
+    if not isinstance(key, bytes):
+        key = key.to_string()
+    return _addresses.setdefault(key, key)
+
+@lru_cache(maxsize=4096)
+def get_verifying_key(address: bytes):
+    from ecdsa.keys import VerifyingKey
+    return VerifyingKey.from_string(address)
+
+
+class OutPoint(NamedTuple):
+    txid: str
+    index: int
+
+
+class TxOut(NamedTuple):
+    owner_address: bytes
+    amount: int
+
+
+class UTXO(NamedTuple):
+    txid: str
+    index: int
+    amount: int
+    owner_address: bytes
+
+    @property
+    def outpoint(self):
+        return OutPoint(self.txid, self.index)
+
+    @classmethod
+    def from_dict(cls, utxo):
+        return cls(utxo['txid'], utxo['index'], utxo['amount'], to_address(utxo['owner_address']))
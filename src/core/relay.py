@@ -0,0 +1,67 @@
+from src.core.block import Block, HEADER_SIZE
+
+RELAY_PUSH = "push" # Full blocks and transactions sent to every peer
+RELAY_INV = "inv" # Announce hashes, peers pull unknown items with getdata
+RELAY_COMPACT = "compact" # inv for transactions, blocks sent as compact blocks
+
+INV_ITEM_SIZE = 36 # Type and hash
+MESSAGE_HEADER_SIZE = 24
+SHORT_ID_LENGTH = 12 # Hex characters, 6 bytes
+REQUEST_TIMEOUT = 5.0 # Seconds before an unanswered getdata or getblocktxn is asked from another peer
+
+def short_id(txid):
+    return txid[:SHORT_ID_LENGTH]
+
+
+class CompactBlock():
+    """Block header, short txids and the prefilled coinbase"""
+
+    def __init__(self, block):
+        self.hash = block.hash
+        self.header = block.header
+        self.virtual_proof = block.virtual_proof
+        self.prefilled = block.transactions[:1]
+        self.short_ids = [short_id(tx.txid) for tx in block.transactions[1:]]
+
+    @property
+    def size(self):
+        prefilled_size = sum(tx.size for tx in self.prefilled)
+        return HEADER_SIZE + prefilled_size + len(self.short_ids) * SHORT_ID_LENGTH // 2
+
+    def reconstruct(self, mempool):
+        """Fill transactions from the mempool, returns (transactions, missing indexes)"""
+        known = {short_id(tx.txid): tx for tx in mempool}
+        transactions = list(self.prefilled)
+        missing = []
+        for index, tx_short_id in enumerate(self.short_ids, start=len(self.prefilled)):
+            tx = known.get(tx_short_id)
+            if tx is None:
+                missing.append(index)
+            transactions.append(tx)
+        return transactions, missing
+
+    def to_block(self, transactions):
+        """Rebuild the block, None if the transactions do not match the header"""
+        block = Block.from_header(self.header)
+        block.transactions = transactions
+        block.virtual_proof = self.virtual_proof
+        if block.hash != self.hash:
+            return None
+        return block
+
+
+def get_message_size(command, payload):
+    if command in ("inv", "getdata", "notfound"):
+        _, hashes = payload
+        return MESSAGE_HEADER_SIZE + len(hashes) * INV_ITEM_SIZE
+    if command == "getheaders":
+        return MESSAGE_HEADER_SIZE + 4 + 32 * len(payload) + 32
+    if command == "headers":
+        return MESSAGE_HEADER_SIZE + len(payload) * (HEADER_SIZE + 1)
+    if command == "getblocktxn":
+        _, indexes = payload
+        return MESSAGE_HEADER_SIZE + 32 + 2 * len(indexes)
+    if command == "blocktxn":
+        _, transactions = payload
+        return MESSAGE_HEADER_SIZE + 32 + sum(tx.size for tx in transactions)
+    return MESSAGE_HEADER_SIZE + payload.size
@@ -0,0 +1,101 @@
+import time
+import random
+import asyncio
+
+class AsyncRuntime():
+    """Single event loop actor runtime, an alternative to threads and the Simulator.
+
+    Every receiver gets an inbound queue drained by its own task, so handlers
+    run one message at a time and never re-enter each other. Miners run as
+    cooperative tasks, see Miner.mine_async. Exposes the same send, schedule
+    and cancel calls as the Simulator so it can be attached the same way.
+    A handler that raises does not stop its actor; the first error is
+    raised again from drain or stop.
+    """
+
+    def __init__(self, default_link=None, seed=None):
+        self.default_link = default_link # None delivers on the next loop iteration
+        self.links = {}
+        self.random = random.Random(seed)
+        self.messages_processed = 0
+        self.errors = 0
+        self._error = None
+        self._mailboxes = {}
+        self._tasks = []
+        self._in_flight = 0
+        self._idle = None
+
+    @property
+    def now(self):
+        # Wall clock, the same clock miners stamp their blocks with
+        return time.time()
+
+    def set_link(self, node_a, node_b, link_model):
+        self.links[frozenset((node_a, node_b))] = link_model
+
+    def get_link(self, sender, receiver):
+        return self.links.get(frozenset((sender, receiver)), self.default_link)
+
+    def _get_mailbox(self, actor):
+        mailbox = self._mailboxes.get(actor)
+        if mailbox is None:
+            mailbox = self._mailboxes[actor] = asyncio.Queue()
+            self._tasks.append(asyncio.get_running_loop().create_task(self._run_actor(mailbox)))
+        return mailbox
+
+    async def _run_actor(self, mailbox):
+        while True:
+            handler, item = await mailbox.get()
+            try:
+                handler(item)
+                self.messages_processed += 1
+            except Exception as error:
+                self.errors += 1
+                if self._error is None:
+                    self._error = error
+            finally:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._idle.set()
+
+    def send(self, sender, receiver, handler, item, size=0):
+        mailbox = self._get_mailbox(receiver)
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        self._in_flight += 1
+        self._idle.clear()
+        link = self.get_link(sender, receiver)
+        if link is None:
+            mailbox.put_nowait((handler, item))
+            return None
+        delay = link.transmission_delay(size) + link.propagation_delay(self.random)
+        return self.schedule(delay, mailbox.put_nowait, (handler, item))
+
+    def schedule(self, delay, callback, *args):
+        return asyncio.get_running_loop().call_later(delay, callback, *args)
+
+    @staticmethod
+    def cancel(handle):
+        handle.cancel()
+
+    async def drain(self):
+        """Wait until every message sent so far, and every message it caused, was handled"""
+        if self._in_flight:
+            await self._idle.wait()
+        self._raise_error()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._mailboxes = {}
+        self._in_flight = 0
+        self._idle = None
+        self._raise_error()
+
+    def _raise_error(self):
+        # Each handler error is raised once, by whichever of drain and stop comes first
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
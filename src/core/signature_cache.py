@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+SIGNATURE_CACHE_SIZE = 100000 # Entries
+
+class SignatureCache():
+    """Bounded LRU of signatures already verified as valid, shared between nodes"""
+
+    def __init__(self, max_size=SIGNATURE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(transaction):
+        return (transaction.txid, transaction.signature, transaction.sender_address)
+
+    def contains(self, key):
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, key):
+        self._entries[key] = None
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,91 @@
+import heapq
+import random
+import itertools
+
+class LinkModel():
+    """Latency (seconds) and bandwidth (bytes per second) of a peer link"""
+
+    def __init__(self, latency=0.05, jitter=0.0, bandwidth=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+
+    def propagation_delay(self, rng):
+        if self.jitter:
+            return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        return self.latency
+
+    def transmission_delay(self, size):
+        if not self.bandwidth:
+            return 0.0
+        return size / self.bandwidth
+
+
+class Simulator():
+    """Discrete-event scheduler running on a virtual clock"""
+
+    def __init__(self, default_link=None, seed=None):
+        self.now = 0.0
+        self.default_link = default_link or LinkModel()
+        self.links = {}
+        self.random = random.Random(seed)
+        self.events_processed = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._link_free_at = {}
+
+    def schedule(self, delay, callback, *args):
+        return self.schedule_at(self.now + delay, callback, *args)
+
+    def schedule_at(self, time, callback, *args):
+        event = [time, next(self._sequence), callback, args, False]
+        heapq.heappush(self._queue, event)
+        return event
+
+    @staticmethod
+    def cancel(event):
+        event[4] = True
+
+    def set_link(self, node_a, node_b, link_model):
+        self.links[frozenset((node_a, node_b))] = link_model
+
+    def get_link(self, sender, receiver):
+        return self.links.get(frozenset((sender, receiver)), self.default_link)
+
+    def send(self, sender, receiver, handler, item, size=0):
+        """Deliver item to handler after the link's transmission and propagation delay"""
+        link = self.get_link(sender, receiver)
+        start = max(self.now, self._link_free_at.get((sender, receiver), 0.0))
+        sent_at = start + link.transmission_delay(size)
+        if link.bandwidth:
+            # Messages on the same direction of a link queue behind each other
+            self._link_free_at[(sender, receiver)] = sent_at
+        return self.schedule_at(sent_at + link.propagation_delay(self.random), handler, item)
+
+    def step(self):
+        while self._queue:
+            time, _, callback, args, cancelled = heapq.heappop(self._queue)
+            if cancelled:
+                continue
+            self.now = time
+            callback(*args)
+            self.events_processed += 1
+            return True
+        return False
+
+    def run(self, until=None, max_events=None):
+        processed = 0
+        while self._queue:
+            if until is not None and self._queue[0][0] > until:
+                break
+            if max_events is not None and processed >= max_events:
+                return processed
+            if self.step():
+                processed += 1
+        if until is not None and self.now < until:
+            self.now = until
+        return processed
+
+    @property
+    def pending_events(self):
+        return len(self._queue)
@@ -0,0 +1,167 @@
+import os
+import mmap
+import struct
+
+from src.core.block import Block, HEADER_SIZE
+from src.core.primitives import UTXO, to_address
+from src.core.utxo_set import UTXOSet
+
+# block hash, header, virtual proof flag, offset and length in the block file
+INDEX_RECORD = struct.Struct(">32s%ds?QI" % HEADER_SIZE)
+INDEX_RECORD_SIZE = INDEX_RECORD.size
+
+# txid length, then index, amount and position in the owner table
+SNAPSHOT_TXID_LENGTH = struct.Struct(">H")
+SNAPSHOT_RECORD = struct.Struct(">QqI")
+
+BLOCK_FILE = "blocks.dat"
+INDEX_FILE = "index.dat"
+SNAPSHOT_FILE = "utxo.snapshot"
+
+class BlockFileStore():
+    """Append-only block file with an mmap'ed hash -> offset index and utxo snapshots"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._block_file = open(os.path.join(path, BLOCK_FILE), "ab+")
+        self._index_file = open(os.path.join(path, INDEX_FILE), "ab+")
+        self._block_map = None
+        self._index_map = None
+        self.positions = {} # block hash -> record number in the index, offsets are read on demand
+        self._load_index()
+
+    def _map_index(self):
+        self._index_file.seek(0, os.SEEK_END)
+        index_size = self._index_file.tell()
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        if index_size:
+            self._index_map = mmap.mmap(self._index_file.fileno(), index_size, access=mmap.ACCESS_READ)
+
+    def _load_index(self):
+        # Drop a partially written trailing record so appended records stay aligned
+        self._index_file.seek(0, os.SEEK_END)
+        index_size = self._index_file.tell()
+        if index_size % INDEX_RECORD_SIZE:
+            self._index_file.truncate(index_size - index_size % INDEX_RECORD_SIZE)
+        self._map_index()
+        if self._index_map is None:
+            return
+        record_count = len(self._index_map) // INDEX_RECORD_SIZE
+        hashes = (self._index_map[position * INDEX_RECORD_SIZE:position * INDEX_RECORD_SIZE + 32].hex()
+                  for position in range(record_count))
+        self.positions = dict(zip(hashes, range(record_count)))
+
+    def _read_record(self, position):
+        if self._index_map is None or (position + 1) * INDEX_RECORD_SIZE > len(self._index_map):
+            self._map_index()
+        return INDEX_RECORD.unpack_from(self._index_map, position * INDEX_RECORD_SIZE)
+
+    def __contains__(self, block_hash):
+        return block_hash in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def append(self, block):
+        if block.hash in self.positions:
+            return
+        data = block.to_bytes()
+        self._block_file.seek(0, os.SEEK_END)
+        offset = self._block_file.tell()
+        self._block_file.write(data)
+        self._block_file.flush()
+
+        record = INDEX_RECORD.pack(bytes.fromhex(block.hash), block.header,
+                                   block.virtual_proof, offset, len(data))
+        self._index_file.write(record)
+        self._index_file.flush()
+        self.positions[block.hash] = len(self.positions)
+
+    def read_block_data(self, block_hash):
+        _, _, _, offset, length = self._read_record(self.positions[block_hash])
+        if self._block_map is None or offset + length > len(self._block_map):
+            if self._block_map is not None:
+                self._block_map.close()
+            self._block_map = mmap.mmap(self._block_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._block_map[offset:offset + length]
+
+    def load_transactions(self, block):
+        return Block.transactions_from_bytes(self.read_block_data(block.hash))
+
+    def load_headers(self):
+        """Blocks in the order they were written, transactions are read lazily"""
+        if len(self.positions) * INDEX_RECORD_SIZE != (len(self._index_map) if self._index_map else 0):
+            self._map_index()
+        if self._index_map is None:
+            return []
+        load_transactions = self.load_transactions
+        return [Block.from_header(header, load_transactions, block_hash.hex(), virtual_proof)
+                for block_hash, header, virtual_proof, _, _ in INDEX_RECORD.iter_unpack(self._index_map)]
+
+    def write_utxo_snapshot(self, utxo_set, tip_hash):
+        owners = {}
+        records = []
+        for utxo in utxo_set:
+            owner_position = owners.setdefault(utxo.owner_address, len(owners))
+            txid = utxo.txid.encode()
+            records.append(SNAPSHOT_TXID_LENGTH.pack(len(txid)) + txid)
+            records.append(SNAPSHOT_RECORD.pack(utxo.index, utxo.amount, owner_position))
+
+        parts = [bytes.fromhex(tip_hash), struct.pack(">I", len(owners))]
+        for owner_address in owners:
+            parts.append(struct.pack(">B", len(owner_address)) + owner_address)
+        parts.append(struct.pack(">I", len(utxo_set)))
+        parts.extend(records)
+
+        # Write then rename so a crash never leaves a half written snapshot
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+        with open(snapshot_path + ".tmp", "wb") as f:
+            f.write(b"".join(parts))
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+
+    def load_utxo_snapshot(self):
+        """Returns (tip_hash, UTXOSet) or None when no snapshot was written"""
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+        if not os.path.exists(snapshot_path):
+            return None
+        with open(snapshot_path, "rb") as f:
+            data = f.read()
+
+        tip_hash = data[:32].hex()
+        owner_count, = struct.unpack_from(">I", data, 32)
+        offset = 36
+        owners = []
+        for _ in range(owner_count):
+            owner_length = data[offset]
+            owners.append(to_address(data[offset + 1:offset + 1 + owner_length]))
+            offset += 1 + owner_length
+
+        count, = struct.unpack_from(">I", data, offset)
+        offset += 4
+        utxos = []
+        unpack_txid_length = SNAPSHOT_TXID_LENGTH.unpack_from
+        unpack_record = SNAPSHOT_RECORD.unpack_from
+        for _ in range(count):
+            txid_length, = unpack_txid_length(data, offset)
+            offset += 2
+            txid = data[offset:offset + txid_length].decode()
+            offset += txid_length
+            index, amount, owner_position = unpack_record(data, offset)
+            offset += SNAPSHOT_RECORD.size
+            utxos.append(UTXO(txid, index, amount, owners[owner_position]))
+
+        utxo_set = UTXOSet()
+        utxo_set.load(utxos)
+        return tip_hash, utxo_set
+
+    def close(self):
+        for mapped in (self._block_map, self._index_map):
+            if mapped is not None:
+                mapped.close()
+        self._block_map = None
+        self._index_map = None
+        self._block_file.close()
+        self._index_file.close()
@@ -0,0 +1,253 @@
+from collections import deque
+
+from src.core.block import Block
+from src.utils.crypto import is_valid_proof, get_block_work
+
+MAX_HEADERS = 2000 # Headers per headers message
+DOWNLOAD_WINDOW = 1024 # Blocks past the next one to connect that may be requested
+MAX_BLOCKS_IN_FLIGHT = 16 # Per peer
+BLOCK_DOWNLOAD_TIMEOUT = 60.0 # Seconds before a requested block is asked from another peer
+ORPHAN_SYNC_INTERVAL = 10.0 # Seconds between syncs started because an orphan block arrived
+
+def get_locator(chain):
+    """Hashes of the chain from the tip back to genesis, dense near the tip then exponentially spaced"""
+    hashes = []
+    step = 1
+    height = len(chain) - 1
+    while height > 0:
+        hashes.append(chain[height].hash)
+        if len(hashes) >= 10:
+            step *= 2
+        height -= step
+    hashes.append(chain[0].hash)
+    return hashes
+
+
+class HeaderEntry():
+    __slots__ = ('hash', 'prev_hash', 'height', 'chain_work')
+
+    def __init__(self, block, parent):
+        self.hash = block.hash
+        self.prev_hash = block.prev_hash
+        self.height = parent.height + 1
+        self.chain_work = parent.chain_work + get_block_work(block.difficulty)
+
+
+class HeaderSync():
+    """Header-first catch up of one node from its peers.
+
+    Headers are fetched with getheaders/headers and checked for linkage and
+    proof of work before any block body is requested. Bodies along the best
+    header chain are then requested from every peer that announced them,
+    at most DOWNLOAD_WINDOW blocks ahead of the next block to connect, and
+    connected in order as they arrive.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.headers = {}
+        self.best_header = None
+        self.to_request = deque() # Hashes of the best header chain not requested yet, oldest first
+        self.to_connect = deque() # Hashes of the best header chain not connected yet, oldest first
+        self.heights = {}
+        self.in_flight = {} # hash -> (peer, requested at)
+        self.peer_load = {}
+        self.peer_heights = {}
+        self.downloaded = {}
+        self.awaiting_headers = set()
+        self.blocks_downloaded = 0
+        self.started_at = None
+        self.finished_at = None
+        self._timeout_event = None
+
+    @property
+    def now(self):
+        return self.node.now
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def start(self, peers):
+        self.started_at = self.now
+        for peer in peers:
+            self.request_headers(peer)
+        self._check_finished()
+
+    def request_headers(self, peer, last_entry=None):
+        locator = get_locator(self.node.blockchain.chain)
+        if last_entry is not None:
+            locator.insert(0, last_entry.hash)
+        self.awaiting_headers.add(peer)
+        self.node._send_message(peer, "getheaders", locator)
+
+    def _get_entry(self, block_hash):
+        entry = self.headers.get(block_hash)
+        if entry is None:
+            entry = self.node.blockchain.block_index.get(block_hash)
+        return entry
+
+    def on_headers(self, peer, headers):
+        self.awaiting_headers.discard(peer)
+        difficulty = self.node.blockchain.difficulty
+        accept_virtual_proof = self.node.blockchain.accept_virtual_proof
+        last_entry = None
+        for header, virtual_proof in headers:
+            block = Block.from_header(header)
+            entry = self._get_entry(block.hash)
+            if entry is None:
+                parent = self._get_entry(block.prev_hash)
+                if (parent is None or block.height != parent.height + 1 or block.difficulty != difficulty
+                        or not (accept_virtual_proof if virtual_proof else is_valid_proof(block.digest, difficulty))):
+                    # Unconnected or invalid header, ignore the rest of the message
+                    break
+                entry = self.headers[block.hash] = HeaderEntry(block, parent)
+            last_entry = entry
+
+        if last_entry is not None:
+            self.peer_heights[peer] = max(self.peer_heights.get(peer, 0), last_entry.height)
+            best_work = self.best_header.chain_work if self.best_header else self.node.blockchain.chain_work
+            if last_entry.chain_work > best_work:
+                self._set_best_header(last_entry)
+            if len(headers) == MAX_HEADERS:
+                self.request_headers(peer, last_entry)
+        self._request_blocks()
+        self._check_finished()
+
+    def _set_best_header(self, entry):
+        self.best_header = entry
+        block_index = self.node.blockchain.block_index
+        branch = []
+        while entry.hash not in block_index:
+            branch.append(entry.hash)
+            self.heights[entry.hash] = entry.height
+            entry = self._get_entry(entry.prev_hash)
+        branch.reverse()
+        self.to_connect = deque(branch)
+        self.to_request = deque(block_hash for block_hash in branch
+                                if block_hash not in self.in_flight and block_hash not in self.downloaded)
+
+    def _pick_peer(self, height):
+        best_peer = None
+        for peer, peer_height in self.peer_heights.items():
+            load = self.peer_load.get(peer, 0)
+            if peer_height >= height and load < MAX_BLOCKS_IN_FLIGHT:
+                if best_peer is None or load < self.peer_load.get(best_peer, 0):
+                    best_peer = peer
+        return best_peer
+
+    def _request_blocks(self):
+        if not self.to_connect:
+            return
+        window_end = self.heights[self.to_connect[0]] + DOWNLOAD_WINDOW
+        orphan_blocks = self.node.orphan_blocks
+        requests = {}
+        while self.to_request:
+            block_hash = self.to_request[0]
+            height = self.heights[block_hash]
+            if height > window_end:
+                break
+            if block_hash in orphan_blocks:
+                # Already received before its parent, no need to download it again
+                self.to_request.popleft()
+                self.downloaded[block_hash] = orphan_blocks.get(block_hash)
+                continue
+            peer = self._pick_peer(height)
+            if peer is None:
+                break
+            self.to_request.popleft()
+            self.in_flight[block_hash] = (peer, self.now)
+            self.peer_load[peer] = self.peer_load.get(peer, 0) + 1
+            requests.setdefault(peer, []).append(block_hash)
+
+        for peer, hashes in requests.items():
+            self.node.request_data(peer, "block", hashes)
+        self._connect_downloaded()
+        if self.in_flight and self._timeout_event is None and self.node.simulator is not None:
+            self._timeout_event = self.node.simulator.schedule(BLOCK_DOWNLOAD_TIMEOUT, self._check_timeouts)
+
+    def _release(self, block_hash):
+        peer, _ = self.in_flight.pop(block_hash)
+        self.peer_load[peer] -= 1
+        return peer
+
+    def on_block(self, peer, block):
+        self._release(block.hash)
+        self.blocks_downloaded += 1
+        self.downloaded[block.hash] = block
+        self._request_blocks()
+        self._check_finished()
+
+    def on_notfound(self, peer, hashes):
+        retry = []
+        for block_hash in hashes:
+            if self.in_flight.get(block_hash, (None,))[0] is peer:
+                self._release(block_hash)
+                retry.append(block_hash)
+        if retry:
+            # The peer no longer has these on its chain
+            self.peer_heights[peer] = min(self.heights[block_hash] for block_hash in retry) - 1
+            self.to_request.extendleft(reversed(retry))
+            self._request_blocks()
+            self._check_finished()
+
+    def _check_timeouts(self):
+        self._timeout_event = None
+        if self.finished:
+            return
+        stalled = [block_hash for block_hash, (_, requested_at) in self.in_flight.items()
+                   if self.now - requested_at >= BLOCK_DOWNLOAD_TIMEOUT]
+        for block_hash in stalled:
+            self._release(block_hash)
+        stalled.sort(key=self.heights.get)
+        self.to_request.extendleft(reversed(stalled))
+        self._request_blocks()
+        if self.in_flight and self._timeout_event is None:
+            self._timeout_event = self.node.simulator.schedule(BLOCK_DOWNLOAD_TIMEOUT, self._check_timeouts)
+
+    def _connect_downloaded(self):
+        block_index = self.node.blockchain.block_index
+        while self.to_connect:
+            block_hash = self.to_connect[0]
+            if block_hash in block_index:
+                # Arrived through normal relay in the meantime
+                self.to_connect.popleft()
+                self.downloaded.pop(block_hash, None)
+                continue
+            block = self.downloaded.pop(block_hash, None)
+            if block is None:
+                return
+            self.to_connect.popleft()
+            if not self.node._connect_synced_block(block):
+                self._abandon_best_header()
+                return
+
+    def _abandon_best_header(self):
+        # The body did not match a valid header chain, drop the headers past our tip
+        self.headers.clear()
+        self.best_header = None
+        self.to_connect.clear()
+        self.to_request.clear()
+        self.downloaded.clear()
+
+    def _check_finished(self):
+        if self.finished or self.awaiting_headers:
+            return
+        if self.to_connect and not self.in_flight:
+            # No peer announced the rest of the best header chain
+            self._abandon_best_header()
+        if self.to_connect:
+            return
+        self.finished_at = self.now
+        self.node._sync_finished(self)
+
+    def get_stats(self):
+        return {
+            "headers": len(self.headers),
+            "blocks_downloaded": self.blocks_downloaded,
+            "in_flight": len(self.in_flight),
+            "remaining": len(self.to_connect),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": self.finished_at - self.started_at if self.finished else None
+        }
@@ -0,0 +1,260 @@
+import math
+import random
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+class Topology():
+    """Undirected peer graph in compressed sparse row form.
+
+    The neighbours of node i are indices[indptr[i]:indptr[i + 1]], both held
+    in flat integer arrays so large graphs stay compact and cheap to walk.
+    """
+
+    def __init__(self, node_count, indptr, indices, regions=None):
+        self.node_count = node_count
+        self.indptr = indptr
+        self.indices = indices
+        self.regions = regions # Cluster of each node for geographic topologies
+
+    @classmethod
+    def from_edges(cls, node_count, sources, targets, regions=None):
+        """Build from parallel edge arrays, dropping self loops and duplicate edges"""
+        degrees = array("q", bytes(8 * (node_count + 1)))
+        for source, target in zip(sources, targets):
+            degrees[source + 1] += 1
+            degrees[target + 1] += 1
+        for i in range(node_count):
+            degrees[i + 1] += degrees[i]
+
+        slots = array("i", bytes(4 * degrees[node_count]))
+        fill = array("q", degrees)
+        for source, target in zip(sources, targets):
+            slots[fill[source]] = target
+            fill[source] += 1
+            slots[fill[target]] = source
+            fill[target] += 1
+
+        indptr = array("q", [0])
+        indices = array("i")
+        for i in range(node_count):
+            row = set(slots[degrees[i]:degrees[i + 1]])
+            row.discard(i)
+            indices.extend(sorted(row))
+            indptr.append(len(indices))
+        return cls(node_count, indptr, indices, regions)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def add_node(self, peers):
+        """Append a node linked to peers, returns its index"""
+        node = self.node_count
+        peers = sorted(set(peers))
+        indptr, indices = self.indptr, self.indices
+        # The new index is the largest, so it goes at the end of each peer's row
+        new_indices = array("i")
+        start = 0
+        for peer in peers:
+            end = indptr[peer + 1]
+            new_indices.extend(indices[start:end])
+            new_indices.append(node)
+            start = end
+        new_indices.extend(indices[start:])
+        new_indices.extend(peers)
+
+        self.indptr = array("q", (offset + bisect_left(peers, row) for row, offset in enumerate(indptr)))
+        self.indptr.append(len(new_indices))
+        self.indices = new_indices
+        self.node_count += 1
+        if self.regions is not None:
+            self.regions.append(self.regions[peers[0]] if peers else 0)
+        return node
+
+    def degree(self, node):
+        return self.indptr[node + 1] - self.indptr[node]
+
+    @property
+    def edge_count(self):
+        return len(self.indices) // 2
+
+    def degree_distribution(self):
+        """Number of nodes per degree"""
+        distribution = {}
+        indptr = self.indptr
+        for i in range(self.node_count):
+            degree = indptr[i + 1] - indptr[i]
+            distribution[degree] = distribution.get(degree, 0) + 1
+        return dict(sorted(distribution.items()))
+
+    def bfs_distances(self, source):
+        """Hop distance from source to every node, -1 where unreachable"""
+        indptr, indices = self.indptr, self.indices
+        distances = array("i", [-1]) * self.node_count
+        distances[source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            next_distance = distances[node] + 1
+            for peer in indices[indptr[node]:indptr[node + 1]]:
+                if distances[peer] < 0:
+                    distances[peer] = next_distance
+                    queue.append(peer)
+        return distances
+
+    def diameter(self, samples=16, rng=None):
+        """Largest eccentricity over sampled sources, exact when samples >= node_count.
+
+        Each sample starts from the farthest node of the previous sweep, which
+        finds the true diameter of most peer graphs within a few sweeps.
+        """
+        if not self.node_count:
+            return 0
+        rng = rng or random
+        if samples >= self.node_count:
+            sources = range(self.node_count)
+        else:
+            sources = None
+            source = rng.randrange(self.node_count)
+
+        diameter = 0
+        for i in range(min(samples, self.node_count)):
+            if sources is not None:
+                source = sources[i]
+            distances = self.bfs_distances(source)
+            eccentricity = max(distances)
+            if eccentricity > diameter:
+                diameter = eccentricity
+            if sources is None:
+                farthest = distances.index(eccentricity)
+                source = farthest if farthest != source else rng.randrange(self.node_count)
+        return diameter
+
+    def clustering(self, samples=None, rng=None):
+        """Average local clustering coefficient, estimated from samples nodes when given"""
+        nodes = range(self.node_count)
+        if samples is not None and samples < self.node_count:
+            nodes = (rng or random).sample(nodes, samples)
+
+        total = 0.0
+        counted = 0
+        for node in nodes:
+            peers = self.neighbors(node)
+            degree = len(peers)
+            counted += 1
+            if degree < 2:
+                continue
+            peer_set = set(peers)
+            links = 0
+            for peer in peers:
+                links += sum(1 for other in self.neighbors(peer) if other in peer_set)
+            total += links / (degree * (degree - 1))
+        return total / counted if counted else 0.0
+
+    def get_stats(self, samples=16, rng=None):
+        degrees = self.degree_distribution()
+        return {
+            "nodes": self.node_count,
+            "edges": self.edge_count,
+            "min_degree": min(degrees) if degrees else 0,
+            "max_degree": max(degrees) if degrees else 0,
+            "mean_degree": 2 * self.edge_count / self.node_count if self.node_count else 0.0,
+            "diameter": self.diameter(samples, rng),
+            "clustering": self.clustering(samples * 64, rng)
+        }
+
+
+# Generators take the number of links each node opens, like Network's min peers
+
+def random_peers(node_count, degree, rng=None):
+    """Every node picks degree distinct random peers, links are made in both directions"""
+    rng = rng or random
+    sources = array("i")
+    targets = array("i")
+    degree = min(degree, node_count - 1)
+    for node in range(node_count):
+        chosen = set()
+        while len(chosen) < degree:
+            peer = rng.randrange(node_count)
+            if peer != node:
+                chosen.add(peer)
+        sources.extend([node] * degree)
+        targets.extend(chosen)
+    return Topology.from_edges(node_count, sources, targets)
+
+
+def random_regular(node_count, degree, rng=None):
+    """Approximately degree-regular graph by random stub matching (configuration model)"""
+    rng = rng or random
+    stubs = array("i", range(node_count)) * degree
+    stubs = list(stubs)
+    rng.shuffle(stubs)
+    # Self loops and repeated pairs are dropped, so a few nodes end slightly below degree
+    return Topology.from_edges(node_count, array("i", stubs[0::2]), array("i", stubs[1::2]))
+
+
+def small_world(node_count, degree, rewire_probability=0.1, rng=None):
+    """Watts-Strogatz ring lattice to the next degree nodes, each link rewired with the given probability"""
+    rng = rng or random
+    sources = array("i")
+    targets = array("i")
+    for node in range(node_count):
+        for offset in range(1, degree + 1):
+            target = (node + offset) % node_count
+            if rng.random() < rewire_probability:
+                target = rng.randrange(node_count)
+            sources.append(node)
+            targets.append(target)
+    return Topology.from_edges(node_count, sources, targets)
+
+
+def scale_free(node_count, degree, rng=None):
+    """Barabasi-Albert preferential attachment, each new node links to degree existing nodes"""
+    rng = rng or random
+    links = max(1, min(degree, node_count - 1))
+    sources = array("i")
+    targets = array("i")
+    # Every edge endpoint, so a uniform pick is proportional to degree
+    endpoints = array("i", range(min(links, node_count)))
+    for node in range(links, node_count):
+        chosen = set()
+        while len(chosen) < links:
+            chosen.add(endpoints[rng.randrange(len(endpoints))])
+        for target in chosen:
+            sources.append(node)
+            targets.append(target)
+            endpoints.append(target)
+            endpoints.append(node)
+    return Topology.from_edges(node_count, sources, targets)
+
+
+def geographic_clusters(node_count, degree, clusters=None, inter_cluster_probability=0.1, rng=None):
+    """Nodes spread over regions, links mostly stay within a node's own region"""
+    rng = rng or random
+    clusters = clusters or max(1, round(math.sqrt(node_count) / 4))
+    regions = array("i", (rng.randrange(clusters) for _ in range(node_count)))
+    members = [array("i") for _ in range(clusters)]
+    for node, region in enumerate(regions):
+        members[region].append(node)
+
+    sources = array("i")
+    targets = array("i")
+    for node, region in enumerate(regions):
+        local = members[region]
+        for _ in range(degree):
+            if len(local) > 1 and rng.random() >= inter_cluster_probability:
+                target = local[rng.randrange(len(local))]
+            else:
+                target = rng.randrange(node_count)
+            sources.append(node)
+            targets.append(target)
+    return Topology.from_edges(node_count, sources, targets, regions)
+
+
+TOPOLOGIES = {
+    "random": random_peers,
+    "regular": random_regular,
+    "small_world": small_world,
+    "scale_free": scale_free,
+    "geographic": geographic_clusters
+}
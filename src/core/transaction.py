@@ -1,55 +1,145 @@
+import struct
+import hashlib
+
+from src.core.primitives import UTXO, TxOut, to_address, get_verifying_key
+
+def _pack_bytes(data):
+    return struct.pack(">H", len(data)) + data
+
+def _unpack_bytes(data, offset):
+    length, = struct.unpack_from(">H", data, offset)
+    offset += 2
+    return bytes(data[offset:offset + length]), offset + length
+
 class Transaction():
     
+    __slots__ = ('sender_address', 'recipient_address', 'amount', 'inputs', 'outputs',
+                 'signature', 'txid', '_serialized')
+
     fee = 1
 
     def __init__(self, sender_address, recipient_address, amount, inputs, outputs, signature=b"", txid=None):
-        self.sender_address = sender_address
-        self.recipient_address = recipient_address
+        self.sender_address = to_address(sender_address)
+        self.recipient_address = to_address(recipient_address)
         self.amount = amount
-        self.inputs = inputs
-        self.outputs = outputs
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
         self.signature = signature
+        self._serialized = None
         self.txid = txid or self._compute_txid()
 
-    def _serialize_for_signing(self): # Ideally convert it to bytes or hex
-        """Serialize inputs and outputs deterministically for signing"""
-        data = []
+    def _serialize_for_signing(self):
+        """Serialize inputs and outputs deterministically for signing, computed once"""
+        if self._serialized is not None:
+            return self._serialized
 
-        sender_hex = self.sender_address.to_string().hex() if self.sender_address else ""
-        data.append(sender_hex)
+        data = [self.sender_address or b""]
 
-        for input in sorted(self.inputs, key=lambda x: (x['txid'], x['index'])):
-            data.append(f"{input['txid']}:{input['index']}")
+        for input in sorted(self.inputs, key=lambda x: (x.txid, x.index)):
+            data.append(f"{input.txid}:{input.index}".encode())
 
-        for output in sorted(self.outputs, key=lambda x: x['owner_address'].to_string().hex()):
-            data.append(f"{output['owner_address'].to_string().hex()}:{output['amount']}")
+        for output in sorted(self.outputs):
+            data.append(output.owner_address + f":{output.amount}".encode())
 
-        data = ";".join(data)
-        return data.encode()
+        self._serialized = b";".join(data)
+        return self._serialized
 
     def _compute_txid(self):
         """Hash serialized content"""
-        import hashlib
         content = self._serialize_for_signing()
         return hashlib.sha256(content).hexdigest()
 
-    def verify(self):
+    @property
+    def fee_paid(self):
+        if self.sender_address is None: # Miner reward transaction
+            return 0
+        return sum(input.amount for input in self.inputs) - sum(output.amount for output in self.outputs)
+
+    @property
+    def feerate(self):
+        return self.fee_paid / self.size
+
+    @property
+    def size(self):
+        return len(self._serialize_for_signing()) + len(self.signature)
+
+    def verify(self, signature_cache=None):
         """Verify signature with sender pubkey"""
         if self.sender_address is None: # Miner reward transaction
             return True
+
+        if signature_cache is not None:
+            key = signature_cache.make_key(self)
+            if signature_cache.contains(key):
+                return True
+
         try:
-            return self.sender_address.verify(self.signature, self._serialize_for_signing())
+            verifying_key = get_verifying_key(self.sender_address)
+            is_valid = verifying_key.verify(self.signature, self._serialize_for_signing())
         except:
             return False
+
+        if is_valid and signature_cache is not None:
+            signature_cache.add(key)
+        return is_valid
         
+    def to_bytes(self):
+        """Compact binary encoding used for storage"""
+        parts = [
+            _pack_bytes(self.sender_address or b""),
+            _pack_bytes(self.recipient_address or b""),
+            struct.pack(">qH", self.amount, len(self.inputs))
+        ]
+        for input in self.inputs:
+            parts.append(_pack_bytes(input.txid.encode()))
+            parts.append(struct.pack(">Qq", input.index, input.amount))
+            parts.append(_pack_bytes(input.owner_address or b""))
+        parts.append(struct.pack(">H", len(self.outputs)))
+        for output in self.outputs:
+            parts.append(_pack_bytes(output.owner_address))
+            parts.append(struct.pack(">q", output.amount))
+        parts.append(_pack_bytes(self.signature))
+        parts.append(bytes.fromhex(self.txid))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        sender_address, offset = _unpack_bytes(data, 0)
+        recipient_address, offset = _unpack_bytes(data, offset)
+        amount, input_count = struct.unpack_from(">qH", data, offset)
+        offset += 10
+
+        inputs = []
+        for _ in range(input_count):
+            txid, offset = _unpack_bytes(data, offset)
+            index, input_amount = struct.unpack_from(">Qq", data, offset)
+            owner_address, offset = _unpack_bytes(data, offset + 16)
+            inputs.append(UTXO(txid.decode(), index, input_amount, to_address(owner_address)))
+
+        output_count, = struct.unpack_from(">H", data, offset)
+        offset += 2
+        outputs = []
+        for _ in range(output_count):
+            owner_address, offset = _unpack_bytes(data, offset)
+            output_amount, = struct.unpack_from(">q", data, offset)
+            offset += 8
+            outputs.append(TxOut(to_address(owner_address), output_amount))
+
+        signature, offset = _unpack_bytes(data, offset)
+        txid = bytes(data[offset:offset + 32]).hex()
+        return cls(sender_address or None, recipient_address or None, amount,
+                   inputs, outputs, signature, txid)
+
     @classmethod
-    def coinbase(self, recipient_address, reward):
-        outputs = [{"owner_address": recipient_address, "amount": reward}]
+    def coinbase(self, recipient_address, reward, height=0):
+        # Null outpoint carrying the block height keeps coinbase txids unique
+        inputs = [UTXO("0" * 64, height, 0, b"")]
+        outputs = [TxOut(to_address(recipient_address), reward)]
         return self(
             sender_address=None,
             recipient_address=recipient_address,
             amount=reward,
-            inputs=[],
+            inputs=inputs,
             outputs=outputs,
             signature=b""
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,169 @@
+from src.core.primitives import UTXO, to_address
+
+class UTXOSet():
+    """Unspent outputs indexed by outpoint (txid, index) and by owner.
+
+    An optional read-only base set can be shared between nodes, in which case
+    this set only holds the node's own additions and spends on top of it.
+    Behaves like the list of utxo dicts it replaces (append, extend, remove,
+    iteration, membership) so existing callers keep working.
+    """
+
+    def __init__(self, utxos=None, base=None):
+        self.base = base
+        self._utxos = {}
+        self._spent_from_base = set()
+        self._by_owner = {}
+        self._balances = {} # Relative to the base when there is one
+        self._size = len(base) if base else 0
+        if utxos:
+            self.extend(utxos)
+
+    @staticmethod
+    def outpoint(utxo):
+        return (utxo.txid, utxo.index)
+
+    @staticmethod
+    def owner_key(address):
+        if address is None:
+            return b""
+        return to_address(address)
+
+    def add(self, utxo):
+        outpoint = self.outpoint(utxo)
+        if self.get(outpoint) is not None:
+            self.spend(outpoint)
+        self._utxos[outpoint] = utxo
+        self._size += 1
+
+        owner = utxo.owner_address
+        self._by_owner.setdefault(owner, {})[outpoint] = utxo
+        self._adjust_balance(owner, utxo.amount)
+
+    def spend(self, outpoint):
+        utxo = self._utxos.pop(outpoint, None)
+        if utxo is None:
+            utxo = self._get_from_base(outpoint)
+            if utxo is None:
+                return None
+        else:
+            owner_utxos = self._by_owner[utxo.owner_address]
+            del owner_utxos[outpoint]
+            if not owner_utxos:
+                del self._by_owner[utxo.owner_address]
+
+        if self.base is not None and outpoint in self.base._utxos:
+            self._spent_from_base.add(outpoint)
+        self._size -= 1
+        self._adjust_balance(utxo.owner_address, -utxo.amount)
+        return utxo
+
+    def _adjust_balance(self, owner, amount):
+        balance = self._balances.get(owner, 0) + amount
+        if balance:
+            self._balances[owner] = balance
+        else:
+            self._balances.pop(owner, None)
+
+    def _get_from_base(self, outpoint):
+        if self.base is None or outpoint in self._spent_from_base:
+            return None
+        return self.base.get(outpoint)
+
+    def get(self, outpoint):
+        utxo = self._utxos.get(outpoint)
+        if utxo is None:
+            return self._get_from_base(outpoint)
+        return utxo
+
+    @property
+    def delta_size(self):
+        """Entries held by this set itself rather than its base"""
+        return len(self._utxos) + len(self._spent_from_base)
+
+    def balance(self, address):
+        owner = self.owner_key(address)
+        base_balance = self.base._balances.get(owner, 0) if self.base else 0
+        return base_balance + self._balances.get(owner, 0)
+
+    def utxos_for(self, address):
+        owner = self.owner_key(address)
+        utxos = list(self._by_owner.get(owner, {}).values())
+        if self.base is not None:
+            for outpoint, utxo in self.base._by_owner.get(owner, {}).items():
+                if outpoint not in self._spent_from_base and outpoint not in self._utxos:
+                    utxos.append(utxo)
+        return utxos
+
+    def load(self, utxos):
+        """Bulk insert into an empty set, utxos must have unique outpoints"""
+        by_owner = self._by_owner
+        balances = self._balances
+        for utxo in utxos:
+            outpoint = (utxo.txid, utxo.index)
+            self._utxos[outpoint] = utxo
+            owner = utxo.owner_address
+            owned = by_owner.get(owner)
+            if owned is None:
+                owned = by_owner[owner] = {}
+                balances[owner] = 0
+            owned[outpoint] = utxo
+            balances[owner] += utxo.amount
+        self._size = len(self._utxos)
+        for owner in [owner for owner, balance in balances.items() if not balance]:
+            del balances[owner]
+
+    def flatten(self):
+        """Standalone copy without a base, suitable as a shared snapshot"""
+        return UTXOSet(self)
+
+    # List compatibility, also accepts the old utxo dicts
+    def append(self, utxo):
+        if isinstance(utxo, dict):
+            utxo = UTXO.from_dict(utxo)
+        self.add(utxo)
+
+    def extend(self, utxos):
+        for utxo in utxos:
+            self.append(utxo)
+
+    def remove(self, utxo):
+        if isinstance(utxo, dict):
+            utxo = UTXO.from_dict(utxo)
+        if utxo not in self:
+            raise ValueError("UTXO not in set")
+        self.spend(self.outpoint(utxo))
+
+    def clear(self):
+        self.base = None
+        self._utxos.clear()
+        self._spent_from_base.clear()
+        self._by_owner.clear()
+        self._balances.clear()
+        self._size = 0
+
+    def copy(self):
+        new_set = UTXOSet(base=self.base)
+        new_set._utxos = self._utxos.copy()
+        new_set._spent_from_base = self._spent_from_base.copy()
+        new_set._by_owner = {owner: owned.copy() for owner, owned in self._by_owner.items()}
+        new_set._balances = self._balances.copy()
+        new_set._size = self._size
+        return new_set
+
+    def __contains__(self, utxo):
+        if isinstance(utxo, dict):
+            utxo = UTXO.from_dict(utxo)
+        stored = self.get(self.outpoint(utxo))
+        return stored is not None and stored == utxo
+
+    def __iter__(self):
+        utxos = list(self._utxos.values())
+        if self.base is not None:
+            for outpoint, utxo in self.base._utxos.items():
+                if outpoint not in self._spent_from_base and outpoint not in self._utxos:
+                    utxos.append(utxo)
+        return iter(utxos)
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from src.core.primitives import get_verifying_key
+from src.core.transaction import Transaction
+
+def verify_signatures(items):
+    """Check (sender_address, signature, message) items in order, returns the index of the first invalid one or None"""
+    for i, (sender_address, signature, message) in enumerate(items):
+        try:
+            if not get_verifying_key(sender_address).verify(signature, message):
+                return i
+        except:
+            return i
+    return None
+
+def has_valid_amounts(transaction):
+    """Every output is positive and the inputs cover the outputs plus the fee"""
+    if any(output.amount <= 0 for output in transaction.outputs):
+        return False
+    return sum(input.amount for input in transaction.inputs) >= sum(output.amount for output in transaction.outputs) + Transaction.fee
+
+
+class BlockValidator():
+    """Checks the transactions of a block in stages, cheapest first.
+
+    Stateless checks, then context checks against the utxo set, and only then
+    the ECDSA signatures not already in the signature cache. Those are split
+    in batches over a process pool when there are enough of them, stopping at
+    the first invalid one; with workers=0 everything runs in-thread.
+    """
+
+    def __init__(self, workers=0, batch_size=32):
+        self.workers = workers # None for one process per core
+        self.batch_size = batch_size
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def check_transactions(self, transactions, utxo_set, mempool=None, signature_cache=None):
+        """Validate the non-coinbase transactions of a block against the utxo set it spends from"""
+        # Stateless: structure, ownership and amounts
+        for tx in transactions:
+            if tx.sender_address is None or not tx.inputs:
+                return False
+            for input in tx.inputs:
+                if input.owner_address != tx.sender_address:
+                    return False
+            if not has_valid_amounts(tx):
+                return False
+
+        # Context: relayed to us, unspent, and not spent twice within the block
+        spent_outpoints = set()
+        for tx in transactions:
+            if mempool is not None and tx not in mempool:
+                return False
+            for input in tx.inputs:
+                if input not in utxo_set:
+                    return False
+                outpoint = (input.txid, input.index)
+                if outpoint in spent_outpoints:
+                    return False
+                spent_outpoints.add(outpoint)
+
+        return self.verify_signatures(transactions, signature_cache)
+
+    def verify_signatures(self, transactions, signature_cache=None):
+        """True if every transaction's signature is valid, valid ones are added to the cache"""
+        unverified = []
+        for tx in transactions:
+            if tx.sender_address is None: # Miner reward transaction
+                continue
+            if signature_cache is not None and signature_cache.contains(signature_cache.make_key(tx)):
+                continue
+            unverified.append(tx)
+        if not unverified:
+            return True
+
+        items = [(tx.sender_address, tx.signature, tx._serialize_for_signing()) for tx in unverified]
+        if self.workers == 0 or len(items) < 2 * self.batch_size:
+            is_valid = verify_signatures(items) is None
+        else:
+            is_valid = self._verify_in_pool(items)
+
+        if is_valid and signature_cache is not None:
+            for tx in unverified:
+                signature_cache.add(signature_cache.make_key(tx))
+        return is_valid
+
+    def _verify_in_pool(self, items):
+        futures = set()
+        for offset in range(0, len(items), self.batch_size):
+            futures.add(self.pool.submit(verify_signatures, items[offset:offset + self.batch_size]))
+
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            if any(future.result() is not None for future in done):
+                for future in futures:
+                    future.cancel()
+                return False
+        return True
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
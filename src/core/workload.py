@@ -0,0 +1,261 @@
+import random
+
+from src.core.transaction import Transaction
+from src.core.primitives import UTXO, TxOut
+from src.utils.metrics import Histogram
+
+PATTERNS = ("uniform", "hotspot", "burst", "fanout")
+WORKLOAD_POLL_INTERVAL = 1.0 # Seconds between scans of the observer's chain
+
+class TransactionRecord():
+    """Lifecycle timestamps of one submitted transaction"""
+    __slots__ = ('txid', 'sender', 'outputs', 'submitted', 'accepted', 'rejected', 'included', 'height', 'confirmed')
+
+    def __init__(self, txid, sender, outputs, submitted):
+        self.txid = txid
+        self.sender = sender
+        self.outputs = outputs
+        self.submitted = submitted
+        self.accepted = None
+        self.rejected = False
+        self.included = None
+        self.height = None
+        self.confirmed = None
+
+
+class Workload():
+    """Drives a Network's wallets at a target rate of transactions per second.
+
+    Runs on the network's simulator (or AsyncRuntime) clock. Wallets are funded
+    with genesis coins the workload tracks itself, and a coin only becomes
+    spendable again once the transaction creating it has the required
+    confirmations, so generated transactions never double spend.
+    Patterns: uniform payments, hotspot recipients, bursts of payments, and
+    fanout payments to several recipients at once.
+    """
+
+    def __init__(self, network, tps=1.0, pattern="uniform", confirmations=1, coins_per_wallet=20,
+                 coin_value=10, fanout=5, burst_size=20, hotspot_share=0.1, hotspot_probability=0.8,
+                 observer=None, seed=None):
+        if pattern not in PATTERNS:
+            raise ValueError(f"Unknown workload pattern {pattern}")
+        self.network = network
+        self.simulator = network.simulator
+        self.tps = tps
+        self.pattern = pattern
+        self.confirmations = confirmations
+        self.coins_per_wallet = coins_per_wallet
+        self.coin_value = coin_value
+        self.fanout = fanout
+        self.burst_size = burst_size
+        self.observer = observer or network.nodes[0]
+        self.random = random.Random(seed)
+
+        self.wallets = list(network.wallets)
+        self._wallet_by_address = {wallet.address: wallet for wallet in self.wallets}
+        hotspot_count = max(1, round(len(self.wallets) * hotspot_share))
+        self.hotspots = self.wallets[:hotspot_count]
+        self.hotspot_probability = hotspot_probability
+
+        self.coins = {wallet: {} for wallet in self.wallets} # Confirmed, unspent and not pending
+        self.records = {}
+        self._unconfirmed = {} # Included records waiting for their confirmations
+        self.stalled = 0 # Arrivals dropped because the sender had no spendable coins
+        self.started_at = None
+        self.stopped_at = None
+        self._scanned = [] # Block hash per height of the observer chain already scanned
+        self._arrival_event = None
+        self._poll_event = None
+
+    def fund(self):
+        """Give every wallet coins_per_wallet genesis coins, before any block is mined"""
+        utxos = []
+        for wallet_index, wallet in enumerate(self.wallets):
+            for coin in range(self.coins_per_wallet):
+                utxo = UTXO(f"workload:{wallet_index}", coin, self.coin_value, wallet.address)
+                utxos.append(utxo)
+                self.coins[wallet][(utxo.txid, utxo.index)] = utxo
+        self.network.add_genesis_utxos(utxos)
+
+    def start(self, duration):
+        self.started_at = self.simulator.now
+        self.stopped_at = self.started_at + duration
+        self._schedule_arrival()
+        self._poll_event = self.simulator.schedule(WORKLOAD_POLL_INTERVAL, self._poll)
+
+    def stop(self):
+        for event in (self._arrival_event, self._poll_event):
+            if event is not None:
+                self.simulator.cancel(event)
+        self._arrival_event = self._poll_event = None
+        self._scan_chain()
+
+    def _schedule_arrival(self):
+        if self.pattern == "burst":
+            delay = self.random.expovariate(self.tps / self.burst_size)
+        else:
+            delay = self.random.expovariate(self.tps)
+        if self.simulator.now + delay > self.stopped_at:
+            self._arrival_event = None
+            return
+        self._arrival_event = self.simulator.schedule(delay, self._arrive)
+
+    def _arrive(self):
+        for _ in range(self.burst_size if self.pattern == "burst" else 1):
+            self._submit_payment()
+        self._schedule_arrival()
+
+    def _pick_recipients(self, sender):
+        count = self.fanout if self.pattern == "fanout" else 1
+        recipients = []
+        while len(recipients) < count:
+            if self.pattern == "hotspot" and self.random.random() < self.hotspot_probability:
+                recipient = self.random.choice(self.hotspots)
+            else:
+                recipient = self.random.choice(self.wallets)
+            if recipient is not sender or len(self.wallets) == 1:
+                recipients.append(recipient)
+        return recipients
+
+    def _submit_payment(self):
+        sender = self.random.choice(self.wallets)
+        coins = self.coins[sender]
+        recipients = self._pick_recipients(sender)
+        amount = len(recipients) # One coin unit per recipient
+
+        inputs = []
+        total = 0
+        for outpoint in list(coins):
+            inputs.append(coins.pop(outpoint))
+            total += inputs[-1].amount
+            if total >= amount + Transaction.fee:
+                break
+        if total < amount + Transaction.fee:
+            # Not enough confirmed coins, keep them for a later arrival
+            for utxo in inputs:
+                coins[(utxo.txid, utxo.index)] = utxo
+            self.stalled += 1
+            return
+
+        outputs = [TxOut(recipient.address, 1) for recipient in recipients]
+        change = total - amount - Transaction.fee
+        if change > 0:
+            outputs.append(TxOut(sender.address, change))
+        tx = Transaction(sender.address, recipients[0].address, amount, inputs, outputs)
+        tx.signature = sender.sign(tx._serialize_for_signing())
+
+        record = TransactionRecord(tx.txid, sender, tx.outputs, self.simulator.now)
+        self.records[tx.txid] = record
+        entry_node = self.random.choice(list(sender.peers))
+        self.simulator.send(sender, entry_node, self._deliver, (entry_node, tx, record), tx.size)
+
+    def _deliver(self, submission):
+        entry_node, tx, record = submission
+        if entry_node.receive_transaction(tx):
+            record.accepted = self.simulator.now
+            return
+        record.rejected = True
+        # The payment will never confirm, its inputs can be spent again
+        coins = self.coins[record.sender]
+        for utxo in tx.inputs:
+            coins[(utxo.txid, utxo.index)] = utxo
+
+    def _poll(self):
+        self._scan_chain()
+        self._poll_event = self.simulator.schedule(WORKLOAD_POLL_INTERVAL, self._poll)
+
+    def _scan_chain(self):
+        chain = self.observer.blockchain.chain
+        # Rescan from the first height where the observer switched to another branch,
+        # found walking back from the last scanned tip as blocks commit to their parents
+        start = min(len(self._scanned), len(chain))
+        while start and chain[start - 1].hash != self._scanned[start - 1]:
+            start -= 1
+        for height in range(start, len(self._scanned)):
+            self._unscan(height)
+        del self._scanned[start:]
+
+        for height in range(start, len(chain)):
+            block = chain[height]
+            self._scanned.append(block.hash)
+            for tx in block.transactions[1:]:
+                record = self.records.get(tx.txid)
+                if record is not None and record.included is None:
+                    record.included = block.timestamp
+                    record.height = height
+                    self._unconfirmed[tx.txid] = record
+
+        # Confirmation time is when the block burying the transaction deep enough was mined
+        tip_height = len(chain) - 1
+        for txid, record in list(self._unconfirmed.items()):
+            confirming_height = record.height + self.confirmations - 1
+            if confirming_height <= tip_height:
+                record.confirmed = chain[confirming_height].timestamp
+                del self._unconfirmed[txid]
+                self._release_outputs(record)
+
+    def _unscan(self, height):
+        for txid, record in list(self._unconfirmed.items()):
+            if record.height == height:
+                record.included = None
+                record.height = None
+                del self._unconfirmed[txid]
+
+    def _release_outputs(self, record):
+        for index, output in enumerate(record.outputs):
+            wallet = self._wallet_by_address.get(output.owner_address)
+            if wallet is not None:
+                self.coins[wallet][(record.txid, index)] = UTXO(record.txid, index, output.amount, output.owner_address)
+
+    def report(self):
+        """Counts, sustained throughput and latency percentiles in the simulator's seconds"""
+        acceptance = Histogram(None)
+        inclusion = Histogram(None)
+        confirmation = Histogram(None)
+        for record in self.records.values():
+            if record.accepted is not None:
+                acceptance.observe(record.accepted - record.submitted)
+            if record.included is not None:
+                inclusion.observe(max(0.0, record.included - record.submitted))
+            if record.confirmed is not None:
+                confirmation.observe(max(0.0, record.confirmed - record.submitted))
+
+        duration = (self.stopped_at - self.started_at) if self.started_at is not None else 0.0
+        submitted = len(self.records)
+        return {
+            "pattern": self.pattern,
+            "offered_tps": self.tps,
+            "submitted": submitted,
+            "accepted": acceptance.count,
+            "rejected": sum(1 for record in self.records.values() if record.rejected),
+            "included": inclusion.count,
+            "confirmed": confirmation.count,
+            "stalled": self.stalled,
+            "submitted_tps": submitted / duration if duration else 0.0,
+            "confirmed_tps": confirmation.count / duration if duration else 0.0,
+            "acceptance_latency": acceptance.summary(),
+            "inclusion_latency": inclusion.summary(),
+            "confirmation_latency": confirmation.summary()
+        }
+
+
+def find_saturation_point(build_network, rates, duration, drain=None, tolerance=0.1, **workload_options):
+    """Run the workload at each rate on a fresh network from build_network().
+
+    Returns (saturation rate or None, reports): the first rate whose confirmed
+    throughput falls more than tolerance below the rate offered. build_network
+    must return a Network with a simulator attached and mining set up.
+    """
+    reports = []
+    for rate in rates:
+        network = build_network()
+        workload = Workload(network, tps=rate, **workload_options)
+        workload.fund()
+        workload.start(duration)
+        network.run(until=network.simulator.now + duration + (drain or duration))
+        workload.stop()
+        report = workload.report()
+        reports.append(report)
+        if report["confirmed_tps"] < rate * (1 - tolerance):
+            return rate, reports
+    return None, reports
@@ -1,6 +1,23 @@
-from .crypto import is_valid_proof
+from .crypto import is_valid_proof, get_target, get_target_bytes, get_block_work, expected_hashes, compute_merkle_root, compute_merkle_proof, verify_merkle_proof
 from .helpers import print_all_balances
+from .metrics import Metrics, MetricsExporter
+from .filters import ExactFilter, LRUFilter, RollingBloomFilter, seen_filter_capacity
+from .ordered_set import OrderedSet
 
 
 __all__ = ['is_valid_proof', 
-           'print_all_balances']
\ No newline at end of file
+           'get_target',
+           'get_target_bytes',
+           'get_block_work',
+           'expected_hashes',
+           'compute_merkle_root',
+           'compute_merkle_proof',
+           'verify_merkle_proof',
+           'print_all_balances',
+           'Metrics',
+           'MetricsExporter',
+           'ExactFilter',
+           'LRUFilter',
+           'RollingBloomFilter',
+           'seen_filter_capacity',
+           'OrderedSet']
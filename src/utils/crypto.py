@@ -1,4 +1,62 @@
-def is_valid_proof(hash: str, difficulty: int):
-    hash_int = int(hash, 16)
-    target = (1 << (256 - difficulty)) - 1
-    return hash_int <= target
\ No newline at end of file
+import hashlib
+from functools import lru_cache
+
+def get_target(difficulty: int) -> int:
+    return (1 << (256 - difficulty)) - 1
+
+@lru_cache(maxsize=None)
+def get_target_bytes(difficulty: int) -> bytes:
+    """Target as a 32 byte big-endian value, raw digests compare against it directly"""
+    return get_target(difficulty).to_bytes(32, "big")
+
+def is_valid_proof(hash, difficulty: int):
+    """Check a block hash against the target, hash is a raw digest (fast path) or hex string"""
+    if isinstance(hash, bytes):
+        return hash <= get_target_bytes(difficulty)
+    return int(hash, 16) <= get_target(difficulty)
+
+@lru_cache(maxsize=None)
+def get_block_work(difficulty: int) -> int:
+    """Integer work contributed by a block, used for fork choice"""
+    return (1 << 256) // (get_target(difficulty) + 1)
+
+def expected_hashes(difficulty: int) -> float:
+    """Mean number of hashes needed to meet the difficulty target"""
+    return (1 << 256) / (get_target(difficulty) + 1)
+
+def sha256(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+def compute_merkle_root(txids: list) -> str:
+    """Merkle root of hex txids, duplicating the last hash on odd levels"""
+    if not txids:
+        return "0" * 64
+    level = [bytes.fromhex(txid) for txid in txids]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [sha256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+def compute_merkle_proof(txids: list, index: int) -> list:
+    """Sibling path for txids[index] as (sibling_hex, sibling_is_left) pairs"""
+    proof = []
+    level = [bytes.fromhex(txid) for txid in txids]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = index ^ 1
+        proof.append((level[sibling].hex(), sibling < index))
+        level = [sha256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+        index //= 2
+    return proof
+
+def verify_merkle_proof(txid: str, proof: list, merkle_root: str) -> bool:
+    current = bytes.fromhex(txid)
+    for sibling_hex, sibling_is_left in proof:
+        sibling = bytes.fromhex(sibling_hex)
+        if sibling_is_left:
+            current = sha256(sibling + current)
+        else:
+            current = sha256(current + sibling)
+    return current.hex() == merkle_root
@@ -0,0 +1,131 @@
+import sys
+import math
+import hashlib
+from collections import OrderedDict
+
+SEEN_FILTER_CAPACITY = 100000 # Items remembered by the bounded filters
+SEEN_FILTER_FALSE_POSITIVE_RATE = 1e-6
+SEEN_FILTER_WINDOW = 3600.0 # Seconds a hash may keep being relayed around the network
+SEEN_BLOCK_RATE = 1.0 # Expected new blocks per second, generous for fast simulated chains
+SEEN_TRANSACTION_RATE = 30.0 # Expected new transactions per second
+
+# Dedupe filters for the hashes a node has seen, all offer add, in and len.
+# The bounded ones forget old items, so their capacity must cover the time a
+# hash keeps being relayed around the network.
+
+def seen_filter_capacity(rate, window=SEEN_FILTER_WINDOW):
+    """Items a filter must hold to remember everything new within window at rate items per second"""
+    return max(1, math.ceil(rate * window))
+
+def _item_size(items):
+    # Hashes are shared with the blocks and transactions, this counts them once per filter
+    for item in items:
+        return sys.getsizeof(item)
+    return 0
+
+
+class ExactFilter(set):
+    """Remembers every item, the default"""
+
+    def __init__(self, capacity=None):
+        super().__init__()
+
+    def memory_usage(self):
+        return sys.getsizeof(self) + len(self) * _item_size(self)
+
+
+class LRUFilter():
+    """Exact for the capacity most recently added items"""
+
+    def __init__(self, capacity=SEEN_FILTER_CAPACITY):
+        self.capacity = capacity
+        self._items = OrderedDict()
+
+    def add(self, item):
+        items = self._items
+        if item in items:
+            items.move_to_end(item)
+            return
+        items[item] = None
+        if len(items) > self.capacity:
+            items.popitem(last=False)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def memory_usage(self):
+        return sys.getsizeof(self._items) + len(self._items) * _item_size(self._items)
+
+
+class RollingBloomFilter():
+    """Remembers at least the capacity most recent items in fixed memory.
+
+    Two Bloom filters of capacity items each; once the current one is full
+    the older one is cleared and takes its place. An item never added is
+    reported as seen with probability about false_positive_rate.
+    """
+
+    def __init__(self, capacity=SEEN_FILTER_CAPACITY, false_positive_rate=SEEN_FILTER_FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.generation_size = max(1, capacity)
+        # Each lookup checks both generations, so each gets half the error budget
+        rate = false_positive_rate / 2
+        self.bit_count = max(8, math.ceil(-self.generation_size * math.log(rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / self.generation_size * math.log(2)))
+        self._current = bytearray((self.bit_count + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._current_count = 0
+        self._previous_count = 0
+
+    def _positions(self, item):
+        # Keyed on content rather than hash(), so false positives repeat across seeded runs
+        if isinstance(item, str):
+            item = item.encode()
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        bit_count = self.bit_count
+        return [(first + i * second) % bit_count for i in range(self.hash_count)]
+
+    @staticmethod
+    def _test(bits, positions):
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, item):
+        positions = self._positions(item)
+        if self._test(self._current, positions):
+            return
+        if self._current_count >= self.generation_size:
+            self._previous, self._current = self._current, self._previous
+            self._current[:] = bytes(len(self._current))
+            self._previous_count = self._current_count
+            self._current_count = 0
+        bits = self._current
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        self._current_count += 1
+
+    def __contains__(self, item):
+        positions = self._positions(item)
+        return self._test(self._current, positions) or self._test(self._previous, positions)
+
+    def __len__(self):
+        """Items held by the two generations"""
+        return self._current_count + self._previous_count
+
+    def memory_usage(self):
+        return sys.getsizeof(self._current) + sys.getsizeof(self._previous)
+
+
+SEEN_FILTERS = {
+    "exact": ExactFilter,
+    "lru": LRUFilter,
+    "bloom": RollingBloomFilter
+}
@@ -0,0 +1,191 @@
+import io
+import csv
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HISTOGRAM_SAMPLES = 1024 # Recent values kept per histogram for percentiles
+METRICS_HISTORY = 1000 # Snapshots kept by an exporter
+QUANTILES = {"p50": "0.5", "p90": "0.9", "p99": "0.99"}
+
+class Histogram():
+    """Count, sum, min and max of every value, percentiles over the most recent ones"""
+    __slots__ = ('count', 'total', 'min', 'max', 'samples')
+
+    def __init__(self, max_samples=HISTOGRAM_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99)
+        }
+
+
+class Metrics():
+    """Counters, gauges and histograms shared by the participants of a Network.
+
+    Instrumented code holds None instead of a Metrics while collection is
+    disabled, so the cost left on the hot paths is a single attribute check.
+    """
+
+    def __init__(self, max_samples=HISTOGRAM_SAMPLES):
+        self.started_at = time.time()
+        self.max_samples = max_samples # None keeps every histogram value
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock() # Miner threads record concurrently
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.max_samples)
+            histogram.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "elapsed": time.time() - self.started_at,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()}
+            }
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+def flatten_snapshot(snapshot):
+    """One level dict such as {"counters.blocks_received": 3, "histograms.reorg_depth.p50": 1}"""
+    row = {"time": snapshot["time"], "elapsed": snapshot["elapsed"]}
+    for kind in ("counters", "gauges"):
+        for name, value in snapshot[kind].items():
+            row[f"{kind}.{name}"] = value
+    for name, summary in snapshot["histograms"].items():
+        for statistic, value in summary.items():
+            row[f"histograms.{name}.{statistic}"] = value
+    return row
+
+
+class MetricsExporter():
+    """Keeps a history of snapshots and writes it as JSON, CSV or Prometheus text"""
+
+    def __init__(self, metrics, snapshot=None, max_history=METRICS_HISTORY):
+        self.metrics = metrics
+        self.take_snapshot = snapshot or metrics.snapshot # e.g. Network.get_metrics
+        self.history = deque(maxlen=max_history)
+        self.server = None
+
+    def record(self):
+        snapshot = self.take_snapshot()
+        self.history.append(snapshot)
+        return snapshot
+
+    def to_json(self):
+        return json.dumps(list(self.history), indent=2)
+
+    def to_csv(self):
+        """One row per snapshot, columns are the union of every snapshot's metrics"""
+        rows = [flatten_snapshot(snapshot) for snapshot in self.history]
+        columns = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(columns))
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            f.write(self.to_csv())
+
+    def prometheus_text(self):
+        snapshot = self.take_snapshot()
+        lines = []
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        for name, value in snapshot["gauges"].items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        for name, summary in snapshot["histograms"].items():
+            lines.append(f"# TYPE {name} summary")
+            for statistic, quantile in QUANTILES.items():
+                if summary[statistic] is not None:
+                    lines.append(f'{name}{{quantile="{quantile}"}} {summary[statistic]}')
+            lines.append(f"{name}_sum {summary['mean'] * summary['count'] if summary['count'] else 0}")
+            lines.append(f"{name}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        """Serve prometheus_text on http://host:port/metrics from a daemon thread"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
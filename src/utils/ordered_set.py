@@ -0,0 +1,24 @@
+class OrderedSet(dict):
+    """Set that iterates in insertion order, unlike set whose order follows object ids.
+
+    Used for peers, so seeded runs relay to and pick peers in the same order.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(dict.fromkeys(items))
+
+    def add(self, item):
+        self[item] = None
+
+    def update(self, items):
+        for item in items:
+            self[item] = None
+
+    def discard(self, item):
+        self.pop(item, None)
+
+    def remove(self, item):
+        del self[item]
+
+    def __repr__(self):
+        return f"OrderedSet({list(self)!r})"
@@ -1,5 +1,9 @@
 from .wallet import Wallet
 from .miner import Miner
+from .mining import MiningBackend
+from .coin_set import CoinSet
 
 __all__ = ['Wallet', 
-           'Miner']
\ No newline at end of file
+           'Miner',
+           'MiningBackend',
+           'CoinSet']
\ No newline at end of file
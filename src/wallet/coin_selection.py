@@ -0,0 +1,43 @@
+import heapq
+
+# Strategies take the spendable coins ({outpoint: UTXO}, oldest first) and the
+# amount to cover, and return the UTXOs to spend or None if they fall short
+
+def oldest_first(coins, target):
+    """Spend coins in the order they were received, touching only the coins used"""
+    selected = []
+    total = 0
+    for utxo in coins.values():
+        selected.append(utxo)
+        total += utxo.amount
+        if total >= target:
+            return selected
+    return None
+
+
+def _select_from_heap(heap, target):
+    heapq.heapify(heap)
+    selected = []
+    total = 0
+    while heap and total < target:
+        utxo = heapq.heappop(heap)[-1]
+        selected.append(utxo)
+        total += utxo.amount
+    return selected if total >= target else None
+
+
+def largest_first(coins, target):
+    """Fewest inputs, so the smallest transactions"""
+    return _select_from_heap([(-utxo.amount, i, utxo) for i, utxo in enumerate(coins.values())], target)
+
+
+def smallest_first(coins, target):
+    """Consolidates small coins, at the cost of larger transactions"""
+    return _select_from_heap([(utxo.amount, i, utxo) for i, utxo in enumerate(coins.values())], target)
+
+
+COIN_SELECTORS = {
+    "oldest_first": oldest_first,
+    "largest_first": largest_first,
+    "smallest_first": smallest_first
+}
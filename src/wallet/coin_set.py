@@ -0,0 +1,141 @@
+import threading
+
+from src.core.primitives import UTXO
+
+class CoinSet():
+    """One address's confirmed coins, kept up to date from block notifications.
+
+    Subscribed to the blockchains of all of a wallet's peers. A transaction
+    touching the address counts how many connected blocks of those peers hold
+    it, is applied when the first one connects and reverted when the last one
+    disconnects, so peers relaying the same blocks or mining the same
+    transaction on competing branches are only counted once. Coins spent by
+    transactions the wallet sent but that are not yet in a block are held as
+    pending, so they are never selected twice.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.coins = {} # Spendable, oldest first
+        self.pending = {} # Spent by unconfirmed transactions
+        self.pending_transactions = {} # txid -> outpoints it spends
+        self.balance = 0 # Every confirmed coin, pending or not
+        self.pending_balance = 0
+        self._tx_refs = {} # txid -> connected blocks holding it
+        self._lock = threading.Lock() # Miner threads connect blocks concurrently
+
+    def __len__(self):
+        return len(self.coins) + len(self.pending)
+
+    @property
+    def spendable_balance(self):
+        return self.balance - self.pending_balance
+
+    def add_utxos(self, utxos):
+        with self._lock:
+            for utxo in utxos:
+                if utxo.owner_address == self.address:
+                    self._add(utxo)
+
+    def reset(self, utxos, chains=()):
+        """Start over from a peer's utxos, with chains the peers' current blocks"""
+        with self._lock:
+            self.coins = {}
+            self.pending = {}
+            self.pending_transactions = {}
+            self.balance = 0
+            self.pending_balance = 0
+            self._tx_refs = {}
+            for chain in chains:
+                for block in chain:
+                    for tx in block.transactions:
+                        if self._is_relevant(tx):
+                            self._tx_refs[tx.txid] = self._tx_refs.get(tx.txid, 0) + 1
+            for utxo in utxos:
+                self._add(utxo)
+
+    def _add(self, utxo, pending_txid=None):
+        outpoint = (utxo.txid, utxo.index)
+        if outpoint in self.coins or outpoint in self.pending:
+            return
+        self.balance += utxo.amount
+        if pending_txid is None:
+            self.coins[outpoint] = utxo
+            return
+        self.pending[outpoint] = utxo
+        self.pending_balance += utxo.amount
+        self.pending_transactions.setdefault(pending_txid, []).append(outpoint)
+
+    def _remove(self, outpoint):
+        utxo = self.coins.pop(outpoint, None)
+        if utxo is None:
+            utxo = self.pending.pop(outpoint, None)
+            if utxo is None:
+                return
+            self.pending_balance -= utxo.amount
+        self.balance -= utxo.amount
+
+    def _is_relevant(self, tx):
+        if tx.sender_address == self.address:
+            return True
+        return any(output.owner_address == self.address for output in tx.outputs)
+
+    def block_connected(self, block):
+        with self._lock:
+            for tx in block.transactions:
+                if not self._is_relevant(tx):
+                    continue
+                refs = self._tx_refs.get(tx.txid, 0)
+                self._tx_refs[tx.txid] = refs + 1
+                if refs:
+                    continue
+                if tx.sender_address == self.address:
+                    for input in tx.inputs:
+                        self._remove((input.txid, input.index))
+                    self.pending_transactions.pop(tx.txid, None)
+                for index, output in enumerate(tx.outputs):
+                    if output.owner_address == self.address:
+                        self._add(UTXO(tx.txid, index, output.amount, output.owner_address))
+
+    def block_disconnected(self, block):
+        with self._lock:
+            for tx in reversed(block.transactions):
+                refs = self._tx_refs.get(tx.txid)
+                if refs is None:
+                    continue
+                if refs > 1:
+                    self._tx_refs[tx.txid] = refs - 1
+                    continue
+                del self._tx_refs[tx.txid]
+                for index, output in enumerate(tx.outputs):
+                    if output.owner_address == self.address:
+                        self._remove((tx.txid, index))
+                if tx.sender_address == self.address:
+                    # The transaction returns to the mempool, its inputs stay reserved
+                    for input in tx.inputs:
+                        self._add(input, tx.txid)
+
+    def reserve(self, target, select):
+        """Move the coins chosen by select to pending, None if they cannot cover target"""
+        with self._lock:
+            selected = select(self.coins, target)
+            if selected is None:
+                return None
+            for utxo in selected:
+                outpoint = (utxo.txid, utxo.index)
+                self.pending[outpoint] = self.coins.pop(outpoint)
+                self.pending_balance += utxo.amount
+            return selected
+
+    def track(self, txid, utxos):
+        with self._lock:
+            self.pending_transactions[txid] = [(utxo.txid, utxo.index) for utxo in utxos]
+
+    def release(self, txid):
+        """Make the coins of a transaction that will never confirm spendable again"""
+        with self._lock:
+            for outpoint in self.pending_transactions.pop(txid, ()):
+                utxo = self.pending.pop(outpoint, None)
+                if utxo is not None:
+                    self.pending_balance -= utxo.amount
+                    self.coins[outpoint] = utxo
@@ -1,67 +1,185 @@
 import time
 import random
+import asyncio
 import threading
 
 from src.core.transaction import Transaction
 from src.core.block import Block
 from src.wallet.wallet import Wallet
-from src.utils.crypto import is_valid_proof
+from src.wallet.mining import MiningBackend
+from src.utils.crypto import expected_hashes
 
-MINER_POW_SLEEP = 0.1 # Limit ressource usage
+MINER_HASH_BUDGET = 10 # Hashes per second, limits ressource usage
+MINER_TICK = 0.1 # Seconds of hashing between tip checks
 
 class Miner(Wallet):
-    
-    def __init__(self):
+
+    def __init__(self, hash_budget=MINER_HASH_BUDGET, backend=None):
         super().__init__()
         self.is_mining = False
         self.mining_thread = None
         self.primary_node = None
+        self.hash_budget = hash_budget # None for unlimited
+        self.backend = backend or MiningBackend(workers=0)
+        self.hashes_done = 0
+        self.mining_time = 0.0
+        self.virtual_hashrate = None
+        self.found_blocks = []
+        self._next_block_event = None
+        self.metrics = None # Metrics while collection is enabled, see Network.enable_metrics
+
+    @property
+    def hashrate(self):
+        if self.virtual_hashrate is not None:
+            return self.virtual_hashrate
+        if not self.mining_time:
+            return 0.0
+        return self.hashes_done / self.mining_time
+
+    @property
+    def rng(self):
+        # The simulator's seeded generator, so simulated mining is reproducible
+        return random if self.simulator is None else self.simulator.random
 
     def start_mining(self):
         if not self.is_mining:
             self.is_mining = True
-            self.miner_thread = threading.Thread(target=self._mine)
-            self.miner_thread.daemon = True
-            self.miner_thread.start()
+            self.mining_thread = threading.Thread(target=self._mine)
+            self.mining_thread.daemon = True
+            self.mining_thread.start()
 
-    def stop_mining(self):
+    def start_virtual_mining(self, hashrate):
+        """Sample block discovery on the simulator's clock instead of hashing"""
         if self.is_mining:
-            self.miner_thread.join()
-            self.is_mining = False
+            return
+        self.is_mining = True
+        self.virtual_hashrate = hashrate
+        self._schedule_virtual_block()
+
+    def stop_mining(self):
+        if not self.is_mining:
+            return
+        self.is_mining = False
+        if self._next_block_event is not None:
+            self.simulator.cancel(self._next_block_event)
+            self._next_block_event = None
+        if self.mining_thread is not None:
+            self.mining_thread.join()
+            self.mining_thread = None
+
+    def _build_block(self, timestamp=None):
+        self.primary_node = self.rng.choice(list(self.peers))
+        blockchain = self.primary_node.blockchain
+        prev_hash = blockchain.last_block_hash
+        best_block = blockchain.get_best_block()
+        new_block_height = best_block.height + 1
+        utxo_set = blockchain.utxo_set
+        # Skip transactions whose inputs were spent or undone since they were relayed
+        transactions = [tx for tx in blockchain.mempool.copy() if all(input in utxo_set for input in tx.inputs)]
+        reward_amount = blockchain.block_subsidy + Transaction.fee * len(transactions)
+
+        reward_tx = Transaction.coinbase(
+            recipient_address=self.get_address(),
+            reward=reward_amount,
+            height=new_block_height
+        )
+        transactions.insert(0, reward_tx)
+
+        return Block(transactions, prev_hash, blockchain.difficulty, new_block_height, timestamp)
 
     def _mine(self):
         while self.is_mining:
-            self.primary_node = random.choice(list(self.peers))
-            blockchain = self.primary_node.blockchain
-            prev_hash = blockchain.last_block_hash
-            best_block = blockchain.get_best_block()
-            new_block_height = best_block.height + 1
-            transactions = blockchain.mempool.copy()
-            reward_amount = blockchain.block_subsidy + Transaction.fee * len(transactions)
-            
-            reward_tx = Transaction.coinbase(
-                recipient_address=self.get_address(),
-                reward=reward_amount
-            )
-            transactions.insert(0, reward_tx)
-            
-            block = Block(transactions, prev_hash, blockchain.difficulty, new_block_height)
-
+            block = self._build_block()
             success = self._solve_block(block)
             if not success:
                 continue
-    
+
+    def _schedule_virtual_block(self):
+        difficulty = self.rng.choice(list(self.peers)).blockchain.difficulty
+        block_rate = self.virtual_hashrate / expected_hashes(difficulty)
+        delay = self.simulator.random.expovariate(block_rate)
+        self._next_block_event = self.simulator.schedule(delay, self._virtual_block_found)
+
+    def _virtual_block_found(self):
+        # Discovery is memoryless, so building on the current tip when the
+        # sample fires is equivalent to having hashed on it all along
+        block = self._build_block(timestamp=self.simulator.now)
+        block.nonce = self.rng.getrandbits(32)
+        block.virtual_proof = True
+        self.found_blocks.append(block.hash)
+        if self.metrics is not None:
+            self.metrics.increment("blocks_mined")
+        self.primary_node.receive_block(block)
+        self._schedule_virtual_block()
+
+    def _hashes_per_round(self):
+        if self.hash_budget is None:
+            return self.backend.batch_size * self.backend.parallelism
+        return max(1, round(self.hash_budget * MINER_TICK))
+
+    def _tip_changed(self, block):
+        return block.prev_hash != self.primary_node.blockchain.last_block_hash
+
     def _solve_block(self, block):
-        block.nonce = random.randint(0, 1000000)
-        while True:
-            block.compute_hash()
+        block.nonce = self.rng.randint(0, 1000000)
+        while self.is_mining:
+            nonce, wait = self._hash_round(block)
+            if wait > 0:
+                time.sleep(wait)
+
+            if nonce is not None:
+                if self._tip_changed(block):
+                    return False
+                self.found_blocks.append(block.hash)
+                if self.metrics is not None:
+                    self.metrics.increment("blocks_mined")
+                return self.primary_node.receive_block(block)
+
+            if self._tip_changed(block):
+                return False
+        return False
+
+    async def mine_async(self):
+        """Mine as a cooperative task, the loop runs other actors between rounds"""
+        self.is_mining = True
+        while self.is_mining:
+            block = self._build_block()
+            block.nonce = self.rng.randint(0, 1000000)
+            while self.is_mining:
+                nonce, wait = self._hash_round(block)
+                await asyncio.sleep(max(wait, 0))
+
+                if self._tip_changed(block):
+                    break
+                if nonce is not None:
+                    self.found_blocks.append(block.hash)
+                    if self.metrics is not None:
+                        self.metrics.increment("blocks_mined")
+                    self._send(self.primary_node, self.primary_node.receive_block, block)
+                    break
 
-            if block.prev_hash != self.primary_node.blockchain.last_block_hash:
-                return
+    def _hash_round(self, block):
+        """Search one round of nonces, returns (nonce or None, seconds left of the round's budget)"""
+        round_start = time.time()
+        nonce, hashes_done = self.backend.search(
+            block.header[:-8], block.difficulty, block.nonce, self._hashes_per_round(),
+            should_stop=lambda: self._tip_changed(block)
+        )
+        self.hashes_done += hashes_done
 
-            if is_valid_proof(block.hash, self.primary_node.blockchain.difficulty):
-                self.primary_node.receive_block(block)
-                return
+        wait = 0.0
+        if self.hash_budget is not None:
+            # Spread the budget evenly instead of hashing in bursts
+            wait = hashes_done / self.hash_budget - (time.time() - round_start)
+        round_time = time.time() - round_start + max(wait, 0)
+        self.mining_time += round_time
+        if self.metrics is not None:
+            self.metrics.increment("hashes", hashes_done)
+            if round_time > 0:
+                self.metrics.observe("miner_hashes_per_second", hashes_done / round_time)
 
-            time.sleep(MINER_POW_SLEEP)
-            block.nonce += 1
\ No newline at end of file
+        if nonce is None:
+            block.nonce += hashes_done
+        else:
+            block.nonce = nonce
+        return nonce, wait
@@ -0,0 +1,73 @@
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from src.utils.crypto import get_target_bytes
+
+pack_nonce = struct.Struct(">Q").pack
+
+def search_nonces(header_prefix: bytes, difficulty: int, start_nonce: int, count: int):
+    """Hash nonces [start_nonce, start_nonce + count), returns (nonce or None, hashes done)
+
+    The header prefix is hashed once and its midstate copied for every nonce,
+    digests are compared as bytes against the big-endian target.
+    """
+    target = get_target_bytes(difficulty)
+    midstate = hashlib.sha256(header_prefix)
+    copy = midstate.copy
+    for nonce in range(start_nonce, start_nonce + count):
+        attempt = copy()
+        attempt.update(pack_nonce(nonce))
+        if attempt.digest() <= target:
+            return nonce, nonce - start_nonce + 1
+    return None, count
+
+
+class MiningBackend():
+    """Splits nonce ranges across a process pool, or hashes in-thread when workers is 0"""
+
+    def __init__(self, workers=None, batch_size=20000):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    @property
+    def parallelism(self):
+        if self.workers == 0:
+            return 1
+        return self.pool._max_workers
+
+    def search(self, header_prefix, difficulty, start_nonce, count, should_stop=None):
+        if self.workers == 0:
+            return search_nonces(header_prefix, difficulty, start_nonce, count)
+
+        futures = set()
+        for offset in range(0, count, self.batch_size):
+            batch = min(self.batch_size, count - offset)
+            futures.add(self.pool.submit(search_nonces, header_prefix, difficulty, start_nonce + offset, batch))
+
+        found = None
+        hashes_done = 0
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                nonce, hashes = future.result()
+                hashes_done += hashes
+                if nonce is not None and (found is None or nonce < found):
+                    found = nonce
+            if found is not None or (should_stop and should_stop()):
+                for future in futures:
+                    future.cancel()
+                break
+        return found, hashes_done
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
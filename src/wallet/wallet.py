@@ -1,12 +1,49 @@
 from src.core.transaction import Transaction
+from src.core.primitives import TxOut, to_address
+from src.utils.crypto import verify_merkle_proof
+from src.utils.ordered_set import OrderedSet
+from src.wallet.coin_set import CoinSet
+from src.wallet.coin_selection import COIN_SELECTORS
 
 class Wallet():
 
-    def __init__(self):
+    def __init__(self, coin_selection="oldest_first"):
         from ecdsa.keys import SigningKey
-        self.private_key = SigningKey.generate()
+        self.peers = OrderedSet()
+        self.simulator = None
+        self.select_coins = COIN_SELECTORS.get(coin_selection, coin_selection) # Name or strategy function
+        self._set_private_key(SigningKey.generate())
+
+    def _set_private_key(self, private_key):
+        self.private_key = private_key
         self.public_key = self.private_key.get_verifying_key()
-        self.peers = set()
+        self.address = to_address(self.public_key)
+        for node in self.peers:
+            node.blockchain.listeners.remove(self.coins)
+        self.coins = CoinSet(self.address)
+        self.rescan()
+
+    def connect(self, node):
+        """Peer with a node and follow the blocks it connects and disconnects"""
+        if node in self.peers:
+            return
+        self.peers.add(node)
+        node.blockchain.listeners.append(self.coins)
+
+    def rescan(self):
+        """Rebuild the coin set from a peer's utxo set, e.g. after a key or chain was loaded"""
+        for node in self.peers:
+            if self.coins not in node.blockchain.listeners:
+                node.blockchain.listeners.append(self.coins)
+        if not self.peers:
+            return
+        peer_node = next(iter(self.peers))
+        chains = [node.blockchain.chain for node in self.peers]
+        self.coins.reset(peer_node.blockchain.utxo_set.utxos_for(self.address), chains)
+
+    def load_private_key(self, private_key_bytes: bytes):
+        from ecdsa.keys import SigningKey
+        self._set_private_key(SigningKey.from_string(private_key_bytes))
     
     def get_address(self):
         return self.public_key
@@ -17,59 +54,62 @@ class Wallet():
     def verify(self, data: bytes, signature: bytes):
         return self.public_key.verify(signature, data)
 
+    def verify_payment(self, txid: str, proof: list, merkle_root: str) -> bool:
+        """Check a transaction is included in a block using only its header's merkle root"""
+        return verify_merkle_proof(txid, proof, merkle_root)
+
     def get_balance(self) -> int:
-        balances = []
-        for node in self.peers:
-            try:
-                utxo_set = node.blockchain.utxo_set
-                balance = 0
-                for utxo in utxo_set:
-                    if utxo['owner_address'] == self.get_address():
-                        balance += utxo['amount']
-                balances.append(balance)
-            except:
-                continue
-        
-        if not balances:
-            return 0
-        
-        balances.sort()
-        return balances[len(balances) // 2]
+        """Confirmed balance, including coins held by unconfirmed payments"""
+        return self.coins.balance
+
+    def get_spendable_balance(self) -> int:
+        return self.coins.spendable_balance
 
     def create_transaction(self, recipient_address, amount):
-        # Create inputs (choose UTXOs to cover the amount + fee)
-        inputs = []
-        total = 0
+        return self.create_batch_transaction([(recipient_address, amount)])
+
+    def create_batch_transaction(self, payments):
+        """Pay every (recipient_address, amount) in payments with a single transaction"""
+        tx = self.build_transaction(payments)
+        self._propegate_transaction(tx)
+        return tx
+
+    def build_transaction(self, payments):
+        """Signed transaction for payments, its coins are reserved until it confirms or is abandoned"""
+        amount = sum(payment_amount for _, payment_amount in payments)
         charge = amount + Transaction.fee
 
-        from random import choice
-        peer_node = choice(list(self.peers))
-        utxos = peer_node.blockchain.utxo_set
-
-        for utxo in utxos:
-            if utxo['owner_address'] == self.get_address():
-                inputs.append(utxo)
-                total += utxo['amount']
-                if total >= charge:
-                    break
-        if total < charge:
+        # Create inputs (choose UTXOs to cover the amount + fee)
+        inputs = self.coins.reserve(charge, self.select_coins)
+        if inputs is None:
             raise ValueError("Insufficient funds")
+        total = sum(utxo.amount for utxo in inputs)
 
         # Create outputs
-        outputs = [{'owner_address': recipient_address, 'amount': amount}]
+        outputs = [TxOut(to_address(recipient_address), payment_amount) for recipient_address, payment_amount in payments]
         change = total - charge
         if change > 0:
-            outputs.append({'owner_address': self.get_address(), 'amount': change})
+            outputs.append(TxOut(self.address, change))
 
         # Sign transaction
-        tx = Transaction(self.get_address(), recipient_address, amount, inputs, outputs)
+        tx = Transaction(self.address, payments[0][0], amount, inputs, outputs)
         signature = self.sign(tx._serialize_for_signing())
         tx.signature = signature
+        self.coins.track(tx.txid, inputs)
+        return tx
 
-        self._propegate_transaction(tx)
+    def abandon_transaction(self, txid):
+        """Release the coins of a payment that was rejected or dropped from the mempools"""
+        self.coins.release(txid)
     
     def _propegate_transaction(self, transaction):
         for peer in self.peers:
             if peer.is_new_transaction(transaction.txid): # Check to avoid sending unnecessary data
-                peer.receive_transaction(transaction)
-        return
\ No newline at end of file
+                self._send(peer, peer.receive_transaction, transaction)
+        return
+
+    def _send(self, peer, handler, item):
+        if self.simulator is None:
+            handler(item)
+            return
+        self.simulator.send(self, peer, handler, item, item.size)
\ No newline at end of file
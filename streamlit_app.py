@@ -1,3 +1,7 @@
+import math
+from array import array
+from collections import deque
+
 import streamlit as st
 import streamlit.components.v1 as components
 from pyvis.network import Network as pyvis_Network
@@ -6,6 +10,7 @@ from src.core.network import Network
 from src.core.node import Node
 from src.wallet.wallet import Wallet
 from src.wallet.miner import Miner
+from src.utils.metrics import MetricsExporter
 
 st.set_page_config(
     page_title="Blockchain Visualizer",
@@ -56,6 +61,51 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+LAYOUT_SPACING = 120 # Pixels between rings and between nodes on a ring
+LOD_NODE_LIMIT = 1500 # Above this many participants, Auto draws clusters
+LOD_CLUSTERS = 400
+METRICS_REFRESH = 2 # Seconds between metrics panel updates
+CHARTED_COUNTERS = ["blocks_received", "blocks_duplicate", "transactions_received", "orphan_blocks", "reorgs"]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def compute_layout(indptr_bytes, indices_bytes, node_count):
+    """Rings by hop distance from the best connected node, so the browser needs no physics"""
+    indptr = array("q", indptr_bytes)
+    indices = array("i", indices_bytes)
+    if not node_count:
+        return [], []
+
+    root = max(range(node_count), key=lambda node: indptr[node + 1] - indptr[node])
+    distances = [-1] * node_count
+    distances[root] = 0
+    rings = [[root]]
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        for peer in indices[indptr[node]:indptr[node + 1]]:
+            if distances[peer] < 0:
+                distances[peer] = distances[node] + 1
+                if distances[peer] == len(rings):
+                    rings.append([])
+                # Breadth first order keeps peers reached from the same node next to each other
+                rings[distances[peer]].append(peer)
+                queue.append(peer)
+    unreachable = [node for node in range(node_count) if distances[node] < 0]
+    if unreachable:
+        rings.append(unreachable)
+
+    xs = [0.0] * node_count
+    ys = [0.0] * node_count
+    radius = 0.0
+    for depth, ring in enumerate(rings):
+        if depth:
+            radius = max(radius + LAYOUT_SPACING, len(ring) * LAYOUT_SPACING / (2 * math.pi))
+        for i, node in enumerate(ring):
+            angle = 2 * math.pi * (i + 0.5) / len(ring)
+            xs[node] = radius * math.cos(angle)
+            ys[node] = radius * math.sin(angle)
+    return xs, ys
+
 class NetworkVisualizer:
 
     node_types = ["miner","wallet","node"]
@@ -65,11 +115,15 @@ class NetworkVisualizer:
         "node": {"color": "#004E89", "size": 30, "shape": "dot"}
     }
 
-    def __init__(self, blockchain_network, show_labels=True):
+    def __init__(self, blockchain_network, show_labels=True, level_of_detail="Auto"):
         self.network = blockchain_network
         self.show_labels = show_labels
-        self.pyvis_net = pyvis_Network(height="700px", width="100%", bgcolor="#222222", font_color="white")
+        self.level_of_detail = level_of_detail
+        self.pyvis_net = None
         self.wallet_names = {}
+        self.node_ids = {node: node_id for node_id, node in enumerate(self.all_nodes)}
+        self.positions = None
+        self.edge_count = 0
 
     def _give_wallets_names(self):
         from faker import Faker
@@ -83,11 +137,15 @@ class NetworkVisualizer:
     @property
     def all_nodes(self):
         return self.network.nodes + self.network.wallets + self.network.miners
+
+    @property
+    def is_aggregated(self):
+        if self.level_of_detail == "Auto":
+            return len(self.node_ids) > LOD_NODE_LIMIT
+        return self.level_of_detail == "Clustered"
     
     def _get_node_index(self, node):
-        for i, other in enumerate(self.network.nodes):
-            if node == other:
-                return i
+        return self.node_ids.get(node)
 
     def _get_node_type(self, node):
         node_type_map = {
@@ -97,17 +155,46 @@ class NetworkVisualizer:
         }
         return node_type_map.get(type(node), "unknown")
 
-    def _add_nodes_to_graph(self):
-        start_id = len(self.pyvis_net.nodes)
+    def _compute_positions(self):
+        topology = self.network.topology
+        xs, ys = compute_layout(topology.indptr.tobytes(), topology.indices.tobytes(), topology.node_count)
+        xs, ys = list(xs), list(ys)
+
+        # Wallets and miners sit just outside the first node they connect to
+        for i, participant in enumerate(self.network.wallets + self.network.miners):
+            peer_index = self._get_node_index(next(iter(participant.peers), None))
+            x, y = (xs[peer_index], ys[peer_index]) if peer_index is not None else (0.0, 0.0)
+            angle = math.atan2(y, x) + (i % 5 - 2) * 0.05
+            radius = math.hypot(x, y) + LAYOUT_SPACING
+            xs.append(radius * math.cos(angle))
+            ys.append(radius * math.sin(angle))
+        self.positions = (xs, ys)
+
+    def _add_graph_node(self, node_id, label, properties, title, x, y, size=None):
+        # Appended directly, pyvis' add_node scans every existing id
+        self.pyvis_net.nodes.append({
+            "id": node_id,
+            "label": label,
+            "shape": properties["shape"],
+            "color": properties["color"],
+            "size": size or properties["size"],
+            "title": title, # On hover
+            "x": x,
+            "y": y,
+            "font": {"color": "white"}
+        })
+        self.pyvis_net.node_ids.append(node_id)
+        self.pyvis_net.node_map[node_id] = self.pyvis_net.nodes[-1]
 
+    def _add_nodes_to_graph(self):
+        xs, ys = self.positions
         node_counters = {
             'node': 0,
             'wallet': 0, 
             'miner': 0
         }
 
-        for i, node in enumerate(self.all_nodes):
-            node_id = start_id + i
+        for node_id, node in enumerate(self.all_nodes):
             node_type = self._get_node_type(node)
             properties = NetworkVisualizer.node_properties[node_type]
             
@@ -129,48 +216,93 @@ class NetworkVisualizer:
                 peer_total = len(node.peers)
                 title = f"Peers: {peer_total}"
             
-            self.pyvis_net.add_node(
-                node_id, 
-                label=label,
-                color=properties["color"],
-                size=properties["size"], 
-                shape=properties["shape"],
-                title=title # On hover
-            )
+            self._add_graph_node(node_id, label, properties, title, xs[node_id], ys[node_id])
+
+    def _get_edges(self):
+        """Unique (node_id, peer_id) pairs, each undirected link once"""
+        edges = set()
+        for node_id, node in enumerate(self.all_nodes):
+            for peer in node.peers:
+                peer_index = self._get_node_index(peer)
+                if peer_index != None:
+                    edges.add((min(node_id, peer_index), max(node_id, peer_index)))
+        return edges
 
     def _add_edges_to_graph(self):
+        edges = self._get_edges()
+        self.edge_count = len(edges)
+        self.pyvis_net.edges.extend({"from": node_id, "to": peer_id, "width": 1.5} for node_id, peer_id in edges)
+
+    def _add_clusters_to_graph(self):
+        """Level of detail: participants merged per layout grid cell, links summed per cell pair"""
+        xs, ys = self.positions
+        extent = max(max(map(abs, xs), default=0), max(map(abs, ys), default=0)) or 1.0
+        cell_size = 2 * extent / math.sqrt(LOD_CLUSTERS)
+
+        clusters = {}
+        cluster_of = []
         for node_id, node in enumerate(self.all_nodes):
-            if hasattr(node, 'peers'):
-                for peer in node.peers:
-                    peer_index = self._get_node_index(peer)
-                    if peer_index != None:
-                        self.pyvis_net.add_edge(node_id, peer_index, width=1.5)
+            cell = (int((xs[node_id] + extent) // cell_size), int((ys[node_id] + extent) // cell_size))
+            cluster = clusters.get(cell)
+            if cluster is None:
+                cluster = clusters[cell] = {"id": len(clusters), "members": [], "node": 0, "wallet": 0, "miner": 0}
+            cluster["members"].append(node_id)
+            cluster[self._get_node_type(node)] += 1
+            cluster_of.append(cluster["id"])
+
+        cluster_xs = []
+        cluster_ys = []
+        for cluster in clusters.values():
+            members = cluster["members"]
+            cluster_xs.append(sum(xs[member] for member in members) / len(members))
+            cluster_ys.append(sum(ys[member] for member in members) / len(members))
+
+        for cluster in clusters.values():
+            node_type = max(NetworkVisualizer.node_types, key=lambda node_type: cluster[node_type])
+            properties = NetworkVisualizer.node_properties[node_type]
+            count = len(cluster["members"])
+            title = f"Nodes: {cluster['node']} | Wallets: {cluster['wallet']} | Miners: {cluster['miner']}"
+            label = str(count) if self.show_labels else ""
+            self._add_graph_node(cluster["id"], label, properties, title,
+                                 cluster_xs[cluster["id"]], cluster_ys[cluster["id"]], size=10 + 4 * math.sqrt(count))
+
+        links = {}
+        edges = self._get_edges()
+        self.edge_count = len(edges)
+        for node_id, peer_id in edges:
+            cluster_a, cluster_b = cluster_of[node_id], cluster_of[peer_id]
+            if cluster_a != cluster_b:
+                pair = (min(cluster_a, cluster_b), max(cluster_a, cluster_b))
+                links[pair] = links.get(pair, 0) + 1
+        self.pyvis_net.edges.extend(
+            {"from": a, "to": b, "width": 1 + math.log(count), "title": f"Connections: {count}"}
+            for (a, b), count in links.items()
+        )
 
     def generate_visualization(self):
-        self._give_wallets_names()
-        self._add_nodes_to_graph()
-        self._add_edges_to_graph()
+        self.pyvis_net = pyvis_Network(height="700px", width="100%", bgcolor="#222222", font_color="white")
+        if not self.wallet_names:
+            self._give_wallets_names()
+        if self.positions is None:
+            self._compute_positions()
+
+        if self.is_aggregated:
+            self._add_clusters_to_graph()
+        else:
+            self._add_nodes_to_graph()
+            self._add_edges_to_graph()
+
+        # Positions are computed up front, so the browser only draws
         self.pyvis_net.set_options("""
         var options = {
-            "physics": {
-                "enabled": true,
-                "stabilization": {"iterations": 200},
-                "repulsion": {
-                "nodeDistance": 200,
-                "centralGravity": 0.1,
-                "springLength": 200,
-                "springConstant": 0.01,
-                "damping": 0.12
-                },
-                "solver": "repulsion"
-            }
+            "physics": {"enabled": false},
+            "edges": {"smooth": false},
+            "interaction": {"hideEdgesOnDrag": true, "tooltipDelay": 100}
         }
         """)
 
     def get_html_content(self):
-        self.pyvis_net.save_graph("blockchain_network.html")
-        with open("blockchain_network.html", "r", encoding="utf-8") as f:
-            html_content = f.read()
+        html_content = self.pyvis_net.generate_html()
         
         # Remove all borders surrounding the network (Yes they are all needed)
         html_content = html_content.replace(
@@ -196,7 +328,8 @@ class NetworkVisualizer:
         return html_content
 
 def generate_network():
-    network = Network(node_amount, wallet_amount, miner_amount, min_node_peers, min_wallet_peers, min_miner_peers)
+    network = Network(node_amount, wallet_amount, miner_amount, min_node_peers, min_wallet_peers, min_miner_peers,
+                      topology=topology)
     for miner in network.miners:
         miner.start_mining()
 
@@ -209,12 +342,19 @@ def generate_network():
     st.session_state.network = network
     st.session_state.network_generated = True
 
-    visualizer = NetworkVisualizer(network, show_labels)
+    st.session_state.visualizer = NetworkVisualizer(network, show_labels, level_of_detail)
+    render_visualization()
+
+def render_visualization():
+    # Reuses the visualizer's names and layout, only the graph and html are rebuilt
+    visualizer = st.session_state.visualizer
+    visualizer.show_labels = show_labels
+    visualizer.level_of_detail = level_of_detail
     visualizer.generate_visualization()
     
     html_content = visualizer.get_html_content()
     st.session_state.html_content = html_content
-    st.session_state.visualizer = visualizer
+    st.session_state.render_options = (show_labels, level_of_detail)
 
 with st.sidebar:
     st.title("Blockchain Network Visualizer")
@@ -228,7 +368,7 @@ with st.sidebar:
     st.subheader("Network Size")
     wallet_amount = st.slider("Wallets", 0, 20, 10)
     miner_amount = st.slider("Miners", 0, 50, 25)
-    node_amount = st.slider("Nodes", 10, 90, 50)
+    node_amount = st.slider("Nodes", 10, 10000, 50)
     
     st.markdown("---")
 
@@ -236,11 +376,15 @@ with st.sidebar:
     min_wallet_peers = st.slider("Wallet Peers", 1, 6, 2)
     min_miner_peers = st.slider("Miner Peers", 1, 6, 2)
     min_node_peers = st.slider("Node Min Peers", 1, 8, 4)
+    topology = st.selectbox("Topology", ["random", "regular", "small_world", "scale_free", "geographic"])
 
     st.markdown("---")
 
     st.subheader("Network Options")
     show_labels = st.checkbox("Show Node Labels", value=True)
+    collect_metrics = st.checkbox("Collect Metrics", value=False)
+    level_of_detail = st.selectbox("Level of Detail", ["Auto", "Full", "Clustered"],
+                                   help="Auto groups nearby participants into clusters for large networks")
     
     st.markdown("---")
 
@@ -251,6 +395,18 @@ if 'network_generated' not in st.session_state:
 
 if generate_btn or not st.session_state.network_generated:
     generate_network()
+elif st.session_state.render_options != (show_labels, level_of_detail):
+    render_visualization()
+
+def update_metrics_collection():
+    network = st.session_state.network
+    if collect_metrics and network.metrics is None:
+        st.session_state.metrics_exporter = MetricsExporter(network.enable_metrics(), network.get_metrics)
+    elif not collect_metrics and network.metrics is not None:
+        network.disable_metrics()
+        st.session_state.metrics_exporter = None
+
+update_metrics_collection()
 
 def display_node_types():
     col1, col2, col3 = st.columns(3)
@@ -274,9 +430,9 @@ def display_node_types():
 
 def display_network_structure():
     col1, col2, col3 = st.columns(3)
-    pyvis_net = st.session_state.visualizer.pyvis_net
+    visualizer = st.session_state.visualizer
     with col1:
-        node_amount_stat = len(pyvis_net.nodes)
+        node_amount_stat = len(visualizer.node_ids)
         st.markdown(f"""
             <div class="metric-container">
                 <div>
@@ -287,7 +443,7 @@ def display_network_structure():
         """, unsafe_allow_html=True)
 
     with col2:
-        edge_amount_stat = len(pyvis_net.edges)
+        edge_amount_stat = visualizer.edge_count
         st.markdown(f"""
             <div class="metric-container">
                 <div>
@@ -321,5 +477,46 @@ def display_main_page():
     components.html(st.session_state.html_content, height=700)
     st.info("Zoom with mouse wheel. Hover over nodes to see details. Drag nodes to rearrange the network.")
     display_network_structure()
+    if collect_metrics:
+        st.markdown("---")
+        display_metrics()
+
+@st.fragment(run_every=METRICS_REFRESH)
+def display_metrics():
+    st.subheader("Metrics")
+    exporter = st.session_state.get("metrics_exporter")
+    if exporter is None:
+        return
+    snapshot = exporter.record()
+    history = list(exporter.history)
+    elapsed = [entry["elapsed"] for entry in history]
+
+    columns = st.columns(4)
+    gauges = snapshot["gauges"]
+    columns[0].metric("Best Height", gauges["best_height"])
+    columns[1].metric("Chain Tips", gauges["tips"])
+    columns[2].metric("Hashrate (H/s)", f"{gauges['network_hashrate']:.1f}")
+    columns[3].metric("Stale Rate", f"{gauges['stale_rate']:.1%}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Messages received")
+        st.line_chart({
+            "elapsed": elapsed,
+            **{name: [entry["counters"].get(name, 0) for entry in history] for name in CHARTED_COUNTERS}
+        }, x="elapsed")
+    with col2:
+        st.caption("Block validation latency p50 / p99 (ms)")
+        latencies = [entry["histograms"].get("block_validation_seconds") or {} for entry in history]
+        st.line_chart({
+            "elapsed": elapsed,
+            "p50": [1000 * (latency.get("p50") or 0) for latency in latencies],
+            "p99": [1000 * (latency.get("p99") or 0) for latency in latencies]
+        }, x="elapsed")
+
+    st.dataframe({name: summary for name, summary in snapshot["histograms"].items()})
+    download_json, download_csv = st.columns(2)
+    download_json.download_button("Download JSON", exporter.to_json(), "metrics.json", "application/json")
+    download_csv.download_button("Download CSV", exporter.to_csv(), "metrics.csv", "text/csv")
 
 display_main_page()
\ No newline at end of file
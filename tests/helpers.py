@@ -0,0 +1,31 @@
+from src.core import Block, Transaction, UTXO
+from src.core.primitives import TxOut
+
+MINER_ADDRESS = b"m" * 48
+
+def next_block(blockchain, transactions=(), prev_block=None, timestamp=0, recipient_address=MINER_ADDRESS):
+    """Block with a virtual proof of work on top of prev_block, the tip by default"""
+    prev_block = prev_block or blockchain.get_best_block()
+    height = prev_block.height + 1
+    reward = blockchain.block_subsidy + Transaction.fee * len(transactions)
+    coinbase = Transaction.coinbase(recipient_address, reward, height)
+    block = Block([coinbase] + list(transactions), prev_block.hash, blockchain.difficulty, height, timestamp)
+    block.virtual_proof = True
+    return block
+
+def build_branch(blockchain, prev_block, length, first_timestamp=0):
+    branch = []
+    for timestamp in range(first_timestamp, first_timestamp + length):
+        prev_block = next_block(blockchain, prev_block=prev_block, timestamp=timestamp)
+        branch.append(prev_block)
+    return branch
+
+def make_utxo(owner, amount=10, seed=0):
+    return UTXO("%064x" % seed, 0, amount, owner.address)
+
+def pay(sender, utxo, recipient_address=MINER_ADDRESS, amount=None):
+    """Signed transaction spending utxo, the rest after the fee goes to recipient_address"""
+    amount = utxo.amount - Transaction.fee if amount is None else amount
+    tx = Transaction(sender.address, recipient_address, amount, [utxo], [TxOut(recipient_address, amount)])
+    tx.signature = sender.sign(tx._serialize_for_signing())
+    return tx
@@ -0,0 +1,14 @@
+from benchmarks.benchmark import run_benchmarks
+
+SIZES = {"propagation": [20], "throughput": [20]}
+
+def simulated_outputs(results):
+    # Wall clock throughput of the propagation scenario is the one non simulated number
+    return [(result["name"], result["params"], result["latency"],
+             result["throughput"] if result["unit"] == "virtual s" and result["name"] != "propagation" else None)
+            for result in results]
+
+def test_simulated_benchmarks_are_reproducible():
+    first = run_benchmarks(list(SIZES), SIZES, repeat=2, seed=7)
+    second = run_benchmarks(list(SIZES), SIZES, repeat=2, seed=7)
+    assert simulated_outputs(first) == simulated_outputs(second)
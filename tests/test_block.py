@@ -0,0 +1,27 @@
+from src.core import Block, Transaction
+
+def coinbase(height, reward=2):
+    return Transaction.coinbase(b"m" * 48, reward, height)
+
+def test_in_place_transaction_changes_reset_cached_hash():
+    block = Block([coinbase(1)], "0" * 64, 5, 1, timestamp=0)
+    stale_hash, stale_root, stale_size = block.hash, block.merkle_root, block.size
+
+    block.transactions.insert(0, coinbase(1, reward=3))
+
+    fresh = Block(list(block.transactions), "0" * 64, 5, 1, timestamp=0)
+    assert block.merkle_root != stale_root
+    assert block.size > stale_size
+    assert block.hash != stale_hash
+    assert block.hash == fresh.hash
+    assert block.has_valid_merkle_root()
+
+def test_block_keeps_its_own_transaction_list():
+    transactions = [coinbase(1)]
+    block = Block(transactions, "0" * 64, 5, 1, timestamp=0)
+    block_hash = block.hash
+
+    # The caller's list is copied, so changing it later cannot desync the cache
+    transactions.append(coinbase(2))
+    assert len(block.transactions) == 1
+    assert block.compute_hash() == block_hash
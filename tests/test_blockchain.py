@@ -0,0 +1,26 @@
+from src.core import Blockchain, UTXOSet
+
+from tests.helpers import MINER_ADDRESS, next_block
+
+def test_rebase_onto_empty_snapshot():
+    blockchain = Blockchain()
+    assert blockchain.append_block(next_block(blockchain))
+    assert len(blockchain.utxo_set) == 1
+
+    blockchain.rebase_utxo_set(UTXOSet(), blockchain.block_index.genesis)
+
+    assert len(blockchain.utxo_set) == 1
+    assert blockchain.utxo_set.balance(MINER_ADDRESS) == blockchain.block_subsidy
+
+def test_undo_records_are_pruned_below_undo_depth():
+    blockchain = Blockchain()
+    blockchain.undo_depth = 5
+    for timestamp in range(20):
+        assert blockchain.append_block(next_block(blockchain, timestamp=timestamp))
+    assert len(blockchain.undo_records) == blockchain.undo_depth + 1
+
+    # Blocks without a record are still disconnected from their shared delta
+    for _ in range(15):
+        blockchain.disconnect_block()
+    assert len(blockchain.chain) == 6
+    assert len(blockchain.utxo_set) == 5
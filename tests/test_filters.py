@@ -0,0 +1,26 @@
+from src.core import Node
+from src.utils import RollingBloomFilter
+
+def false_positive_rate(seen_filter, queries=100000):
+    return sum(("never added %d" % i) in seen_filter for i in range(queries)) / queries
+
+def test_rolling_bloom_false_positive_rate_at_capacity():
+    seen_filter = RollingBloomFilter(capacity=10000, false_positive_rate=1e-3)
+    added = ["item %d" % i for i in range(2 * seen_filter.capacity)]
+
+    # One full generation, then both full just before the older one is cleared
+    for item in added[:seen_filter.capacity]:
+        seen_filter.add(item)
+    assert false_positive_rate(seen_filter) <= 2 * seen_filter.false_positive_rate
+    for item in added[seen_filter.capacity:]:
+        seen_filter.add(item)
+    assert len(seen_filter) == 2 * seen_filter.capacity
+    assert false_positive_rate(seen_filter) <= 2 * seen_filter.false_positive_rate
+
+    # At least the last capacity items are always remembered
+    assert all(item in seen_filter for item in added[-seen_filter.capacity:])
+
+def test_block_filter_is_sized_from_the_block_rate():
+    node = Node(seen_filter="bloom")
+    assert node.seen_blocks.capacity < node.seen_transactions.capacity
+    assert node.seen_blocks.memory_usage() < node.seen_transactions.memory_usage() / 10
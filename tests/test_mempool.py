@@ -0,0 +1,64 @@
+from src.core import Node, Blockchain, Mempool, UTXO
+from src.wallet import Wallet
+
+from tests.helpers import next_block, make_utxo, pay
+
+def test_conflicting_spend_is_rejected():
+    mempool = Mempool()
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    first, second = pay(sender, utxo), pay(sender, utxo, amount=5)
+
+    assert mempool.add(first)
+    assert not mempool.add(second)
+    assert mempool.get_conflicts(second) == [first]
+    assert len(mempool) == 1
+
+def test_full_mempool_evicts_the_lowest_feerate():
+    mempool = Mempool(max_size=2)
+    sender = Wallet()
+    low, middle, high = [pay(sender, make_utxo(sender, seed=seed), amount=10 - fee)
+                         for seed, fee in ((1, 1), (2, 2), (3, 3))]
+    assert mempool.add(low) and mempool.add(middle)
+
+    assert mempool.add(high)
+    assert low not in mempool
+    assert mempool.get_sorted() == [high, middle]
+    # Not better than the lowest one left
+    assert not mempool.add(pay(sender, make_utxo(sender, seed=4), amount=8))
+
+def test_admission_checks_the_chain_state():
+    node = Node(Blockchain())
+    blockchain = node.blockchain
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    blockchain.utxo_set.add(utxo)
+
+    assert not node.receive_transaction(pay(sender, make_utxo(sender, seed=99)))
+    parent = pay(sender, utxo, recipient_address=sender.address)
+    assert node.receive_transaction(parent)
+
+    # Spending an output of a mempool transaction is fine, a made up one is not
+    child_input = UTXO(parent.txid, 0, parent.outputs[0].amount, sender.address)
+    assert node.receive_transaction(pay(sender, child_input))
+    assert not node.receive_transaction(pay(sender, child_input._replace(amount=child_input.amount + 1)))
+    assert len(blockchain.mempool) == 2
+
+def test_connected_block_drops_conflicts_and_descendants():
+    node = Node(Blockchain())
+    blockchain = node.blockchain
+    blockchain.accept_virtual_proof = True
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    blockchain.utxo_set.add(utxo)
+    parent = pay(sender, utxo, recipient_address=sender.address)
+    assert node.receive_transaction(parent)
+    child = pay(sender, UTXO(parent.txid, 0, parent.outputs[0].amount, sender.address))
+    assert node.receive_transaction(child)
+
+    # A competing spend of the same utxo gets mined
+    double_spend = pay(sender, utxo, amount=5)
+    assert node.receive_block(next_block(blockchain, [double_spend], timestamp=1))
+
+    assert len(blockchain.mempool) == 0
+    assert double_spend.txid in {utxo.txid for utxo in blockchain.utxo_set}
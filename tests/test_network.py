@@ -0,0 +1,57 @@
+import random
+
+from src.core import Network, UTXO, UTXOSet, Simulator, LinkModel, Topology
+from src.utils.crypto import expected_hashes
+
+def test_genesis_utxos_are_shared_between_nodes():
+    random.seed(1)
+    network = Network(10, 0, 0, min_node_peers=3)
+    network.add_genesis_utxos([UTXO("%064x" % i, 0, 10, b"o" * 48) for i in range(100)])
+
+    base = network.genesis_utxo_set
+    for node in network.nodes + [network.add_node(sync=False)]:
+        assert node.blockchain.utxo_set.base is base
+        assert len(node.blockchain.utxo_set) == 100
+        assert node.blockchain.utxo_set.balance(b"o" * 48) == 1000
+
+def test_utxo_deltas_stay_bounded_with_automatic_checkpoints():
+    random.seed(2)
+    network = Network(6, 0, 2, min_node_peers=3, min_miner_peers=2,
+                      simulator=Simulator(LinkModel(latency=0.05), seed=2))
+    network.utxo_checkpoint_interval = 10
+    network.add_genesis_utxos([UTXO("%064x" % i, 0, 10, b"o" * 48) for i in range(100)])
+    difficulty = network.nodes[0].blockchain.difficulty
+    network.start_virtual_mining(expected_hashes(difficulty) / 10 / 2)
+    network.run(until=600)
+    for miner in network.miners:
+        miner.stop_mining()
+    network.run()
+
+    height = network.nodes[0].blockchain.get_best_block().height
+    assert height >= 40
+    assert network.utxo_checkpoints >= 3
+    for node in network.nodes:
+        utxo_set = node.blockchain.utxo_set
+        # Only the blocks since the last snapshot, not the whole chain
+        assert utxo_set.delta_size <= 2 * network.utxo_checkpoint_interval
+        replayed = UTXOSet(network.genesis_utxos)
+        for block in node.blockchain.chain[1:]:
+            node.blockchain._apply_delta(node.blockchain.block_store.get_delta(block), replayed)
+        assert sorted(utxo_set) == sorted(replayed)
+
+def test_peers_are_read_from_the_topology():
+    random.seed(3)
+    network = Network(20, 0, 0, min_node_peers=3)
+    topology = network.topology
+    for node_idx, node in enumerate(network.nodes):
+        assert [network.nodes.index(peer) for peer in node.peers] == list(topology.neighbors(node_idx))
+
+    node = network.add_node(connections=4, sync=False)
+    assert topology.node_count == 21
+    assert len(node.peers) == 4
+    for peer in node.peers:
+        assert node in peer.peers
+    # Same graph as building it from scratch with the new links
+    sources = [node_idx for node_idx in range(21) for peer in topology.neighbors(node_idx)]
+    rebuilt = Topology.from_edges(21, sources, topology.indices)
+    assert rebuilt.indptr == topology.indptr and rebuilt.indices == topology.indices
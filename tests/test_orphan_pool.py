@@ -0,0 +1,49 @@
+from src.core import Node, Blockchain
+from src.core.orphan_pool import OrphanPool
+
+from tests.helpers import build_branch
+
+def make_blocks(count):
+    blockchain = Blockchain()
+    return blockchain, build_branch(blockchain, blockchain.get_best_block(), count)
+
+def test_peer_over_its_limit_only_displaces_its_own_orphans():
+    _, blocks = make_blocks(6)
+    pool = OrphanPool(max_size=10, max_per_peer=3)
+    assert pool.add(blocks[0], "honest")
+    for block in blocks[1:]:
+        pool.add(block, "flooder")
+
+    assert pool.hashes() == [blocks[0].hash] + [block.hash for block in blocks[3:]]
+    assert pool.get_stats() == {"size": 4, "peers": 2, "evicted": 2, "expired": 0}
+
+def test_full_pool_evicts_the_oldest_orphan():
+    _, blocks = make_blocks(5)
+    pool = OrphanPool(max_size=3)
+    for peer, block in enumerate(blocks):
+        pool.add(block, peer)
+
+    assert pool.hashes() == [block.hash for block in blocks[2:]]
+    assert pool.evicted == 2
+
+def test_orphans_expire_after_max_age():
+    _, blocks = make_blocks(2)
+    pool = OrphanPool(max_age=10.0)
+    pool.add(blocks[0], now=0.0)
+    pool.add(blocks[1], now=10.0)
+
+    assert pool.hashes() == [blocks[1].hash]
+    assert pool.expired == 1
+
+def test_orphans_connect_once_their_parent_arrives():
+    _, blocks = make_blocks(4)
+    node = Node(Blockchain())
+    node.blockchain.accept_virtual_proof = True
+
+    for block in reversed(blocks[1:]):
+        assert not node.receive_block(block)
+    assert len(node.orphan_blocks) == 3
+
+    assert node.receive_block(blocks[0])
+    assert node.blockchain.last_block_hash == blocks[-1].hash
+    assert len(node.orphan_blocks) == 0
@@ -0,0 +1,105 @@
+from src.core import Node, Blockchain, Simulator, LinkModel
+from src.core.relay import RELAY_INV, RELAY_COMPACT, REQUEST_TIMEOUT
+from src.wallet import Wallet
+
+from tests.helpers import next_block, make_utxo, pay
+
+def make_nodes(count, relay_mode, utxos=(), simulator=None):
+    nodes = []
+    for _ in range(count):
+        node = Node(Blockchain(), relay_mode)
+        node.blockchain.accept_virtual_proof = True
+        node.simulator = simulator
+        for utxo in utxos:
+            node.blockchain.utxo_set.add(utxo)
+        nodes.append(node)
+    return nodes
+
+def connect(node_a, node_b):
+    node_a.peers.add(node_b)
+    node_b.peers.add(node_a)
+
+def test_inv_getdata_relays_transactions_and_blocks():
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    node_a, node_b = make_nodes(2, RELAY_INV, [utxo])
+    connect(node_a, node_b)
+
+    tx = pay(sender, utxo)
+    assert node_a.receive_transaction(tx)
+    assert tx in node_b.blockchain.mempool
+
+    block = next_block(node_a.blockchain, [tx], timestamp=1)
+    assert node_a.receive_block(block)
+    assert node_b.blockchain.last_block_hash == block.hash
+    assert node_b.bytes_sent["getdata"] and node_a.bytes_sent["block"]
+    assert not node_b.requested
+
+def test_compact_block_is_rebuilt_from_the_mempool():
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    node_a, node_b = make_nodes(2, RELAY_COMPACT, [utxo])
+    connect(node_a, node_b)
+
+    tx = pay(sender, utxo)
+    assert node_a.receive_transaction(tx)
+    block = next_block(node_a.blockchain, [tx], timestamp=1)
+    assert node_a.receive_block(block)
+
+    assert node_b.blockchain.last_block_hash == block.hash
+    assert "getblocktxn" not in node_b.bytes_sent
+    assert "block" not in node_a.bytes_sent
+
+def test_compact_block_fetches_missing_transactions():
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    node_a, node_b = make_nodes(2, RELAY_COMPACT, [utxo])
+    connect(node_a, node_b)
+
+    # Only node_a knows the transaction
+    tx = pay(sender, utxo)
+    assert node_a.blockchain.add_transaction(tx)
+    block = next_block(node_a.blockchain, [tx], timestamp=1)
+    assert node_a.receive_block(block)
+
+    assert node_b.blockchain.last_block_hash == block.hash
+    assert node_b.bytes_sent["getblocktxn"] and node_a.bytes_sent["blocktxn"]
+    assert tx.txid in node_b.seen_transactions
+    assert not node_b.partial_blocks
+
+def test_unanswered_getdata_is_retried_with_another_peer():
+    simulator = Simulator(LinkModel(latency=0.05))
+    node_a, node_b, silent = make_nodes(3, RELAY_INV, simulator=simulator)
+    connect(node_b, silent)
+    connect(node_b, node_a)
+    silent._on_getdata = lambda sender, payload: None
+
+    block = next_block(node_a.blockchain, timestamp=1)
+    assert silent.receive_block(block)
+    assert node_a.receive_block(block)
+    simulator.run()
+
+    assert node_b.blockchain.last_block_hash == block.hash
+    assert simulator.now >= REQUEST_TIMEOUT
+    assert not node_b.requested and not node_b.announcers
+
+def test_unanswered_getblocktxn_falls_back_to_another_peer():
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    simulator = Simulator(LinkModel(latency=0.05))
+    node_a, node_b, silent = make_nodes(3, RELAY_COMPACT, [utxo], simulator)
+    connect(node_b, silent)
+    connect(node_b, node_a)
+    silent._on_getblocktxn = lambda sender, payload: None
+
+    tx = pay(sender, utxo)
+    assert silent.blockchain.add_transaction(tx)
+    assert node_a.blockchain.add_transaction(tx)
+    block = next_block(node_a.blockchain, [tx], timestamp=1)
+    assert silent.receive_block(block)
+    assert node_a.receive_block(block)
+    simulator.run()
+
+    assert node_b.blockchain.last_block_hash == block.hash
+    assert node_b.bytes_received["block"]
+    assert not node_b.partial_blocks and not node_b.requested
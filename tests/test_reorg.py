@@ -0,0 +1,77 @@
+from src.core import Node, Blockchain
+from src.wallet import Wallet
+
+from tests.helpers import next_block, build_branch, make_utxo, pay
+
+def make_node():
+    node = Node(Blockchain())
+    node.blockchain.accept_virtual_proof = True
+    return node
+
+def test_reorg_returns_disconnected_transactions_to_mempool():
+    node = make_node()
+    blockchain = node.blockchain
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    blockchain.utxo_set.add(utxo)
+    tx = pay(sender, utxo)
+    assert node.receive_transaction(tx)
+
+    genesis = blockchain.get_best_block()
+    mined = next_block(blockchain, [tx], timestamp=1)
+    assert node.receive_block(mined)
+    assert tx not in blockchain.mempool
+    assert utxo not in blockchain.utxo_set
+
+    competing = build_branch(blockchain, genesis, 2, first_timestamp=10)
+    assert not node.receive_block(competing[0]) # Equal work, no switch
+    assert node.receive_block(competing[1])
+
+    assert blockchain.chain == [genesis] + competing
+    assert tx in blockchain.mempool
+    assert utxo in blockchain.utxo_set
+    assert mined.transactions[0].txid not in {utxo.txid for utxo in blockchain.utxo_set}
+
+def test_reorg_evicts_transactions_spending_disconnected_outputs():
+    node = make_node()
+    blockchain = node.blockchain
+    miner = Wallet()
+    genesis = blockchain.get_best_block()
+    mined = next_block(blockchain, timestamp=1, recipient_address=miner.address)
+    assert node.receive_block(mined)
+    coinbase = mined.transactions[0]
+    reward = make_utxo(miner, coinbase.outputs[0].amount)._replace(txid=coinbase.txid)
+    assert node.receive_transaction(pay(miner, reward))
+
+    for block in build_branch(blockchain, genesis, 2, first_timestamp=10):
+        node.receive_block(block)
+
+    # The coinbase it spent is gone, so is the transaction
+    assert len(blockchain.mempool) == 0
+
+def test_invalid_branch_rolls_back_to_the_old_chain():
+    node = make_node()
+    blockchain = node.blockchain
+    sender = Wallet()
+    utxo = make_utxo(sender)
+    blockchain.utxo_set.add(utxo)
+    tx = pay(sender, utxo)
+    assert node.receive_transaction(tx)
+
+    genesis = blockchain.get_best_block()
+    old_chain = build_branch(blockchain, genesis, 2, first_timestamp=1)
+    for block in old_chain:
+        assert node.receive_block(block)
+    utxos_before = sorted(blockchain.utxo_set)
+
+    # Valid header, reward and signature, but its transaction spends an output that does not exist
+    branch = build_branch(blockchain, genesis, 2, first_timestamp=10)
+    bogus = pay(sender, make_utxo(sender, seed=99))
+    branch.append(next_block(blockchain, [bogus], prev_block=branch[-1], timestamp=12))
+    for block in branch:
+        assert not node.receive_block(block)
+
+    assert blockchain.chain == [genesis] + old_chain
+    assert sorted(blockchain.utxo_set) == utxos_before
+    assert tx in blockchain.mempool
+    assert branch[-1].hash in blockchain.block_index.invalid
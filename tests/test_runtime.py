@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from src.core import AsyncRuntime
+
+def test_handler_error_does_not_stop_actor():
+    handled = []
+
+    def handler(item):
+        if item == "bad":
+            raise ValueError(item)
+        handled.append(item)
+
+    async def run():
+        runtime = AsyncRuntime()
+        for item in ("a", "bad", "b", "c"):
+            runtime.send(None, "actor", handler, item)
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(runtime.drain(), timeout=5)
+        assert handled == ["a", "b", "c"]
+        assert runtime.errors == 1
+
+        # Reported once, the actor keeps serving later messages
+        runtime.send(None, "actor", handler, "d")
+        await asyncio.wait_for(runtime.drain(), timeout=5)
+        assert handled[-1] == "d"
+        await runtime.stop()
+
+    asyncio.run(run())
+
+def test_stop_raises_unreported_handler_error():
+    def handler(item):
+        raise RuntimeError(item)
+
+    async def run():
+        runtime = AsyncRuntime()
+        runtime.send(None, "actor", handler, "boom")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError):
+            await runtime.stop()
+
+    asyncio.run(run())
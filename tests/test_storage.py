@@ -0,0 +1,75 @@
+import os
+
+from src.core import Blockchain, Node
+from src.core.storage import BlockFileStore, INDEX_FILE
+
+from tests.helpers import build_branch, next_block
+
+def append_blocks(blockchain, count, first_timestamp=0):
+    for timestamp in range(first_timestamp, first_timestamp + count):
+        assert blockchain.append_block(next_block(blockchain, timestamp=timestamp))
+
+def utxos(blockchain):
+    return sorted((utxo.txid, utxo.index, utxo.amount) for utxo in blockchain.utxo_set)
+
+def test_reopen_restores_chain_and_reads_transactions_lazily(tmp_path):
+    blockchain = Blockchain.open(str(tmp_path))
+    append_blocks(blockchain, 5)
+    chain = [block.hash for block in blockchain.chain]
+    coinbase_txid = blockchain.chain[3].transactions[0].txid
+    blockchain.close()
+
+    reopened = Blockchain.open(str(tmp_path))
+    assert [block.hash for block in reopened.chain] == chain
+    assert not reopened.chain[3].is_loaded
+    assert reopened.chain[3].transactions[0].txid == coinbase_txid
+    reopened.close()
+
+def test_reopen_replays_blocks_after_the_snapshot(tmp_path):
+    blockchain = Blockchain.open(str(tmp_path))
+    append_blocks(blockchain, 3)
+    blockchain.checkpoint()
+    append_blocks(blockchain, 2, first_timestamp=3)
+    expected = utxos(blockchain)
+    # Close the files without writing a newer snapshot
+    blockchain.storage.close()
+
+    reopened = Blockchain.open(str(tmp_path))
+    assert len(reopened.chain) == 6
+    assert utxos(reopened) == expected
+    reopened.close()
+
+def test_reopen_picks_the_best_stored_branch(tmp_path):
+    blockchain = Blockchain.open(str(tmp_path))
+    blockchain.accept_virtual_proof = True
+    node = Node(blockchain)
+    append_blocks(blockchain, 2)
+    # The stale blocks stay in the file after the reorg
+    for block in build_branch(blockchain, blockchain.chain[0], 3, first_timestamp=100):
+        node.receive_block(block)
+    assert len(blockchain.chain) == 4
+    tip_hash = blockchain.last_block_hash
+    blockchain.close()
+
+    reopened = Blockchain.open(str(tmp_path))
+    assert reopened.last_block_hash == tip_hash
+    assert len(reopened.block_index) == 6
+    reopened.close()
+
+def test_partial_index_record_is_dropped(tmp_path):
+    blockchain = Blockchain.open(str(tmp_path))
+    append_blocks(blockchain, 2)
+    blockchain.close()
+    with open(os.path.join(str(tmp_path), INDEX_FILE), "ab") as f:
+        f.write(b"\x00" * 7)
+
+    store = BlockFileStore(str(tmp_path))
+    assert len(store) == 2
+    block = next_block(Blockchain(), timestamp=50)
+    store.append(block)
+    store.close()
+
+    store = BlockFileStore(str(tmp_path))
+    assert [header.hash for header in store.load_headers()][-1] == block.hash
+    assert store.load_transactions(block)[0].txid == block.transactions[0].txid
+    store.close()
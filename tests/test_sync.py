@@ -0,0 +1,46 @@
+import random
+
+from src.core import Network, Node, Blockchain, Simulator, LinkModel
+from src.utils.crypto import expected_hashes
+
+from tests.helpers import next_block
+
+def test_late_joining_node_catches_up_header_first():
+    random.seed(4)
+    network = Network(5, 0, 2, min_node_peers=3, min_miner_peers=2,
+                      simulator=Simulator(LinkModel(latency=0.05), seed=4))
+    difficulty = network.nodes[0].blockchain.difficulty
+    network.start_virtual_mining(expected_hashes(difficulty) / 10 / 2)
+    network.run(until=300)
+    for miner in network.miners:
+        miner.stop_mining()
+    network.run()
+    best_hash = network.nodes[0].blockchain.last_block_hash
+    height = network.nodes[0].blockchain.get_best_block().height
+    assert height >= 10
+
+    node = network.add_node(connections=2)
+    network.run()
+
+    assert node.sync.finished
+    assert node.blockchain.last_block_hash == best_hash
+    assert node.sync.get_stats()["blocks_downloaded"] == height
+
+def test_orphans_do_not_restart_a_finished_sync():
+    node, peer = Node(Blockchain()), Node(Blockchain())
+    for member in (node, peer):
+        member.blockchain.accept_virtual_proof = True
+    node.peers.add(peer)
+    peer.peers.add(node)
+
+    # Children of a block neither node has
+    unknown_parent = next_block(peer.blockchain, timestamp=1)
+    orphans = [next_block(peer.blockchain, prev_block=unknown_parent, timestamp=timestamp) for timestamp in range(2, 7)]
+    node.receive_block(orphans[0], peer)
+    first_sync = node.sync
+    assert first_sync.finished
+    for orphan in orphans[1:]:
+        node.receive_block(orphan, peer)
+
+    assert len(node.orphan_blocks) == 5
+    assert node.sync is first_sync
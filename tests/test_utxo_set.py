@@ -0,0 +1,15 @@
+from src.core import UTXO, UTXOSet
+
+OWNER = b"o" * 48
+
+def test_membership_accepts_utxo_dicts():
+    utxo_set = UTXOSet([{"txid": "a" * 64, "index": 0, "amount": 5, "owner_address": OWNER}])
+
+    assert UTXO("a" * 64, 0, 5, OWNER) in utxo_set
+    assert {"txid": "a" * 64, "index": 0, "amount": 5, "owner_address": OWNER} in utxo_set
+    assert {"txid": "a" * 64, "index": 0, "amount": 6, "owner_address": OWNER} not in utxo_set
+    assert {"txid": "b" * 64, "index": 0, "amount": 5, "owner_address": OWNER} not in utxo_set
+
+    utxo_set.remove({"txid": "a" * 64, "index": 0, "amount": 5, "owner_address": OWNER})
+    assert len(utxo_set) == 0
+    assert utxo_set.balance(OWNER) == 0
@@ -0,0 +1,36 @@
+from src.core import Node, Blockchain, Block, BlockValidator, Transaction
+from src.wallet import Wallet
+
+from tests.helpers import make_utxo, pay
+
+def test_amount_checks_run_before_the_context_and_signature_stages():
+    validator = BlockValidator()
+    validator.verify_signatures = None # Not reached
+    sender = Wallet()
+    utxo = make_utxo(sender, amount=10)
+    no_fee = pay(sender, utxo, amount=10)
+    zero_output = pay(sender, utxo, amount=0)
+    negative_output = pay(sender, utxo, amount=-5)
+
+    for tx in (no_fee, zero_output, negative_output):
+        assert not validator.check_transactions([tx], utxo_set=None)
+
+def test_mempool_admission_checks_amounts():
+    blockchain = Blockchain()
+    sender = Wallet()
+    utxo = make_utxo(sender, amount=10)
+    blockchain.utxo_set.add(utxo)
+
+    assert not blockchain.add_transaction(pay(sender, utxo, amount=10 - Transaction.fee + 1))
+    assert not blockchain.add_transaction(pay(sender, utxo, amount=0))
+    assert blockchain.add_transaction(pay(sender, utxo))
+
+def test_block_without_transactions_is_rejected():
+    node = Node(Blockchain())
+    node.blockchain.accept_virtual_proof = True
+    genesis = node.blockchain.get_best_block()
+    block = Block([], genesis.hash, node.blockchain.difficulty, 1, 0)
+    block.virtual_proof = True
+
+    assert not node.receive_block(block)
+    assert node.blockchain.last_block_hash == genesis.hash